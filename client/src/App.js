@@ -1,7 +1,7 @@
 import axios from 'axios';
 import React, { useEffect, useRef } from 'react';
 import { useDispatch, useSelector } from 'react-redux';
-import { API_URL } from '.';
+import { SSE_URL } from '.';
 import { getUser, refreshMeeting, refreshToken } from './actions/user.action';
 import Routes from './components/routes/Routes';
 import { isEmpty, tokenIsEmpty, tokenIsValid } from './utils/utils';
@@ -48,7 +48,7 @@ const App = () => {
     const handleSSE = (displayNotification) => {
       if (isEmpty(SSE.current) && !isEmpty(userStates.token)) {
         SSE.current = new EventSource(
-          `${API_URL}/api/v1/users/stream?token=${localStorage.getItem(
+          `${SSE_URL}/api/v1/users/stream?token=${localStorage.getItem(
             'token'
           )}`
         );
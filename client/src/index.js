@@ -25,6 +25,10 @@ export const API_URL =
     ? `https://${window.location.hostname}:5000`
     : `http://${window.location.hostname}:5000`;
 
+// The SSE stream goes through nginx in production, which sends it to the asyncio server
+export const SSE_URL =
+  process.env.NODE_ENV === 'production' ? window.location.origin : API_URL;
+
 // Telling axios what is the baseURL to use for the requests
 axios.defaults.baseURL = API_URL;
 
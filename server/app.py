@@ -9,7 +9,9 @@ from dotenv import load_dotenv
 
 from src.chat import create_app, db, sio, redis
 from src.chat.model import user, token_blacklist, project, message, push_subscription
-from src.chat.service.user_service import transfer_subscription_to_redis
+from src.chat.service.blacklist_service import transfer_blacklist_to_redis
+from src.chat.service.user_service import backfill_endpoint_hash, transfer_subscription_to_redis
+from src.chat.util.stream import remove_legacy_keys
 
 load_dotenv()  # take environment variables from .env.
 
@@ -107,10 +109,6 @@ def seed(n):
 
 @app.before_first_request
 def first_run():
-    # Remove all key before run
-    keys = redis.keys()
-    if keys:
-        redis.delete(*keys)
     # Admin default
     if not user.User.query.filter_by(username='admin').first():
         admin = user.User(
@@ -124,7 +122,11 @@ def first_run():
         db.session.add(admin)
         db.session.commit()
 
+    # The keys of the previous versions would break the transfer, the publications and the presence scripts
+    remove_legacy_keys()
+    backfill_endpoint_hash()
     transfer_subscription_to_redis()
+    transfer_blacklist_to_redis()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,72 @@
+"""
+Benchmark the webpush delivery against the local mock push server.
+
+Usage (from the folder server): `python -m benchmark.bench_push --n 200 --delay 0.01`
+"""
+
+import argparse
+import json
+import time
+
+from flask import Flask
+from pywebpush import webpush
+
+from src.chat.config import TestingConfig
+from src.chat.util.push import PushDispatcher
+from test.push_server import MockPushServer, generate_vapid_private_key
+
+
+def bench_synchronous(server: MockPushServer, subscriptions, payload: str, vapid_private_key: str) -> float:
+    """The older path: one webpush() on the caller's thread with a new connection for each notification."""
+    start = time.perf_counter()
+    for subscription in subscriptions:
+        webpush(subscription_info=subscription, data=payload, vapid_private_key=vapid_private_key,
+                vapid_claims=dict(TestingConfig.VAPID_CLAIMS))
+    return time.perf_counter() - start
+
+
+def bench_dispatcher(server: MockPushServer, subscriptions, payload: str, vapid_private_key: str,
+                     workers: int) -> float:
+    """The push path: the notifications are queued and sent by the workers."""
+    app = Flask(__name__)
+    app.config.from_object(TestingConfig)
+    app.config.update(VAPID_PRIVATE_KEY=vapid_private_key, PUSH_WORKERS=workers)
+    dispatcher = PushDispatcher(app)
+    dispatcher.start()
+
+    start = time.perf_counter()
+    for subscription in subscriptions:
+        dispatcher.submit(subscription, payload)
+    dispatcher.join()
+    elapsed = time.perf_counter() - start
+
+    dispatcher.stop()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n', type=int, default=200, help='The number of notifications.')
+    parser.add_argument('--delay', type=float, default=0.01, help="The push service's latency in seconds.")
+    parser.add_argument('--workers', type=int, default=TestingConfig.PUSH_WORKERS)
+    args = parser.parse_args()
+
+    vapid_private_key = generate_vapid_private_key()
+    payload = json.dumps(dict(type='action_message', data=dict(type='new_message', message='Hello')))
+
+    with MockPushServer(delay=args.delay) as server:
+        subscriptions = [server.subscription(f'device-{i}') for i in range(args.n)]
+
+        elapsed = bench_synchronous(server, subscriptions, payload, vapid_private_key)
+        connections = len(server.connections)
+        print(f'synchronous webpush : {args.n / elapsed:8.1f} notifications/s, {connections} connections')
+
+        server.connections.clear()
+        elapsed = bench_dispatcher(server, subscriptions, payload, vapid_private_key, args.workers)
+        connections = len(server.connections)
+        print(f'push dispatcher ({args.workers}) : {args.n / elapsed:8.1f} notifications/s, '
+              f'{connections} connections')
+
+
+if __name__ == '__main__':
+    main()
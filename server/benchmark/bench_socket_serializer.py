@@ -0,0 +1,97 @@
+"""
+Benchmark the serializers of the namespace /ws/messages: the CPU to encode and decode one `receive_message` and its
+size, in the packet sent to a client (JSON or MessagePack) and in the message queue between the workers (pickle or
+MessagePack).
+
+Usage (from the folder server): `python -m benchmark.bench_socket_serializer --n 20000`
+"""
+
+import argparse
+import base64
+import os
+import pickle
+import time
+import uuid
+from types import SimpleNamespace
+
+from flask_restx import marshal
+from socketio import packet
+
+from src.chat.dto.message_dto import message_item
+
+NAMESPACE = '/ws/messages'
+
+
+def user(user_id: int, ava: str = None):
+    return SimpleNamespace(id=user_id, email=f'user{user_id}@test.com', username=f'user{user_id}', first_name='First',
+                           last_name='Last', ava=ava, admin=False, archived=False)
+
+
+def payloads():
+    """Typical messages: a short text, a long private text and a file."""
+    sender = user(1)
+    file_base64 = 'data:application/pdf;base64,' + base64.b64encode(os.urandom(20 * 1024)).decode('ascii')
+    messages = dict(
+        short=SimpleNamespace(id=1234, content='Hello, the meeting starts at 10am.', file_name=None,
+                              file_base64=None, sender=sender, receiver=None, created_at='2021-09-01 10:00:00.000000'),
+        long=SimpleNamespace(id=1235, content='Lorem ipsum dolor sit amet. ' * 40, file_name=None, file_base64=None,
+                             sender=sender, receiver=user(2), created_at='2021-09-01 10:00:00.000000'),
+        file=SimpleNamespace(id=1236, content=None, file_name='report.pdf', file_base64=file_base64, sender=sender,
+                             receiver=None, created_at='2021-09-01 10:00:00.000000'),
+    )
+    return {name: marshal(message, message_item, skip_none=True) for name, message in messages.items()}
+
+
+def queue_message(data):
+    """The message published by the manager of Socket.IO for `emit` in a room."""
+    return dict(method='emit', event='receive_message', data=data, namespace=NAMESPACE, room='room:project:1',
+                skip_sid=uuid.uuid4().hex, callback=None, host_id=uuid.uuid4().hex)
+
+
+def measure(n: int, function) -> float:
+    """CPU time of one call in microseconds."""
+    start = time.process_time()
+    for _ in range(n):
+        function()
+    return (time.process_time() - start) / n * 1e6
+
+
+def client_packets(data, packet_class):
+    encoded = packet_class(packet.EVENT, data=['receive_message', data], namespace=NAMESPACE).encode()
+    return (lambda: packet_class(packet.EVENT, data=['receive_message', data], namespace=NAMESPACE).encode(),
+            lambda: packet_class(encoded_packet=encoded),
+            len(encoded.encode('utf-8') if isinstance(encoded, str) else encoded))
+
+
+def queue_messages(message, dumps, loads):
+    encoded = dumps(message)
+    return lambda: dumps(message), lambda: loads(encoded), len(encoded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n', type=int, default=20000, help='The number of encodings of each payload.')
+    args = parser.parse_args()
+
+    serializers = [('client', 'json', lambda data: client_packets(data, packet.Packet)),
+                   ('queue', 'pickle', lambda data: queue_messages(queue_message(data), pickle.dumps, pickle.loads))]
+    try:
+        from socketio.msgpack_packet import MsgPackPacket
+        from src.chat.util.msgpack_queue import encode, decode
+        serializers.insert(1, ('client', 'msgpack', lambda data: client_packets(data, MsgPackPacket)))
+        serializers.append(('queue', 'msgpack', lambda data: queue_messages(queue_message(data), encode, decode)))
+    except ImportError:
+        print('msgpack is not installed, only the default serializers are measured.')
+
+    print(f"{'payload':8} {'path':7} {'format':8} {'encode':>10} {'decode':>10} {'bytes':>8}")
+    for name, data in payloads().items():
+        # The file is 20 times bigger, fewer iterations
+        n = args.n if name != 'file' else max(args.n // 20, 1)
+        for path, serializer_name, serializer in serializers:
+            encode_function, decode_function, size = serializer(data)
+            print(f'{name:8} {path:7} {serializer_name:8} {measure(n, encode_function):7.1f} us '
+                  f'{measure(n, decode_function):7.1f} us {size:8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+Benchmark the namespace /ws/messages scaled over many worker processes sharing one Redis (the message queue of
+Socket.IO and the presence of the rooms).
+
+K workers are started on localhost, the simulated clients are spread over the workers round robin and all join the
+same project. Half the clients observe, the other half act:
+- online: the actors join the project, each observer receives one 'online' per actor;
+- receive_message: each actor sends messages, all the other clients receive each message;
+- offline: the actors leave the project, each observer receives one 'offline' per actor.
+The latency from the emit to each reception is reported for the clients on the same worker as the sender and for the
+clients on another worker (the broadcast goes through Redis), with the deliveries per second of each phase.
+
+The clients use the websocket transport of the browsers if the package websocket-client is installed, else they
+poll: the polling transport drops some clients under load, their calls without ack are counted as errors.
+
+Usage (from the folder server): `python -m benchmark.bench_socket_workers --workers 4 --clients 40 --messages 10`
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import socketio
+
+from src.chat.config import TestingConfig
+from src.chat.service.message_service import get_room_for_project
+from src.chat.service.ws_service import PRESENCE_PREFIX
+from benchmark.bench_sse_asgi import wait_port
+
+NAMESPACE = '/ws/messages'
+
+
+def serve(port: int, database: str) -> None:
+    """Run one worker in this process."""
+    from src.chat import create_app, sio
+    app = create_app('test')
+    app.config.update(SQLALCHEMY_DATABASE_URI=database, DEBUG=False)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    sio.run(app, host='127.0.0.1', port=port, debug=False, use_reloader=False, log_output=False)
+
+
+def seed(database: str, n: int):
+    """Create the users and their project, return the project's id and the tokens of the users."""
+    from src.chat import create_app, db, redis
+    from src.chat.model.project import Project
+    from src.chat.model.user import User
+    from src.chat.service.auth_service import encode_auth_token
+    app = create_app('test')
+    # The tokens of the testing config expire after 5 seconds
+    app.config.update(SQLALCHEMY_DATABASE_URI=database, TESTING=False, TOKEN_EXPIRE_HOURS=1, TOKEN_EXPIRE_MINUTES=0)
+    with app.app_context():
+        db.create_all()
+        users = [User(email=f'bench{i}@test.com', password='bench', username=f'bench{i}', first_name='bench',
+                      last_name='bench') for i in range(n)]
+        db.session.add_all(users)
+        db.session.commit()
+        project = Project(title='bench', owner_id=users[0].id)
+        for user in users[1:]:
+            project.participants.append(user)
+        db.session.add(project)
+        db.session.commit()
+        # The presence left by a previous run
+        redis.delete(PRESENCE_PREFIX + get_room_for_project(project.id))
+        return project.id, [(user.id, encode_auth_token(user.id)[0]) for user in users]
+
+
+class Recorder(object):
+    """The time of each emit and the latencies of the receptions, in seconds."""
+
+    def __init__(self):
+        self.sent: Dict[str, float] = dict()
+        self.latencies: Dict[str, Dict[bool, List[float]]] = defaultdict(lambda: defaultdict(list))
+        self.first: Dict[str, float] = dict()
+        self.last: Dict[str, float] = dict()
+        # The calls without ack
+        self.errors: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def send(self, event: str, key: str) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            self.sent[f'{event}:{key}'] = now
+            self.first.setdefault(event, now)
+
+    def receive(self, event: str, key: str, cross: bool) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            sent = self.sent.get(f'{event}:{key}')
+            if sent is None:
+                return
+            self.latencies[event][cross].append(now - sent)
+            self.last[event] = now
+
+    def error(self, event: str) -> None:
+        with self._lock:
+            self.errors[event] += 1
+
+    def count(self, event: str) -> int:
+        with self._lock:
+            return sum(len(latencies) for latencies in self.latencies[event].values())
+
+
+class Client(object):
+    """One simulated user connected to one worker."""
+
+    def __init__(self, recorder: Recorder, user_id: int, token: str, worker: int, workers: Dict[int, int],
+                 observer: bool):
+        """
+        :param workers: The worker of each user's id.
+        :param observer: True if the client records the events 'online' and 'offline'.
+        """
+        self.recorder = recorder
+        self.user_id = user_id
+        self.token = token
+        self.worker = worker
+        self.sio = socketio.Client(reconnection=False)
+        if observer:
+            for event in ('online', 'offline'):
+                self.sio.on(event, self._record(recorder, event, lambda data: data['user_id'], workers),
+                            namespace=NAMESPACE)
+        self.sio.on('receive_message', self._record(recorder, 'receive_message', lambda data: data['sender']['id'],
+                                                    workers, lambda data: data['content']), namespace=NAMESPACE)
+
+    def _record(self, recorder: Recorder, event: str, sender, workers: Dict[int, int], key=None):
+        def handler(data):
+            recorder.receive(event, key(data) if key else str(sender(data)), workers[sender(data)] != self.worker)
+        return handler
+
+    def connect(self, port: int) -> None:
+        self.sio.connect(f'http://127.0.0.1:{port}', headers=dict(Authorization='Bearer ' + self.token),
+                         namespaces=[NAMESPACE], wait_timeout=10)
+
+    def call(self, event: str, data=None, phase: str = None):
+        """Emit the event and wait its ack, a failure is counted in the phase."""
+        try:
+            return self.sio.call(event, data, namespace=NAMESPACE, timeout=30)
+        except socketio.exceptions.SocketIOError:
+            self.recorder.error(phase or event)
+
+
+def wait_deliveries(recorder: Recorder, event: str, expected: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while recorder.count(event) < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def report(recorder: Recorder, event: str, expected: int) -> None:
+    latencies = recorder.latencies[event]
+    received = recorder.count(event)
+    duration = recorder.last.get(event, 0) - recorder.first.get(event, 0)
+    rate = received / duration if duration > 0 else 0
+    print(f'{event:16}: {received:6}/{expected} delivered, {rate:9.1f} msgs/s, {recorder.errors[event]} errors')
+    for cross, name in ((False, 'same worker'), (True, 'cross worker')):
+        values = sorted(latencies[cross])
+        if not values:
+            continue
+        print(f'  {name:13}: {len(values):6} msgs, p50 {statistics.median(values) * 1000:7.1f} ms, '
+              f'p95 {values[int(len(values) * 0.95) - 1] * 1000:7.1f} ms, '
+              f'p99 {values[int(len(values) * 0.99) - 1] * 1000:7.1f} ms, max {values[-1] * 1000:7.1f} ms')
+
+
+def run(args, project_id: int, users: List) -> None:
+    recorder = Recorder()
+    workers = {user_id: i % args.workers for i, (user_id, _) in enumerate(users)}
+    clients = [Client(recorder, user_id, token, workers[user_id], workers, i < len(users) // 2)
+               for i, (user_id, token) in enumerate(users)]
+    observers, actors = clients[:len(clients) // 2], clients[len(clients) // 2:]
+    room = dict(project_id=project_id)
+
+    with ThreadPoolExecutor(max_workers=min(len(clients), 64)) as executor:
+        list(executor.map(lambda client: client.connect(args.port + client.worker), clients))
+        print(f'Clients: {len(clients)} on {args.workers} workers, transport {clients[0].sio.transport()}')
+        list(executor.map(lambda client: client.call('join_project', room), observers))
+
+        def join(client: Client) -> None:
+            recorder.send('online', str(client.user_id))
+            client.call('join_project', room, 'online')
+
+        list(executor.map(join, actors))
+        wait_deliveries(recorder, 'online', len(actors) * len(observers), args.timeout)
+
+        def send(client: Client) -> None:
+            for i in range(args.messages):
+                content = f'{client.user_id}-{i}'
+                recorder.send('receive_message', content)
+                client.call('send_message', dict(project_id=project_id, content=content), 'receive_message')
+
+        list(executor.map(send, actors))
+        expected_messages = len(actors) * args.messages * (len(clients) - 1)
+        wait_deliveries(recorder, 'receive_message', expected_messages, args.timeout)
+
+        def leave(client: Client) -> None:
+            recorder.send('offline', str(client.user_id))
+            client.call('leave_project', phase='offline')
+
+        list(executor.map(leave, actors))
+        wait_deliveries(recorder, 'offline', len(actors) * len(observers), args.timeout)
+
+        list(executor.map(lambda client: client.sio.disconnect(), clients))
+
+    report(recorder, 'online', len(actors) * len(observers))
+    report(recorder, 'receive_message', expected_messages)
+    report(recorder, 'offline', len(actors) * len(observers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='The number of worker processes.')
+    parser.add_argument('--clients', type=int, default=40, help='The number of simulated clients.')
+    parser.add_argument('--messages', type=int, default=10, help='The messages sent by each actor.')
+    parser.add_argument('--port', type=int, default=5200, help='The port of the first worker.')
+    parser.add_argument('--timeout', type=float, default=30, help='The time to wait the deliveries of a phase.')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.database)
+        return
+
+    # The clients without the package websocket-client use the polling transport, it is printed once
+    logging.getLogger('engineio.client').setLevel(logging.CRITICAL)
+    print(f'Redis: {TestingConfig.REDIS_URL}')
+    with tempfile.TemporaryDirectory() as folder:
+        database = 'sqlite:///' + os.path.join(folder, 'bench.db')
+        project_id, users = seed(database, args.clients)
+        servers = [subprocess.Popen([sys.executable, '-m', 'benchmark.bench_socket_workers', '--serve',
+                                     '--port', str(args.port + i), '--database', database],
+                                    stdout=subprocess.DEVNULL,
+                                    # The actors send their messages faster than the rate limit
+                                    env=dict(os.environ, SOCKET_RATE_LIMIT='false'))
+                   for i in range(args.workers)]
+        try:
+            for i in range(args.workers):
+                wait_port(args.port + i)
+            run(args, project_id, users)
+        finally:
+            for server in servers:
+                server.terminate()
+            for server in servers:
+                server.wait()
+
+
+if __name__ == '__main__':
+    main()
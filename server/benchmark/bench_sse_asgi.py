@@ -0,0 +1,128 @@
+"""
+Benchmark the memory of one idle SSE stream: the Flask endpoint (one thread per stream) against the asyncio server.
+
+Each server is started in a subprocess, the streams are opened with raw sockets and the growth of the server's
+resident memory is divided by the number of streams (Linux only).
+
+Usage (from the folder server): `python -m benchmark.bench_sse_asgi --n 1000`
+"""
+
+import argparse
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+from src.chat.config import TestingConfig
+
+SERVERS = ('flask', 'asyncio')
+
+
+def serve(kind: str, port: int) -> None:
+    """Run the server in this process."""
+    from src.chat import create_app, db
+    app = create_app('test')
+    with app.app_context():
+        db.create_all()
+
+    if kind == 'flask':
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+    else:
+        import uvicorn
+        from src.chat.util.async_stream import SSEApplication
+        uvicorn.run(SSEApplication(app), host='127.0.0.1', port=port, log_level='warning', backlog=4096)
+
+
+def rss(pid: int) -> int:
+    """The resident memory of the process in bytes."""
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def threads(pid: int) -> int:
+    return len(os.listdir(f'/proc/{pid}/task'))
+
+
+def token() -> str:
+    from src.chat import create_app
+    from src.chat.service.auth_service import encode_auth_token
+    app = create_app('test')
+    # The tokens of the testing config expire after 5 seconds
+    app.config.update(TESTING=False, TOKEN_EXPIRE_HOURS=1, TOKEN_EXPIRE_MINUTES=0)
+    with app.app_context():
+        return encode_auth_token(1)[0]
+
+
+def open_stream(port: int, auth_token: str) -> socket.socket:
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.sendall(f'GET /api/v1/users/stream?token={auth_token} HTTP/1.1\r\nHost: localhost\r\n'
+                 f'Accept: text/event-stream\r\n\r\n'.encode('utf-8'))
+    response = sock.recv(4096)
+    if b' 200 ' not in response.split(b'\r\n', 1)[0]:
+        raise RuntimeError(response.decode('utf-8', 'replace'))
+    return sock
+
+
+def wait_port(port: int, timeout: float = 20) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'The server did not start on the port {port}.')
+
+
+def measure(kind: str, port: int, n: int, auth_token: str) -> None:
+    server = subprocess.Popen([sys.executable, '-m', 'benchmark.bench_sse_asgi', '--serve', kind, '--port', str(port)])
+    try:
+        wait_port(port)
+        # One stream first, so the memory of the first request is not counted
+        streams = [open_stream(port, auth_token)]
+        time.sleep(0.5)
+        memory_before = rss(server.pid)
+        streams += [open_stream(port, auth_token) for _ in range(n)]
+        time.sleep(1)
+        memory_after = rss(server.pid)
+        print(f'{kind:8}: {n} streams, {threads(server.pid):5} threads, '
+              f'{(memory_after - memory_before) / 1024:9.1f} KiB, '
+              f'{(memory_after - memory_before) / n / 1024:6.1f} KiB/stream')
+        for stream in streams:
+            stream.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n', type=int, default=1000, help='The number of streams.')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--serve', choices=SERVERS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    # The client and the server open one file per stream
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, args.n * 2 + 100)), hard))
+
+    print(f'Redis: {TestingConfig.REDIS_URL}')
+    auth_token = token()
+    for i, kind in enumerate(SERVERS):
+        measure(kind, args.port + i, args.n, auth_token)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark the CPU cost of one server-sent event from its publish to the bytes written to each recipient.
+
+Usage (from the folder server): `python -m benchmark.bench_sse_message --n 20000 --recipients 10`
+"""
+
+import argparse
+import json
+import time
+
+from src.chat.util.stream import Message
+
+
+def json_passes(data, recipients: int) -> None:
+    """The older path: json on publish, parsed by each stream, rebuilt as a Message then rendered."""
+    published = json.dumps(Message(data, type='action_message', retry=30000).to_dict())
+    for _ in range(recipients):
+        str(Message(**json.loads(published))).encode('utf-8')
+
+
+def frame_once(data, recipients: int) -> None:
+    """The frame is rendered at publish and forwarded unchanged."""
+    frame = Message(data, type='action_message', retry=30000).encode()
+    for _ in range(recipients):
+        bytes(frame)
+
+
+def frame_once_with_id(data, recipients: int) -> None:
+    """The durable mode: the id of each recipient is added into the frame rendered once."""
+    frame = Message(data, type='action_message', retry=30000).encode()
+    for i in range(recipients):
+        Message.with_id(frame, f'1600000000000-{i}')
+
+
+def measure(n: int, function) -> float:
+    """CPU time of one call in microseconds."""
+    start = time.process_time()
+    for _ in range(n):
+        function()
+    return (time.process_time() - start) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n', type=int, default=20000, help='The number of events.')
+    parser.add_argument('--recipients', type=int, default=10, help='The number of recipients of one event.')
+    args = parser.parse_args()
+
+    data = dict(type='new_message', project_id=1, project_title='Project',
+                message=dict(id=1, content='Hello ' * 20, user=dict(id=1, username='user', ava=None)))
+
+    before = measure(args.n, lambda: json_passes(data, args.recipients))
+    after = measure(args.n, lambda: frame_once(data, args.recipients))
+    durable = measure(args.n, lambda: frame_once_with_id(data, args.recipients))
+
+    print(f'{args.recipients} recipients, per event:')
+    print(f'three json passes per recipient   : {before:8.1f} us')
+    print(f'frame rendered once               : {after:8.1f} us')
+    print(f'frame rendered once + id (durable): {durable:8.1f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare the Redis connections and the memory of N idle SSE streams:
+one pubsub per stream (older path) against the subscriber shared by the process.
+
+Usage (from the folder server): `python -m benchmark.bench_sse_subscriber --n 1000`
+"""
+
+import argparse
+import gc
+import tracemalloc
+
+from flask import Flask
+from redis import Redis
+
+from src.chat.config import TestingConfig
+from src.chat.util.subscriber import StreamSubscriber
+
+
+def redis_state(redis: Redis):
+    info = redis.info()
+    return info['connected_clients'], info['used_memory']
+
+
+def bench_pubsub_per_stream(redis: Redis, channels):
+    pubsubs = []
+    for channel in channels:
+        pubsub = redis.pubsub()
+        pubsub.subscribe(channel)
+        pubsubs.append(pubsub)
+    return pubsubs, lambda: [pubsub.close() for pubsub in pubsubs]
+
+
+def bench_shared_subscriber(redis: Redis, channels):
+    app = Flask(__name__)
+    app.config.from_object(TestingConfig)
+    subscriber = StreamSubscriber(app, redis)
+    clients = [subscriber.open(channel) for channel in channels]
+    return clients, lambda: [subscriber.close(client) for client in clients]
+
+
+def measure(name: str, redis: Redis, channels, open_streams) -> None:
+    gc.collect()
+    clients_before, memory_before = redis_state(redis)
+    tracemalloc.start()
+    snapshot = tracemalloc.take_snapshot()
+
+    streams, close = open_streams(redis, channels)
+
+    python_memory = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(snapshot, 'filename'))
+    tracemalloc.stop()
+    clients_after, memory_after = redis_state(redis)
+    print(f'{name:24}: {clients_after - clients_before:6} Redis connections, '
+          f'{(memory_after - memory_before) / 1024:9.1f} KiB in Redis, '
+          f'{python_memory / 1024:9.1f} KiB in Python ({python_memory / len(channels):.0f} B/stream)')
+    close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--n', type=int, default=1000, help='The number of SSE streams.')
+    args = parser.parse_args()
+
+    redis = Redis.from_url(TestingConfig.REDIS_URL)
+    channels = [f'sse:sub:user:bench-{i}' for i in range(args.n)]
+
+    measure('one pubsub per stream', redis, channels, bench_pubsub_per_stream)
+    measure('shared subscriber', redis, channels, bench_shared_subscriber)
+    redis.delete(*channels)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,12 @@ from flask_socketio import SocketIO
 from flask_sqlalchemy import SQLAlchemy
 
 from src.chat.config import config_by_name
+from src.chat.util.blacklist import TokenBlacklist
+from src.chat.util.presence import PresenceKeeper
+from src.chat.util.push import PushDispatcher
+from src.chat.util.rate_limit import RateLimiter
+from src.chat.util.subscriber import StreamSubscriber
+from src.chat.util.token_cache import TokenCache
 
 db = SQLAlchemy()
 migrate = Migrate()
@@ -16,6 +22,12 @@ cors = CORS()
 mail = Mail()
 redis = FlaskRedis()
 sio = SocketIO()
+push = PushDispatcher()
+subscriber = StreamSubscriber()
+blacklist = TokenBlacklist()
+token_cache = TokenCache()
+presence = PresenceKeeper()
+rate_limiter = RateLimiter()
 
 
 def create_app(config_name):
@@ -25,16 +37,37 @@ def create_app(config_name):
     from src.chat.controller import api_bp
     app.register_blueprint(api_bp)
 
+    from src.chat.util.stream import coalescer
+    coalescer.init_app(app)
+
     db.init_app(app)
     migrate.init_app(app, db)
     flask_bcrypt.init_app(app)
     cors.init_app(app)
     mail.init_app(app)
     redis.init_app(app)
+    push.init_app(app)
+    subscriber.init_app(app, redis)
+    blacklist.init_app(app, redis)
+    token_cache.init_app(app, blacklist)
+    presence.init_app(app, redis)
+    rate_limiter.init_app(app, redis)
     sio.init_app(app, cors_allowed_origins="*",
                  async_mode=app.config['ASYNC_MODE'],
-                 message_queue=app.config['REDIS_URL'],
                  always_connect=True,
+                 **_socketio_serializer(app.config)
                  )
 
     return app
+
+
+def _socketio_serializer(config):
+    """The serializer of the packets and the message queue between the workers."""
+    if config['SOCKETIO_SERIALIZER'] == 'msgpack':
+        # Imported only with this serializer
+        from src.chat.util.msgpack_queue import MsgPackRedisManager
+        return dict(serializer='msgpack', client_manager=MsgPackRedisManager(config['REDIS_URL'],
+                                                                              channel='flask-socketio'))
+    if config['SOCKETIO_SERIALIZER'] != 'default':
+        raise ValueError('SOCKETIO_SERIALIZER must be one of default, msgpack.')
+    return dict(message_queue=config['REDIS_URL'])
@@ -32,6 +32,24 @@ class Config:
 
     # Socketio
     ASYNC_MODE = getenv('ASYNC_MODE')
+    # The packets of the clients and the messages between the workers: default (JSON and pickle) or msgpack, all the
+    # clients must use the parser `socket.io-msgpack-parser` with msgpack
+    SOCKETIO_SERIALIZER = getenv('SOCKETIO_SERIALIZER', 'default')
+
+    # Socketio: the presence of a socket expires after the TTL if its worker stops refreshing it every heartbeat,
+    # the sockets expired are removed from the rooms every sweep (seconds)
+    PRESENCE_TTL = int(getenv('PRESENCE_TTL', '60'))
+    PRESENCE_HEARTBEAT = float(getenv('PRESENCE_HEARTBEAT', '20'))
+    PRESENCE_SWEEP = float(getenv('PRESENCE_SWEEP', '60'))
+
+    # Socketio: the events of each user are limited by token buckets, per event and per role: the burst of events
+    # allowed and the tokens refilled per second
+    SOCKET_RATE_LIMIT = getenv('SOCKET_RATE_LIMIT', 'true').lower() in ('true', '1', 't')
+    SOCKET_RATE_LIMITS = dict(
+        send_message=dict(user=(10, 2), admin=(30, 10)),
+        join_project=dict(user=(10, 1), admin=(20, 5)),
+        leave_project=dict(user=(10, 1), admin=(20, 5)),
+    )
 
     # File upload
     ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc'}
@@ -42,6 +60,51 @@ class Config:
     VAPID_CLAIMS = dict(
         sub='mailto:' + getenv('VAPID_CLAIMS_SUB', 'test@test.com')
     )
+    VAPID_EXPIRE = int(getenv('VAPID_EXPIRE', 12 * 60 * 60))
+
+    # SSE: in durable mode, the events are kept in a capped stream per user to be replayed after a reconnection
+    SSE_DURABLE = getenv('SSE_DURABLE', 'false').lower() in ('true', '1', 't')
+    SSE_REPLAY_MAXLEN = int(getenv('SSE_REPLAY_MAXLEN', '100'))
+    SSE_REPLAY_TTL = int(getenv('SSE_REPLAY_TTL', 24 * 60 * 60))
+    # SSE: a comment is sent every heartbeat (seconds), the streams without write during the idle timeout are reaped
+    SSE_HEARTBEAT = float(getenv('SSE_HEARTBEAT', '15'))
+    SSE_IDLE_TIMEOUT = int(getenv('SSE_IDLE_TIMEOUT', '45'))
+    # SSE: the frames waiting for a slow client and the policy when they are full: drop_oldest, collapse or disconnect
+    SSE_QUEUE_SIZE = int(getenv('SSE_QUEUE_SIZE', '100'))
+    SSE_OVERFLOW = getenv('SSE_OVERFLOW', 'drop_oldest')
+
+    # Notification: the last notifications of each user are kept in his inbox (days)
+    NOTIFICATION_INBOX = getenv('NOTIFICATION_INBOX', 'true').lower() in ('true', '1', 't')
+    NOTIFICATION_INBOX_MAXLEN = int(getenv('NOTIFICATION_INBOX_MAXLEN', '200'))
+    NOTIFICATION_INBOX_TTL = int(getenv('NOTIFICATION_INBOX_TTL', '30')) * 24 * 60 * 60
+    # Notification: the public messages following another one in the same project are merged during this window
+    # (seconds), 0 to disable
+    NOTIFICATION_COALESCE_WINDOW = float(getenv('NOTIFICATION_COALESCE_WINDOW', '5'))
+    # Notification: the maximum size of the data in bytes, a webpush carries about 4KB once encrypted
+    NOTIFICATION_MAX_SIZE = int(getenv('NOTIFICATION_MAX_SIZE', '3072'))
+
+    # Webpush delivery
+    PUSH_WORKERS = int(getenv('PUSH_WORKERS', '4'))
+    # The workers reserved for the time-sensitive notifications (messages)
+    PUSH_HIGH_WORKERS = int(getenv('PUSH_HIGH_WORKERS', '2'))
+    PUSH_QUEUE_SIZE = int(getenv('PUSH_QUEUE_SIZE', '10000'))
+    PUSH_TIMEOUT = float(getenv('PUSH_TIMEOUT', '10'))
+    PUSH_CONNECT_TIMEOUT = float(getenv('PUSH_CONNECT_TIMEOUT', '3'))
+    # A push service is not called during the reset (seconds) after this number of consecutive failures
+    PUSH_BREAKER_THRESHOLD = int(getenv('PUSH_BREAKER_THRESHOLD', '5'))
+    PUSH_BREAKER_RESET = float(getenv('PUSH_BREAKER_RESET', '30'))
+    PUSH_MAX_RETRIES = int(getenv('PUSH_MAX_RETRIES', '3'))
+    PUSH_RETRY_BACKOFF = float(getenv('PUSH_RETRY_BACKOFF', '0.5'))
+    PUSH_RETRY_BACKOFF_MAX = float(getenv('PUSH_RETRY_BACKOFF_MAX', '30'))
+    PUSH_ENDPOINT_STATS = int(getenv('PUSH_ENDPOINT_STATS', '1000'))
+
+    # Token blacklist: a Bloom filter of the revoked tokens in each process, rebuilt every `REBUILD` seconds
+    BLACKLIST_BLOOM_CAPACITY = int(getenv('BLACKLIST_BLOOM_CAPACITY', '100000'))
+    BLACKLIST_BLOOM_ERROR_RATE = float(getenv('BLACKLIST_BLOOM_ERROR_RATE', '0.001'))
+    BLACKLIST_BLOOM_REBUILD = int(getenv('BLACKLIST_BLOOM_REBUILD', '3600'))
+
+    # The tokens verified in each process, 0 to disable
+    TOKEN_CACHE_SIZE = int(getenv('TOKEN_CACHE_SIZE', '10000'))
 
     # SSL
     SSL_PRIVATE_KEY = path.join(basedir, '../..', 'https', 'tx_chat.key')
@@ -64,6 +127,7 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path.join(basedir, '../../flask_chat_test.db')
     PRESERVE_CONTEXT_ON_EXCEPTION = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    NOTIFICATION_COALESCE_WINDOW = 0
 
 
 class ProductionConfig(Config):
@@ -4,10 +4,11 @@ from flask import Blueprint, request
 from flask_restx import Api
 from flask_socketio import ConnectionRefusedError
 
-from src.chat import sio
+from src.chat import presence, sio
 from src.chat.controller.auth_controller import api as auth_ns
 from src.chat.controller.socket.message_socket import WsMessageNamespace
 from src.chat.controller.v1.message_controller import api as message_ns_v1
+from src.chat.controller.v1.metric_controller import api as metric_ns_v1
 from src.chat.controller.v1.project_controller import api as project_ns_v1
 from src.chat.controller.v1.user_controller import api as user_ns_v1
 
@@ -36,11 +37,21 @@ api_v1.add_namespace(auth_ns)
 api_v1.add_namespace(user_ns_v1, path=_API_v1 + '/users')
 api_v1.add_namespace(project_ns_v1, path=_API_v1 + '/projects')
 api_v1.add_namespace(message_ns_v1, path=_API_v1 + '/messages')
+api_v1.add_namespace(metric_ns_v1, path=_API_v1 + '/metrics')
 
 # Definition namespace socket
 sio.on_namespace(WsMessageNamespace('/ws/messages'))
 
 
+# Notify the users of the sockets expired are offline
+def notify_offline(room, users_id):
+    for user_id in users_id:
+        sio.emit('offline', dict(user_id=user_id), room=room, namespace='/ws/messages')
+
+
+presence.add_listener(notify_offline)
+
+
 # Definition error for socket
 @sio.on_error_default
 def default_error_handler(e):
@@ -4,12 +4,14 @@ from flask import request
 from flask_restx import marshal
 from flask_socketio import Namespace
 
+from src.chat import rate_limiter
 from src.chat.dto.message_dto import message_item
 from src.chat.service.message_service import (save_new_message, valid_input_room, valid_input_message,
                                               notify_new_message_into_members_offline)
-from src.chat.service.ws_service import (save_user_id_with_sid, get_user_id_by_sid,
-                                         user_join_into_project, user_leave_from_project, get_sid_by_user_id_in_room)
-from src.chat.util.decorator import token_required
+from src.chat.service.ws_service import (save_user_id_with_sid, get_user_id_by_sid, delete_user_id_by_sid,
+                                         user_join_into_project, user_leave_from_project, get_sids_by_user_id_in_room,
+                                         get_room_for_user)
+from src.chat.util.decorator import rate_limited, token_required
 
 
 class WsMessageNamespace(Namespace):
@@ -18,39 +20,55 @@ class WsMessageNamespace(Namespace):
     def on_connect(self):
         """Event connect with allow to access the headers from the current request."""
         save_user_id_with_sid(self.on_connect.current_user_id)
+        rate_limiter.connect(request.sid, self.on_connect.current_user_id, self.on_connect.current_user_admin)
 
+    @rate_limited
     def on_join_project(self, data):
         """Event join in project if the user log into the conversation."""
 
         # Verify the project's id
         data = valid_input_room(data)
 
-        # The user enter the room
+        # Add one user online in project, the join is rejected if his sid expired
+        data_join = user_join_into_project(data.get('room'))
+
+        # The user enter the room, his private messages are sent in his own room
+        user_id = data_join.get('user_id')
         self.enter_room(request.sid, data.get('room'))
+        self.enter_room(request.sid, get_room_for_user(data.get('room'), user_id))
 
-        # Add one user online in project
-        user_id = get_user_id_by_sid()
-        list_online = user_join_into_project(data.get('room'))
+        # The user left his previous room
+        if data_join.get('previous'):
+            self._leave(dict(user_id=user_id, sid=request.sid, room=data_join.get('previous'),
+                             offline=data_join.get('offline')))
 
-        # Notify the others users one new user join in project
-        self.emit('online', data=dict(user_id=user_id), room=data.get('room'), include_self=False)
+        # Notify the others users one new user join in project, once for all his sockets
+        if data_join.get('first'):
+            self.emit('online', data=dict(user_id=user_id), room=data.get('room'), include_self=False)
 
-        return list_online
+        return data_join.get('online')
 
+    @rate_limited
     def on_leave_project(self):
         """Event leave from project if the user exit from the conversation."""
 
         # one user leave from project
-        data_leave = user_leave_from_project()
+        self._leave(user_leave_from_project())
+
+    def _leave(self, data_leave):
+        """Leave the room and notify the others users."""
 
         # Verify his room
         if data_leave and data_leave.get('room'):
             self.leave_room(data_leave.get('sid'), data_leave.get('room'))
+            self.leave_room(data_leave.get('sid'), get_room_for_user(data_leave.get('room'), data_leave.get('user_id')))
 
-            # Notify the others users one user leave from project
-            self.emit('offline', data=dict(user_id=data_leave.get('user_id')), room=data_leave.get('room'),
-                      include_self=False)
+            # Notify the others users one user leave from project, with his last socket
+            if data_leave.get('offline'):
+                self.emit('offline', data=dict(user_id=data_leave.get('user_id')), room=data_leave.get('room'),
+                          include_self=False)
 
+    @rate_limited
     def on_send_message(self, data):
         """Event the user send a message in the conversation."""
 
@@ -67,15 +85,16 @@ class WsMessageNamespace(Namespace):
             self.emit('receive_message', data=message_dto, room=data.get('room'), include_self=False)
             notify_new_message_into_members_offline(message=message, room=data.get('room'))
         else:
-            # Send the private message
-            sid_receive = get_sid_by_user_id_in_room(user_id=message.receiver_id, room=data.get('room'))
-            if sid_receive:
-                self.emit('receive_message', data=message_dto, room=sid_receive, include_self=False)
+            # Send the private message to all the receiver's sockets
+            if get_sids_by_user_id_in_room(user_id=message.receiver_id, room=data.get('room')):
+                self.emit('receive_message', data=message_dto,
+                          room=get_room_for_user(data.get('room'), message.receiver_id), include_self=False)
             else:
                 notify_new_message_into_members_offline(message=message, only_receiver=True)
 
         return message_dto
 
     def on_disconnect(self):
-        """Event disconnect suddenly."""
-        self.on_leave_project()
+        """Event disconnect suddenly, the user's sid is deleted."""
+        self._leave(delete_user_id_by_sid())
+        rate_limiter.disconnect(request.sid)
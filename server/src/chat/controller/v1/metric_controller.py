@@ -0,0 +1,22 @@
+"""API endpoint definitions for /metrics namespace."""
+
+from http import HTTPStatus
+
+from flask_restx import Resource
+
+from src.chat.dto.metric_dto import api, metric_list
+from src.chat.service.metric_service import get_metrics
+from src.chat.util.decorator import admin_token_required
+
+
+@api.route('/')
+class List(Resource):
+    """Metrics of the notifications."""
+
+    @admin_token_required
+    @api.doc('Get the metrics of this process', security='Bearer')
+    @api.response(int(HTTPStatus.OK), 'Metrics of the notifications.', metric_list)
+    @api.response(int(HTTPStatus.UNAUTHORIZED), 'You are not an administrator.')
+    def get(self):
+        """Get the metrics of the SSE streams, of the webpush, of the sockets and of the blacklist of this process."""
+        return get_metrics()
@@ -1,16 +1,18 @@
 """API endpoint definitions for /projects namespace."""
 
+import hashlib
+import json
 from http import HTTPStatus
 
 from flask import request
-from flask_restx import Resource
+from flask_restx import Resource, marshal
 
 from src.chat.dto.project_dto import (
     api, project_list, project_item, project_post, project_params,
     project_participant, project_designate_coach, user_item
 )
 from src.chat.service.project_service import (
-    save_new_project, get_all_projects, update_project, delete_project,
+    save_new_project, get_all_projects, get_a_project, update_project, delete_project,
     invite_participant_into_project, leave_from_project, designate_coach_into_project, withdraw_coach_in_project,
     remove_participant_in_project,
 )
@@ -55,6 +57,18 @@ class List(Resource):
 class Item(Resource):
     """Item for Project."""
 
+    @token_required
+    @api.response(int(HTTPStatus.NOT_MODIFIED), 'The project did not change since the header If-None-Match.')
+    def get(self, id: int):
+        """Get the details of your project, the notifications only refer to it."""
+        data = marshal(get_a_project(self.get.current_user_id, id), project_item)
+        # The members' profiles are in the details, the ETag depends on the content and not only on the version
+        etag = hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'}
+        if request.if_none_match.contains(etag):
+            return None, HTTPStatus.NOT_MODIFIED, headers
+        return data, HTTPStatus.OK, headers
+
     @token_required
     @api.marshal_with(project_item)
     def put(self, id: int):
@@ -7,7 +7,10 @@ from flask_restx import Resource
 
 from src.chat.dto.auth_dto import auth_resp
 from src.chat.dto.user_dto import (api, user_item, user_list, user_post, user_params, user_put, user_password,
-                                   user_forget_password, subscription_info, token_parser)
+                                   user_forget_password, subscription_info, subscription_endpoint, token_parser,
+                                   notification_list, notification_params, notification_read)
+from src.chat.service.notification_service import get_notifications, read_notifications, DEFAULT_LIMIT
+from src.chat.service.project_service import get_id_projects
 from src.chat.service.user_service import (save_new_user, get_all_users, get_a_user, update_a_user,
                                            update_a_user_password, update_password_forgotten,
                                            save_data_subscription_webpub, unsubscription_data_subscription_webpub,
@@ -104,10 +107,10 @@ class Stream(Resource):
     @api.doc('Connect the stream SSE')
     @api.expect(token_parser)
     def get(self):
-        """Connect the stream SSE."""
+        """Connect the stream SSE. The missed events are replayed after the header 'Last-Event-ID'."""
         token = token_parser.parse_args()['token']
         user_id, _ = decode_auth_token(token)
-        return stream(user_id)
+        return stream(user_id, request.headers.get('Last-Event-ID'), get_id_projects(user_id))
 
     @token_required
     @api.doc('Delete channel in stream SSE', security='Bearer')
@@ -117,6 +120,31 @@ class Stream(Resource):
         return ''
 
 
+@api.route('/notifications')
+class Notifications(Resource):
+    """The inbox of the notifications."""
+
+    @token_required
+    @api.doc('List my notifications', params=notification_params, security='Bearer')
+    @api.response(int(HTTPStatus.OK), 'My notifications, the latest first.', notification_list)
+    @api.response(int(HTTPStatus.BAD_REQUEST), 'Input payload validation failed.')
+    @api.marshal_with(notification_list)
+    def get(self):
+        """List my notifications after the cursor 'before', with the number unread."""
+        before = request.args.get('before')
+        limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+        return get_notifications(self.get.current_user_id, before, limit)
+
+    @token_required
+    @api.doc('Read my notifications', security='Bearer')
+    @api.expect(notification_read, validate=True)
+    @api.response(int(HTTPStatus.OK), 'The notifications were read.')
+    def put(self):
+        """Mark my notifications as read until the given one, the latest by default."""
+        data = request.get_json(silent=True) or dict()
+        return read_notifications(self.put.current_user_id, data.get('id'))
+
+
 @api.route('/subscription')
 class PubSub(Resource):
     """Webpush"""
@@ -136,10 +164,12 @@ class PubSub(Resource):
         return save_data_subscription_webpub(data, self.post.current_user_id)
 
     @api.doc('Unsubscription client key', security='Bearer')
+    @api.expect(subscription_endpoint)
     @token_required
     def delete(self):
-        """Unsubscription the key of Service Worker"""
-        return unsubscription_data_subscription_webpub(self.delete.current_user_id)
+        """Unsubscription the key of Service Worker of one device, of all my devices by default"""
+        data = request.get_json(silent=True) or dict()
+        return unsubscription_data_subscription_webpub(self.delete.current_user_id, data.get('endpoint'))
 
 
 @api.route('/admin/<int:user_id>')
@@ -0,0 +1,75 @@
+"""The definition for Metric schema."""
+
+from flask_cors import cross_origin
+from flask_restx import Namespace
+
+api = Namespace('metric_v1', description='metrics of the notifications',
+                decorators=[cross_origin()])
+
+metric_list = api.schema_model('Metric_List', {
+    'type': 'object',
+    'properties': {
+        'sse': {
+            'type': 'object',
+            'title': 'The SSE streams of this process',
+            'properties': {
+                'channels': {'type': 'integer'},
+                'streams': {'type': 'integer', 'title': 'The active streams'},
+                'reaped': {'type': 'integer', 'title': 'The idle streams closed by the server'},
+                'queued': {'type': 'integer', 'title': 'The frames waiting in the queues of the streams'},
+                'max_queued': {'type': 'integer', 'title': 'The frames waiting in the longest queue'},
+                'dropped': {'type': 'integer', 'title': 'The frames dropped by the overflow policy'},
+                'disconnected': {'type': 'integer', 'title': 'The streams closed by the overflow policy'},
+                'connections': {'type': 'integer', 'title': 'The Redis pubsub connections'},
+            }
+        },
+        'webpush': {
+            'type': 'object',
+            'title': 'The webpush delivery of this process',
+        },
+        'webpush_lanes': {
+            'type': 'object',
+            'title': 'The workers and the notifications waiting of each lane',
+        },
+        'webpush_endpoints': {
+            'type': 'object',
+            'title': 'The failures and retries of the endpoints which failed recently',
+        },
+        'webpush_breakers': {
+            'type': 'object',
+            'title': 'The state of the circuit breaker of each push service',
+        },
+        'coalescer': {
+            'type': 'object',
+            'title': 'The notifications coalesced by this process',
+        },
+        'presence': {
+            'type': 'object',
+            'title': 'The sockets kept alive by this process',
+            'properties': {
+                'sockets': {'type': 'integer', 'title': 'The sockets held by this process'},
+                'swept': {'type': 'integer', 'title': 'The users gone offline with the sockets expired'},
+            }
+        },
+        'rate_limit': {
+            'type': 'object',
+            'title': 'The socket events limited by this process',
+            'properties': {
+                'sockets': {'type': 'integer'},
+                'allowed': {'type': 'integer', 'title': 'The events allowed'},
+                'rejected_local': {'type': 'integer', 'title': 'The events rejected by the bucket of the socket'},
+                'rejected_redis': {'type': 'integer', 'title': 'The events rejected by the bucket of the user'},
+            }
+        },
+        'blacklist': {
+            'type': 'object',
+            'title': 'The revoked tokens checked by this process',
+            'properties': {
+                'synced': {'type': 'boolean', 'title': 'True if the Bloom filter follows the revocations'},
+                'revoked': {'type': 'integer', 'title': 'The tokens in the Bloom filter'},
+                'filtered': {'type': 'integer', 'title': 'The checks answered by the Bloom filter'},
+                'lookups': {'type': 'integer', 'title': 'The checks answered by Redis'},
+            }
+        },
+    }
+})
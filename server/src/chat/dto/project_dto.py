@@ -30,6 +30,7 @@ project_designate_coach = api.model('Project_Designate_New_Coach', {
 project_item = api.model('Project_Item', {
     'id': fields.Integer(description="Project's identifier"),
     'title': fields.String,
+    'version': fields.Integer(description="Project's version, incremented at each change"),
     'owner': fields.Nested(user_item, description="Project's owner"),
     'coaches': fields.List(fields.Nested(user_item), description='List for coach'),
     'participants': fields.List(fields.Nested(user_item), description='List for participant'),
@@ -37,5 +38,17 @@ project_item = api.model('Project_Item', {
 
 project_list = api.model('Project_List', model=list_model(project_item))
 
+# The references sent in the notifications, the details are fetched with GET /projects/<id>
+user_ref = api.model('User_Ref', {
+    'id': fields.Integer(description="user's identifier"),
+    'username': fields.String(description='user username'),
+})
+
+project_ref = api.model('Project_Ref', {
+    'id': fields.Integer(description="Project's identifier"),
+    'title': fields.String,
+    'version': fields.Integer(description="Project's version, incremented at each change"),
+})
+
 project_params = params.copy()
 project_params['filter_by'] = {'in': 'query', 'description': 'The filter for title.', 'type': 'string'}
@@ -104,5 +104,38 @@ subscription_info = api.model('Subscription_info', {
     }))
 })
 
+subscription_endpoint = api.model('Subscription_endpoint', {
+    'endpoint': fields.String(description='The endpoint of the device, all my devices by default'),
+})
+
 token_parser = api.parser()
-token_parser.add_argument('token', required=True, help="User's Token!")
\ No newline at end of file
+token_parser.add_argument('token', required=True, help="User's Token!")
+
+notification_item = api.model('Notification_Item', {
+    'id': fields.String(description="notification's identifier, also the cursor of the pagination"),
+    'type': fields.String(description='The event type'),
+    'data': fields.Raw(description='The event data'),
+    'read': fields.Boolean(description='True if the notification was read'),
+})
+
+notification_list = api.model('Notification_List', {
+    'unread': fields.Integer(description='The number of notifications unread'),
+    'has_next': fields.Boolean(description='True if older notifications exist'),
+    'next': fields.String(description='The cursor of the older notifications'),
+    'data': fields.List(fields.Nested(notification_item), description='The notifications, the latest first'),
+})
+
+notification_params = {
+    'before': {'in': 'query', 'description': 'The cursor, only the notifications older than it', 'type': 'string'},
+    'limit': {'in': 'query', 'description': 'The number of notifications', 'default': 20, 'type': 'integer'},
+}
+
+notification_read = api.schema_model('Notification_Read', {
+    'properties': {
+        'id': {
+            'type': 'string',
+            'description': 'The last notification read, the latest by default',
+        },
+    },
+    'type': 'object',
+})
@@ -21,6 +21,8 @@ class Project(db.Model):
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     title = db.Column(db.String(255), unique=True, nullable=False)
+    # Incremented at each change of the project or of its members, the notifications refer to it
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     owner = db.relationship('User', backref=db.backref('own_projects', lazy='dynamic'))
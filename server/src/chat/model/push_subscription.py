@@ -1,15 +1,24 @@
 """Class definition for PushSubscription."""
 
+import hashlib
+
 from src.chat import db
 
 
 class PushSubscription(db.Model):
-    """Token Model for storing JWT tokens."""
+    """Model for storing the push subscriptions, one per device of a user."""
     __tablename__ = 'push_subscription'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    user_id = db.Column(db.Integer, unique=True, nullable=False)
-    subscription_json = db.Column(db.Text, unique=True, nullable=False)
+    user_id = db.Column(db.Integer, index=True, nullable=False)
+    # Null in the rows saved before the hash until `backfill_endpoint_hash` at startup
+    endpoint_hash = db.Column(db.String(64), unique=True, nullable=True)
+    subscription_json = db.Column(db.Text, nullable=False)
+
+    @staticmethod
+    def hash_endpoint(endpoint: str) -> str:
+        """The key of the device, its endpoint is too long for an index."""
+        return hashlib.sha256(endpoint.encode('utf-8')).hexdigest()
 
     def __repr__(self):
         return '<user_id: {} subscription: {}>'.format(self.user_id, self.subscription_json)
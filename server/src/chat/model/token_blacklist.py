@@ -9,9 +9,12 @@ class BlacklistedToken(db.Model):
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     token = db.Column(db.String(500), unique=True, nullable=False)
+    # The expiration of the token, the row is useless after it
+    expires_at = db.Column(db.DateTime, index=True)
 
-    def __init__(self, token):
+    def __init__(self, token, expires_at=None):
         self.token = token
+        self.expires_at = expires_at
 
     def __repr__(self):
         return '<token: {}'.format(self.token)
@@ -7,8 +7,9 @@ import jwt
 from flask import current_app
 from werkzeug.exceptions import Unauthorized
 
+from src.chat import token_cache
 from src.chat.model.user import User
-from src.chat.service.blacklist_service import save_token_into_blacklist, check_blacklist
+from src.chat.service.blacklist_service import save_token_into_blacklist, check_blacklist, hash_token
 
 
 def encode_auth_token(user_id: int, admin: bool = False) -> Tuple[str, int]:
@@ -41,16 +42,22 @@ def encode_auth_token(user_id: int, admin: bool = False) -> Tuple[str, int]:
 
 def decode_auth_token(auth_token: str) -> Tuple[int, bool]:
     """
-    Decodes the auth token
+    Decodes the auth token, a token already verified in the process is not verified again.
 
     :param auth_token: JWT
     :return: User's id and role
     """
 
     try:
-        payload = jwt.decode(auth_token, key=current_app.config.get("SECRET_KEY"), algorithms=['HS256'])
+        token_hash = hash_token(auth_token)
+        verified = token_cache.get(token_hash)
+        if verified is None:
+            payload = jwt.decode(auth_token, key=current_app.config.get("SECRET_KEY"), algorithms=['HS256'])
+            verified = payload.get('sub'), payload.get('admin')
+            if payload.get('exp'):
+                token_cache.put(token_hash, *verified, payload['exp'])
         if not check_blacklist(auth_token):
-            return payload.get('sub'), payload.get('admin')
+            return verified
         raise Unauthorized('Token was removed. Please log in again.')
     except jwt.ExpiredSignatureError:
         raise Unauthorized('Signature expired. Please log in again.')
@@ -1,18 +1,52 @@
 """Service logic for black token."""
 
+import hashlib
+from datetime import datetime, timezone
+
+import jwt
+
+from src.chat import blacklist, db
 from src.chat.model.token_blacklist import BlacklistedToken
 from src.chat.service import save_data
 
 
 def save_token_into_blacklist(token: str) -> None:
-    """Save the token into blacklist."""
+    """Save the token into blacklist, it is revoked in Redis until its expiration."""
 
-    blacklist_token = BlacklistedToken(token=token)
+    expires_at = _get_expiration(token)
+    blacklist_token = BlacklistedToken(token=token, expires_at=expires_at)
     # insert the token
     save_data(blacklist_token)
+    blacklist.revoke(hash_token(token), expires_at.timestamp())
 
 
 def check_blacklist(auth_token) -> bool:
     """Check whether auth token has been blacklisted."""
 
-    return BlacklistedToken.query.filter_by(token=str(auth_token)).first() is not None
+    return blacklist.is_revoked(hash_token(str(auth_token)))
+
+
+def transfer_blacklist_to_redis() -> None:
+    """Revoke in Redis the tokens of the blacklist not expired, the tokens expired are deleted."""
+
+    now = datetime.now(timezone.utc)
+    for blacklist_token in BlacklistedToken.query.all():
+        expires_at = blacklist_token.expires_at or _get_expiration(blacklist_token.token)
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        if expires_at <= now:
+            db.session.delete(blacklist_token)
+        else:
+            blacklist.revoke(hash_token(blacklist_token.token), expires_at.timestamp())
+    db.session.commit()
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def _get_expiration(token: str) -> datetime:
+    """The expiration of a token, its signature was already verified."""
+
+    payload = jwt.decode(token, options=dict(verify_signature=False, verify_exp=False))
+    return datetime.fromtimestamp(payload['exp'], timezone.utc)
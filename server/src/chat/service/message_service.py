@@ -9,11 +9,11 @@ from src.chat.model.message import Message
 from src.chat.model.pagination import Pagination
 from src.chat.service import save_data
 from src.chat.service.project_service import (get_project_item, is_owner, is_coach, is_participant,
-                                              required_member_in_project, notify_all_member_in_project)
-from src.chat.service.user_service import notify_one_user
+                                              required_member_in_project)
 from src.chat.service.ws_service import get_all_user_in_room
 from src.chat.util.constant import TYPE_NOTIFICATION_NEW_MESSAGE, TYPE_NOTIFICATION_ACTION_MESSAGE
 from src.chat.util.pagination import paginate
+from src.chat.util.stream import coalescer, publish_many
 
 
 def save_new_message(data: Dict) -> Message:
@@ -46,7 +46,7 @@ def save_new_message(data: Dict) -> Message:
         new_message.file_name = file_name
         new_message.file_base64 = file_base64
 
-    if receiver or receiver != 0:
+    if receiver:
         # Receiver must be a member
         if not (is_owner(receiver, project) or is_coach(receiver, project) or is_participant(receiver, project)):
             e = BadRequest()
@@ -96,6 +96,8 @@ def notify_new_message_into_members_offline(message: Message, room: str = None,
                                             only_receiver: bool = False):
     """
     Notify the new message to all members offline.
+
+    The public messages sent in a burst are merged into one notification for each member.
     :param message: Object Message
     :param room: The chatting room
     :param only_receiver: Check the notify for public or private
@@ -105,16 +107,27 @@ def notify_new_message_into_members_offline(message: Message, room: str = None,
         type=TYPE_NOTIFICATION_NEW_MESSAGE,
         message=f"'@{message.sender.username}' sent "
                 + f"{'a new message' if not only_receiver else 'you a new private message'}.",
-        data=dict(project_title=message.project.title)
+        data=dict(project_id=message.project_id, project_title=message.project.title)
     )
     if only_receiver:
-        notify_one_user(user_id=message.receiver_id, data=data,
-                        type_publish=TYPE_NOTIFICATION_ACTION_MESSAGE)
-    else:
-        exclude_users_id = [user.get('user_id') for user in get_all_user_in_room(room)]
-        notify_all_member_in_project(users_id=message.project.get_id_members(), data=data,
-                                     type_publish=TYPE_NOTIFICATION_ACTION_MESSAGE,
-                                     exclude_users_id=exclude_users_id)
+        # A private message is not merged with the public ones
+        publish_many([message.receiver_id], data, TYPE_NOTIFICATION_ACTION_MESSAGE)
+        return
+
+    exclude_users_id = [user.get('user_id') for user in get_all_user_in_room(room)]
+    users_id = list(set(message.project.get_id_members()) - set(exclude_users_id))
+    coalescer.add(users_id=users_id, project_id=message.project_id, type_publish=TYPE_NOTIFICATION_ACTION_MESSAGE,
+                  data=data, digest=_digest_new_messages)
+
+
+def _digest_new_messages(data: Dict, count: int) -> Dict:
+    """Summarize many notifications of new message in the same project."""
+
+    return dict(
+        type=TYPE_NOTIFICATION_NEW_MESSAGE,
+        message=f"{count} new messages in '{data['data']['project_title']}'.",
+        data=dict(data['data'], count=count)
+    )
 
 
 def valid_input_room(data: Dict) -> Dict:
@@ -133,7 +146,7 @@ def valid_input_room(data: Dict) -> Dict:
             message='Input payload validation failed.'
         )
         raise e
-    data['room'] = _get_room_for_project(data.get('project_id'))
+    data['room'] = get_room_for_project(data.get('project_id'))
 
     return data
 
@@ -167,12 +180,12 @@ def valid_input_message(data: Dict) -> Dict:
         )
         raise e
 
-    data['room'] = _get_room_for_project(data.get('project_id'))
+    data['room'] = get_room_for_project(data.get('project_id'))
 
     return data
 
 
-def _get_room_for_project(project_id: int) -> str:
+def get_room_for_project(project_id: int) -> str:
     """Create the chatting room's name."""
 
     return f"room:project:{project_id}"
@@ -0,0 +1,25 @@
+"""Service logic for metrics."""
+
+from typing import Dict
+
+from src.chat import blacklist, presence, push, rate_limiter, subscriber
+from src.chat.util.stream import coalescer
+
+
+def get_metrics() -> Dict:
+    """
+    Get the counters of the notifications, of the sockets and of the token blacklist, they are kept by each process.
+
+    :return: The metrics by component
+    """
+    return dict(
+        sse=subscriber.stats(),
+        webpush=dict(push.stats),
+        webpush_lanes=push.lane_stats(),
+        webpush_endpoints=push.endpoint_stats(),
+        webpush_breakers=push.breaker_stats(),
+        coalescer=dict(coalescer.stats),
+        presence=presence.stats(),
+        rate_limit=rate_limiter.stats(),
+        blacklist=blacklist.stats(),
+    )
@@ -0,0 +1,144 @@
+"""Service logic for the notifications inbox."""
+
+import json
+from typing import Dict, Optional
+
+from flask import current_app
+from werkzeug.exceptions import BadRequest
+
+from src.chat import redis
+from src.chat.util.script import LuaScript
+from src.chat.util.stream import REPLAY_ID, is_after, sub_inbox, sub_inbox_read, sub_inbox_unread, sub_user_channel
+
+# The number of notifications by page
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# KEYS: the inbox, the last notification read, the number unread. ARGV: the id read ('' for the latest), the TTL.
+# The read position moves forward to the id, the notifications after it are counted in Redis and the number unread
+# is returned.
+_READ = LuaScript("""
+local function is_after(id, other)
+    local ms, seq = string.match(id, '(%d+)-(%d+)')
+    local other_ms, other_seq = string.match(other, '(%d+)-(%d+)')
+    ms, other_ms = tonumber(ms), tonumber(other_ms)
+    return ms > other_ms or (ms == other_ms and tonumber(seq) > tonumber(other_seq))
+end
+local latest = redis.call('XREVRANGE', KEYS[1], '+', '-', 'COUNT', 1)
+if #latest == 0 then
+    return 0
+end
+local read = ARGV[1]
+if read == '' then
+    read = latest[1][1]
+end
+local last_read = redis.call('GET', KEYS[2])
+if last_read and not is_after(read, last_read) then
+    read = last_read
+else
+    redis.call('SET', KEYS[2], read, 'EX', ARGV[2])
+end
+local unread = 0
+if is_after(latest[1][1], read) then
+    local entries = redis.call('XRANGE', KEYS[1], read, '+')
+    unread = #entries
+    if entries[1][1] == read then
+        unread = unread - 1
+    end
+end
+redis.call('SET', KEYS[3], unread, 'EX', ARGV[2])
+return unread
+""")
+
+
+def get_notifications(user_id: int, before: str = None, limit: int = DEFAULT_LIMIT) -> Dict:
+    """
+    Get the latest notifications of the user, keyset paginated.
+
+    :param user_id: The user's id
+    :param before: The cursor, only the notifications older than this id are returned.
+    :param limit: The number of notifications.
+    :return: The notifications, the cursor of the next page and the number unread.
+    """
+    _validate(dict(before=before), limit)
+    channel = sub_user_channel(user_id)
+
+    # The cursor is included by XREVRANGE, one more entry to know if a next page exists
+    pipe = redis.pipeline(transaction=False)
+    pipe.xrevrange(sub_inbox(channel), max=before or '+', min='-', count=limit + 2)
+    pipe.get(sub_inbox_read(channel))
+    pipe.get(sub_inbox_unread(channel))
+    pipe.xlen(sub_inbox(channel))
+    entries, last_read, unread, length = pipe.execute()
+    last_read = last_read.decode('utf-8') if last_read else None
+
+    notifications = [_to_notification(event_id.decode('utf-8'), fields, last_read)
+                     for event_id, fields in entries if event_id.decode('utf-8') != before][:limit + 1]
+    has_next = len(notifications) > limit
+    notifications = notifications[:limit]
+
+    return dict(
+        unread=_count_unread(channel, last_read, unread, length),
+        has_next=has_next,
+        next=notifications[-1]['id'] if has_next else None,
+        data=notifications,
+    )
+
+
+def read_notifications(user_id: int, event_id: str = None) -> Dict:
+    """
+    Mark the notifications as read until the given one.
+
+    :param user_id: The user's id
+    :param event_id: The last notification read, the latest by default.
+    :return: The number unread.
+    """
+    _validate(dict(id=event_id))
+    channel = sub_user_channel(user_id)
+
+    # The read position only moves forward
+    unread = _READ(redis, keys=[sub_inbox(channel), sub_inbox_read(channel), sub_inbox_unread(channel)],
+                   args=[event_id or '', current_app.config['NOTIFICATION_INBOX_TTL']])
+
+    return dict(message='The notifications were read.', unread=unread)
+
+
+def _count_unread(channel: str, last_read: Optional[str], unread: Optional[bytes], length: int) -> int:
+    """
+    The number unread is counted by the inbox, the inbox is capped.
+
+    :param unread: The counter of the inbox, it is counted again without counter.
+    :param length: The number of notifications in the inbox.
+    """
+    if last_read is None:
+        return length
+    if unread is None:
+        return _READ(redis, keys=[sub_inbox(channel), sub_inbox_read(channel), sub_inbox_unread(channel)],
+                     args=[last_read, current_app.config['NOTIFICATION_INBOX_TTL']])
+    return min(int(unread), length)
+
+
+def _to_notification(event_id: str, fields: Dict, last_read: Optional[str]) -> Dict:
+    return dict(
+        id=event_id,
+        type=fields[b'type'].decode('utf-8') or None,
+        data=json.loads(fields[b'data']),
+        read=last_read is not None and not is_after(event_id, last_read),
+    )
+
+
+def _validate(ids: Dict[str, Optional[str]], limit: int = DEFAULT_LIMIT) -> None:
+    errors = dict()
+    for name, value in ids.items():
+        if value is not None and not REPLAY_ID.match(value):
+            errors[name] = f"'{name}' is the id of a notification."
+    if not 0 < limit <= MAX_LIMIT:
+        errors['limit'] = f"'limit' is between 1 and {MAX_LIMIT}."
+
+    if errors:
+        e = BadRequest()
+        e.data = dict(
+            errors=errors,
+            message='Input payload validation failed.'
+        )
+        raise e
@@ -7,14 +7,15 @@ from flask_restx import marshal
 from werkzeug.exceptions import Conflict, Forbidden, InternalServerError, BadRequest
 
 from src.chat import db
-from src.chat.dto.project_dto import project_item, user_item
+from src.chat.dto.project_dto import project_ref, user_ref
 from src.chat.model.pagination import Pagination
 from src.chat.model.project import Project, user_coaches_to_project, user_participates_of_project
 from src.chat.model.user import User
 from src.chat.service import save_data, insert_data, delete_data
-from src.chat.service.user_service import get_a_user, notify_one_user
+from src.chat.service.user_service import get_a_user, notify_one_user, notify_many_users
 from src.chat.util.constant import *
 from src.chat.util.pagination import paginate
+from src.chat.util.stream import close_project, follow_project, publish_project, unfollow_project
 
 
 def save_new_project(user_id: int, data: Dict) -> Project:
@@ -47,10 +48,10 @@ def save_new_project(user_id: int, data: Dict) -> Project:
     data = {'type': TYPE_NOTIFICATION_ADD_INTO_PROJECT,
             'message': f"'@{new_project.owner.username}' created a new project '{new_project.title}'. "
                        f"You are invited to join it.",
-            'data': marshal(new_project, project_item)}
-    notify_all_member_in_project(users_id=new_project.get_id_members(), data=data,
-                                 type_publish=TYPE_NOTIFICATION_ACTION_PROJECT,
-                                 exclude_users_id=[user_id])
+            'data': marshal(new_project, project_ref)}
+    members_id = new_project.get_id_members()
+    notify_many_users(list(set(members_id) - {user_id}), data, TYPE_NOTIFICATION_ACTION_PROJECT)
+    follow_project(members_id, new_project.id)
 
     return new_project
 
@@ -64,10 +65,7 @@ def get_all_projects(user_id: int, filter_by) -> Pagination:
     :return: Pagination for project
     """
 
-    query = Project.query.filter((Project.owner_id == user_id)
-                                 | (Project.coaches.any(User.id == user_id))
-                                 | (Project.participants.any(User.id == user_id))
-                                 )
+    query = Project.query.filter(_is_member(user_id))
 
     if filter_by:
         query = query.filter(Project.title.like(f'%{filter_by}%'))
@@ -75,6 +73,37 @@ def get_all_projects(user_id: int, filter_by) -> Pagination:
     return paginate(query)
 
 
+def get_id_projects(user_id: int) -> List[int]:
+    """
+    Get the ids of the user's projects.
+
+    :param user_id: The user's id
+    :return: The projects' id
+    """
+
+    return [project_id for project_id, in db.session.query(Project.id).filter(_is_member(user_id))]
+
+
+def _is_member(user_id: int):
+    return ((Project.owner_id == user_id)
+            | (Project.coaches.any(User.id == user_id))
+            | (Project.participants.any(User.id == user_id)))
+
+
+def get_a_project(user_id: int, id_project: int) -> Project:
+    """
+    Get the project of a member, the notifications refer to it.
+
+    :param user_id: The user's id
+    :param id_project: The project's id
+    :return: Project
+    """
+
+    project = get_project_item(id_project)
+    required_member_in_project(user_id=user_id, project=project)
+    return project
+
+
 def get_project_item(id_project: int) -> Project:
     """
     Find project with its id.
@@ -103,6 +132,7 @@ def update_project(user_id: int, id_project: int, data: Dict) -> Project:
 
     try:
         project.title = data['title']
+        project.version += 1
         db.session.commit()
 
     except Exception as e:
@@ -115,9 +145,9 @@ def update_project(user_id: int, id_project: int, data: Dict) -> Project:
         data = dict(
             type=TYPE_NOTIFICATION_EDIT_PROJECT,
             message=f"The title's project '{older_project_title}' become the new title '{project.title}'.",
-            data=dict(project_id=project.id, project_title=project.title)
+            data=dict(project_id=project.id, project_title=project.title, project_version=project.version)
         )
-        notify_all_member_in_project(users_id=project.get_id_members(), data=data,
+        notify_all_member_in_project(project_id=project.id, users_id=project.get_id_members(), data=data,
                                      type_publish=TYPE_NOTIFICATION_ACTION_PROJECT,
                                      exclude_users_id=[user_id])
 
@@ -149,8 +179,9 @@ def delete_project(user_id: int, id_project: int) -> Dict:
         message=f"The project '{older_project_title}' was removed by '@{owner_username}'.",
         data=dict(project_id=older_project_id, project_title=older_project_title),
     )
-    notify_all_member_in_project(users_id=members_id, data=data, type_publish=TYPE_NOTIFICATION_ACTION_PROJECT,
-                                 exclude_users_id=[owner_id])
+    notify_all_member_in_project(project_id=older_project_id, users_id=members_id, data=data,
+                                 type_publish=TYPE_NOTIFICATION_ACTION_PROJECT, exclude_users_id=[owner_id])
+    close_project(older_project_id)
 
     return dict(message='Your project was successfully removed.')
 
@@ -181,12 +212,14 @@ def invite_participant_into_project(user_id: int, id_project: int, data: Dict) -
         raise e
 
     insert_participants(id_project=project.id, participants=[data.get('participant')])
+    project.version += 1
+    save_data(project)
 
     # Notify to new participant
     data = dict(
         type=TYPE_NOTIFICATION_ADD_INTO_PROJECT,
         message=f"You was invited into the project '{project.title}'.",
-        data=marshal(project, project_item)
+        data=marshal(project, project_ref)
     )
     notify_one_user(user_id=participant.id, data=data, type_publish=TYPE_NOTIFICATION_ACTION_PROJECT)
 
@@ -194,11 +227,12 @@ def invite_participant_into_project(user_id: int, id_project: int, data: Dict) -
     data = dict(
         type=TYPE_NOTIFICATION_ADD_INTO_PROJECT,
         message=f"The new participant '@{participant.username}' was added into the project '{project.title}'.",
-        data=marshal(participant, user_item)
+        data=dict(marshal(participant, user_ref), project_id=project.id, project_version=project.version)
     )
-    notify_all_member_in_project(users_id=project.get_id_members(), data=data,
+    notify_all_member_in_project(project_id=project.id, users_id=project.get_id_members(), data=data,
                                  type_publish=TYPE_NOTIFICATION_ACTION_PROJECT,
                                  exclude_users_id=[user_id, participant.id])
+    follow_project([participant.id], project.id)
 
     return participant
 
@@ -230,6 +264,7 @@ def leave_from_project(user_id: int, id_project: int) -> Dict:
             project.coaches.remove(current_user)
         elif current_user in project.participants:
             project.participants.remove(current_user)
+        project.version += 1
 
         db.session.commit()
 
@@ -243,11 +278,13 @@ def leave_from_project(user_id: int, id_project: int) -> Dict:
         data = dict(
             type=TYPE_NOTIFICATION_EDIT_PROJECT,
             message=f"'@{current_user.username}' left the project'{project.title}'.",
-            data=dict(user_id=user_id, project_id=project.id, project_title=project.title)
+            data=dict(user_id=user_id, project_id=project.id, project_title=project.title,
+                      project_version=project.version)
         )
-        notify_all_member_in_project(users_id=project.get_id_members(), data=data,
+        notify_all_member_in_project(project_id=project.id, users_id=project.get_id_members(), data=data,
                                      type_publish=TYPE_NOTIFICATION_ACTION_PROJECT,
                                      exclude_users_id=[user_id])
+        unfollow_project([user_id], project.id)
 
     return dict(message='You left the project.')
 
@@ -288,6 +325,7 @@ def designate_coach_into_project(user_id: int, id_project: int, data: Dict) -> D
 
         # Add them into list coaches
         project.coaches.append(coach)
+        project.version += 1
 
         db.session.commit()
 
@@ -301,7 +339,7 @@ def designate_coach_into_project(user_id: int, id_project: int, data: Dict) -> D
         data = dict(
             type=TYPE_NOTIFICATION_EDIT_PROJECT,
             message=f"You was designated new coach in the project '{project.title}'.",
-            data=dict(project_id=project.id, project_title=project.title),
+            data=dict(project_id=project.id, project_title=project.title, project_version=project.version),
         )
         notify_one_user(user_id=coach.id, data=data, type_publish=TYPE_NOTIFICATION_ACTION_PROJECT)
 
@@ -309,9 +347,10 @@ def designate_coach_into_project(user_id: int, id_project: int, data: Dict) -> D
         data = dict(
             type=TYPE_NOTIFICATION_EDIT_PROJECT,
             message=f"'@{coach.username}' was designated new coach in the project '{project.title}'.",
-            data=dict(user_id=coach.id, project_id=project.id, project_title=project.title)
+            data=dict(user_id=coach.id, project_id=project.id, project_title=project.title,
+                      project_version=project.version)
         )
-        notify_all_member_in_project(users_id=project.get_id_members(), data=data,
+        notify_all_member_in_project(project_id=project.id, users_id=project.get_id_members(), data=data,
                                      type_publish=TYPE_NOTIFICATION_ACTION_PROJECT,
                                      exclude_users_id=[user_id, coach.id])
 
@@ -346,6 +385,7 @@ def withdraw_coach_in_project(user_id: int, id_project: int, data: Dict) -> Dict
 
         # Add them into list participant
         project.participants.append(coach)
+        project.version += 1
 
         db.session.commit()
 
@@ -359,7 +399,7 @@ def withdraw_coach_in_project(user_id: int, id_project: int, data: Dict) -> Dict
         data = dict(
             type=TYPE_NOTIFICATION_EDIT_PROJECT,
             message=f"You was withdrawn from coach in the project '{project.title}'.",
-            data=dict(project_id=project.id, project_title=project.title),
+            data=dict(project_id=project.id, project_title=project.title, project_version=project.version),
         )
         notify_one_user(user_id=coach.id, data=data, type_publish=TYPE_NOTIFICATION_ACTION_PROJECT)
 
@@ -367,9 +407,10 @@ def withdraw_coach_in_project(user_id: int, id_project: int, data: Dict) -> Dict
         data = dict(
             type=TYPE_NOTIFICATION_EDIT_PROJECT,
             message=f"'@{coach.username}' was withdrew from coach, he will be a participant the project'{project.title}'.",
-            data=dict(user_id=coach.id, project_id=project.id, project_title=project.title)
+            data=dict(user_id=coach.id, project_id=project.id, project_title=project.title,
+                      project_version=project.version)
         )
-        notify_all_member_in_project(users_id=project.get_id_members(), data=data,
+        notify_all_member_in_project(project_id=project.id, users_id=project.get_id_members(), data=data,
                                      type_publish=TYPE_NOTIFICATION_ACTION_PROJECT,
                                      exclude_users_id=[user_id, coach.id])
 
@@ -409,6 +450,7 @@ def remove_participant_in_project(user_id: int, id_project: int, data: Dict) ->
     try:
         # Remove them from list participants
         project.participants.remove(participant)
+        project.version += 1
         db.session.commit()
 
     except Exception as e:
@@ -421,7 +463,7 @@ def remove_participant_in_project(user_id: int, id_project: int, data: Dict) ->
         data = dict(
             type=TYPE_NOTIFICATION_EDIT_PROJECT,
             message=f"You was removed in the project '{project.title}'.",
-            data=dict(project_id=project.id, project_title=project.title),
+            data=dict(project_id=project.id, project_title=project.title, project_version=project.version),
         )
         notify_one_user(user_id=participant.id, data=data, type_publish=TYPE_NOTIFICATION_ACTION_PROJECT)
 
@@ -429,11 +471,13 @@ def remove_participant_in_project(user_id: int, id_project: int, data: Dict) ->
         data = dict(
             type=TYPE_NOTIFICATION_EDIT_PROJECT,
             message=f"'@{participant.username}' was removed in the project '{project.title}'.",
-            data=dict(user_id=participant.id, project_id=project.id, project_title=project.title)
+            data=dict(user_id=participant.id, project_id=project.id, project_title=project.title,
+                      project_version=project.version)
         )
-        notify_all_member_in_project(users_id=project.get_id_members(), data=data,
+        notify_all_member_in_project(project_id=project.id, users_id=project.get_id_members(), data=data,
                                      type_publish=TYPE_NOTIFICATION_ACTION_PROJECT,
                                      exclude_users_id=[user_id, participant.id])
+        unfollow_project([participant.id], project.id)
 
     return dict(message='You removed a participant.')
 
@@ -516,11 +560,10 @@ def is_participant(user_id: int, project: Project) -> bool:
     return any(user_id == user.id for user in project.participants)
 
 
-def notify_all_member_in_project(users_id: List[int], data, type_publish: str = None,
+def notify_all_member_in_project(project_id: int, users_id: List[int], data, type_publish: str = None,
                                  exclude_users_id: List[int] = None) -> None:
-    """Notify all the member in project."""
+    """Notify all the member in project, by one event on the project's channel."""
 
-    if exclude_users_id:
-        users_id = list(set(users_id) - set(exclude_users_id))
-    for user_id in users_id:
-        notify_one_user(user_id, data, type_publish)
+    exclude_users_id = exclude_users_id or []
+    users_id = list(set(users_id) - set(exclude_users_id))
+    publish_project(project_id, users_id, data, type_publish, exclude_users_id)
@@ -4,13 +4,13 @@ import json
 import random
 import string
 from http import HTTPStatus
-from typing import Dict, Tuple
+from typing import Dict, Tuple, List
 
 from flask import current_app
 from flask_mailman import EmailMultiAlternatives
-from werkzeug.exceptions import Conflict, InternalServerError, BadRequest
+from werkzeug.exceptions import Conflict, InternalServerError, BadRequest, NotFound
 
-from src.chat import db, redis
+from src.chat import db, redis, push
 from src.chat.model.pagination import Pagination
 from src.chat.model.push_subscription import PushSubscription
 from src.chat.model.user import User
@@ -19,7 +19,7 @@ from src.chat.service.auth_service import generate_token
 from src.chat.util.constant import TYPE_NOTIFICATION_ACTION_USER, TYPE_NOTIFICATION_ADMIN_USER, \
     TYPE_NOTIFICATION_ARCHIVE_USER
 from src.chat.util.pagination import paginate
-from src.chat.util.stream import sub_webpush, publish, sub_user_channel
+from src.chat.util.stream import sub_webpush, publish, publish_many, sub_user_channel
 
 STYLE_HTML = '''
 <style type="text/css">
@@ -178,50 +178,110 @@ def update_password_forgotten(email: str) -> Dict:
 
 
 def save_data_subscription_webpub(data: Dict, user_id: int) -> Dict:
-    """Save the client's key when he subscribe webpub."""
+    """Save the client's key when he subscribe webpub, each device of the user has its own key."""
 
-    push_subscription = PushSubscription.query.filter_by(user_id=user_id).first()
+    endpoint_hash = PushSubscription.hash_endpoint(data['endpoint'])
+    subscription_json = json.dumps(data, sort_keys=True)
+    channel = sub_webpush(sub_user_channel(user_id))
+
+    # The devices subscribe again at each login, the same key is not saved again
+    if redis.hget(channel, endpoint_hash) == subscription_json.encode('utf-8'):
+        return dict(message="Stored the client's key.")
+
+    push_subscription = PushSubscription.query.filter_by(endpoint_hash=endpoint_hash).first()
     if not push_subscription:
-        push_subscription = PushSubscription(
-            user_id=user_id,
-            subscription_json=json.dumps(data)
-        )
-        save_data(push_subscription)
+        save_data(PushSubscription(user_id=user_id, endpoint_hash=endpoint_hash, subscription_json=subscription_json))
     else:
+        previous_user_id = push_subscription.user_id
         try:
-            push_subscription.subscription_json = json.dumps(data)
+            push_subscription.user_id = user_id
+            push_subscription.subscription_json = subscription_json
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             current_app.logger.error(str(e), exc_info=True)
             raise InternalServerError("The server encountered an internal error and was unable to save your data.")
 
-    channel = sub_webpush(sub_user_channel(push_subscription.user_id))
-    redis.set(channel, push_subscription.subscription_json)
+        # Another user logged in on this device
+        if previous_user_id != user_id:
+            redis.hdel(sub_webpush(sub_user_channel(previous_user_id)), endpoint_hash)
+
+    redis.hset(channel, endpoint_hash, subscription_json)
 
     return dict(message="Stored the client's key.")
 
 
-def unsubscription_data_subscription_webpub(user_id: int) -> Dict:
-    """Delete the subscription webpub stored."""
+def unsubscription_data_subscription_webpub(user_id: int, endpoint: str = None) -> Dict:
+    """Delete the subscription webpub stored of one device, of all the user's devices by default."""
 
-    push_subscription = PushSubscription.query.filter_by(user_id=user_id) \
-        .first_or_404('Service Worker Key was not found.')
-    delete_data(push_subscription)
+    query = PushSubscription.query.filter_by(user_id=user_id)
+    if endpoint:
+        query = query.filter_by(endpoint_hash=PushSubscription.hash_endpoint(endpoint))
+    push_subscriptions = query.all()
+    if not push_subscriptions:
+        raise NotFound('Service Worker Key was not found.')
+    for push_subscription in push_subscriptions:
+        delete_data(push_subscription)
 
     channel = sub_webpush(sub_user_channel(user_id))
-    redis.delete(channel)
+    redis.hdel(channel, *[push_subscription.endpoint_hash for push_subscription in push_subscriptions])
 
     return dict(message="Unsubscribed the client's key.")
 
 
+@push.on_expired
+def delete_expired_subscription(subscription_info: Dict) -> None:
+    """Delete the subscription webpub that the push service answered is gone."""
+
+    endpoint_hash = PushSubscription.hash_endpoint(subscription_info.get('endpoint'))
+    push_subscription = PushSubscription.query.filter_by(endpoint_hash=endpoint_hash).first()
+    if push_subscription:
+        delete_data(push_subscription)
+        redis.hdel(sub_webpush(sub_user_channel(push_subscription.user_id)), endpoint_hash)
+
+
+def backfill_endpoint_hash() -> int:
+    """
+    Hash the endpoints of the subscriptions saved before the hash, only the latest subscription of a device is kept.
+
+    :return: The number of subscriptions hashed.
+    """
+
+    push_subscriptions = PushSubscription.query.filter(PushSubscription.endpoint_hash.is_(None)) \
+        .order_by(PushSubscription.id.desc()).all()
+    if not push_subscriptions:
+        return 0
+
+    hashed = {endpoint_hash for endpoint_hash, in db.session.query(PushSubscription.endpoint_hash)
+              .filter(PushSubscription.endpoint_hash.isnot(None))}
+    count = 0
+    try:
+        for push_subscription in push_subscriptions:
+            data = json.loads(push_subscription.subscription_json)
+            endpoint_hash = PushSubscription.hash_endpoint(data['endpoint']) if data.get('endpoint') else None
+            if endpoint_hash is None or endpoint_hash in hashed:
+                db.session.delete(push_subscription)
+                continue
+            hashed.add(endpoint_hash)
+            push_subscription.endpoint_hash = endpoint_hash
+            push_subscription.subscription_json = json.dumps(data, sort_keys=True)
+            count += 1
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(str(e), exc_info=True)
+        raise
+    return count
+
+
 def transfer_subscription_to_redis() -> None:
     """Transfer data subscription from db to redis."""
 
-    push_subscriptions = PushSubscription.query.all()
-    for push_subscription in push_subscriptions:
+    pipe = redis.pipeline(transaction=False)
+    for push_subscription in PushSubscription.query.all():
         channel = sub_webpush(sub_user_channel(push_subscription.user_id))
-        redis.set(channel, json.dumps(push_subscription.subscription_json))
+        pipe.hset(channel, push_subscription.endpoint_hash, push_subscription.subscription_json)
+    pipe.execute()
 
 
 def change_user_role(current_user_id: int, user_id: int, admin: bool = True) -> Dict:
@@ -302,8 +362,7 @@ def archive_user(current_user_id: int, user_id: int, archive: bool = True) -> Di
         if channels:
             redis.delete(*channels)
 
-        push_subscription = PushSubscription.query.filter_by(user_id=user_id).first()
-        if push_subscription:
+        for push_subscription in PushSubscription.query.filter_by(user_id=user_id).all():
             delete_data(push_subscription)
     else:
         try:
@@ -344,3 +403,15 @@ def notify_one_user(user_id: int, data, type_publish: str = None) -> None:
 
     channel = sub_user_channel(user_id)
     publish(channel, data, type_publish)
+
+
+def notify_many_users(users_id: List[int], data, type_publish: str = None) -> None:
+    """
+    Send the same notification to many users at once.
+
+    :param users_id: The receivers' id
+    :param data: The data want to be sent
+    :param type_publish: The event type.
+    """
+
+    publish_many(users_id, data, type_publish)
@@ -1,31 +1,104 @@
 """Service logic for socket."""
 
-import json
 from typing import List, Optional, Dict
 
-from flask import request
-
-from src.chat import redis
+from flask import current_app, request
+from werkzeug.exceptions import Unauthorized
+
+from src.chat import presence, redis
+from src.chat.util.presence import PRESENCE_PREFIX, SID_PREFIX
+from src.chat.util.script import LuaScript
+
+# Remove the sid from the user's sids in a presence hash, the number of his sids remaining is returned
+_REMOVE_SID = """
+local function remove_sid(key, user_id, sid)
+    local sids = redis.call('HGET', key, user_id)
+    if not sids then
+        return 0
+    end
+    local remaining = {}
+    for other in string.gmatch(sids, '%S+') do
+        if other ~= sid then
+            table.insert(remaining, other)
+        end
+    end
+    if #remaining == 0 then
+        redis.call('HDEL', key, user_id)
+    else
+        redis.call('HSET', key, user_id, table.concat(remaining, ' '))
+    end
+    return #remaining
+end
+"""
+
+# KEYS: the sid's hash, the room's presence hash. ARGV: the sid, the room, the presence prefix.
+# The user's id, the previous room of the sid and the number of the user's sids remaining there are returned, then 1
+# if the user was not online in the room, then the users online in the room. Nil is returned if the sid expired.
+_JOIN = LuaScript(_REMOVE_SID + """
+local user_id = redis.call('HGET', KEYS[1], 'user_id')
+if not user_id then
+    return nil
+end
+local previous = redis.call('HGET', KEYS[1], 'room')
+local remaining = 0
+if previous and previous ~= ARGV[2] then
+    remaining = remove_sid(ARGV[3] .. previous, user_id, ARGV[1])
+else
+    previous = ''
+end
+redis.call('HSET', KEYS[1], 'room', ARGV[2])
+
+local first = 0
+local sids = redis.call('HGET', KEYS[2], user_id)
+if not sids then
+    first = 1
+    redis.call('HSET', KEYS[2], user_id, ARGV[1])
+elseif not string.find(' ' .. sids .. ' ', ' ' .. ARGV[1] .. ' ', 1, true) then
+    redis.call('HSET', KEYS[2], user_id, sids .. ' ' .. ARGV[1])
+end
+local result = redis.call('HKEYS', KEYS[2])
+table.insert(result, 1, first)
+table.insert(result, 1, remaining)
+table.insert(result, 1, previous)
+table.insert(result, 1, user_id)
+return result
+""")
+
+# KEYS: the sid's hash. ARGV: the sid, the presence prefix, '1' to delete the sid.
+_LEAVE = LuaScript(_REMOVE_SID + """
+local user_id = redis.call('HGET', KEYS[1], 'user_id')
+local room = redis.call('HGET', KEYS[1], 'room')
+local remaining = 0
+if user_id and room then
+    remaining = remove_sid(ARGV[2] .. room, user_id, ARGV[1])
+    redis.call('HDEL', KEYS[1], 'room')
+end
+if ARGV[3] == '1' then
+    redis.call('DEL', KEYS[1])
+end
+return {user_id, room, remaining}
+""")
 
 
 def save_user_id_with_sid(user_id: int) -> None:
-    """Save the user's id with key user's sid in Redis."""
+    """Save the user's id with key user's sid in Redis, it expires if this worker stops refreshing it."""
 
-    data = dict(user_id=user_id)
-    redis.set(_get_sid_channel(), json.dumps(data))
+    pipe = redis.pipeline(transaction=False)
+    pipe.hset(_get_sid_channel(), 'user_id', user_id)
+    pipe.expire(_get_sid_channel(), current_app.config['PRESENCE_TTL'])
+    pipe.execute()
+    presence.track(request.sid)
 
 
 def delete_user_id_by_sid() -> Dict:
     """
-    Delete the data with key user's sid in Redis.
+    Delete the data with key user's sid in Redis, the user leaves his room.
 
     :return: Dict[user_id, sid, room]
     """
 
-    channel = _get_sid_channel()
-    data = redis.get(channel)
-    redis.delete(channel)
-    return _transfer_data(data)
+    presence.untrack(request.sid)
+    return user_leave_from_project(disconnect=True)
 
 
 def get_user_id_by_sid() -> Optional[int]:
@@ -35,86 +108,80 @@ def get_user_id_by_sid() -> Optional[int]:
     :return: None|user_id
     """
 
-    data = redis.get(_get_sid_channel())
-    if data:
-        data = _transfer_data(data)
-        return data.get('user_id')
-    return None
+    user_id = redis.hget(_get_sid_channel(), 'user_id')
+    return int(user_id) if user_id else None
 
 
-def get_sid_by_user_id_in_room(user_id: int, room: str) -> Optional[str]:
+def get_sids_by_user_id_in_room(user_id: int, room: str) -> List[str]:
     """
-    Get sid from user's id in his chatting room.
+    Get the sids of the user's sockets in his chatting room.
 
     :param user_id: The user's id
     :param room: The room's name
-    :return: None|sid
+    :return: The sids, empty if the user is offline
     """
 
-    data = redis.sscan(room, 0, f'*user_id*{user_id}*')[1]
-    return _transfer_data(data[len(data) - 1]).get('sid') if data else None
+    sids = redis.hget(_get_presence_key(room), user_id)
+    return sids.decode('utf-8').split(' ') if sids else []
+
+
+def get_room_for_user(room: str, user_id: int) -> str:
+    """The Socket.IO room of all the user's sockets in the chatting room."""
+
+    return f'{room}:user:{user_id}'
 
 
 def get_all_user_in_room(room: str) -> List:
     """Get all user online in room."""
 
-    return [_transfer_data(x) for x in redis.smembers(room)]
+    return [dict(user_id=int(user_id)) for user_id in redis.hkeys(_get_presence_key(room))]
 
 
-def user_join_into_project(room: str) -> List:
+def user_join_into_project(room: str) -> Dict:
     """
-    The user join in to project.
+    The user join in to project, he leaves his previous room.
 
     :param room: The room's name
-    :return: List user's id online in room
+    :return: Dict[user_id, online(list user's id online in room), first(his first socket in room), previous(the
+        previous room left), offline(his last socket left the previous room)]
+    :raise Unauthorized: The user's sid expired.
     """
 
-    data = json.dumps(
-        dict(
-            user_id=get_user_id_by_sid(),
-            sid=request.sid,
-            room=room
-        ),
-        sort_keys=True
-    )
-    redis.sadd(room, data)
-    redis.set(_get_sid_channel(), data)
+    result = _JOIN(redis, keys=[_get_sid_channel(), _get_presence_key(room)], args=[request.sid, room, PRESENCE_PREFIX])
+    if result is None:
+        e = Unauthorized()
+        e.data = dict(message='The socket is not authenticated anymore, reconnect.')
+        raise e
 
-    return [dict(user_id=x.get('user_id')) for x in get_all_user_in_room(room)]
+    user_id, previous, remaining, first, *users_id = result
+    previous = previous.decode('utf-8') or None
+    return dict(user_id=int(user_id), online=[dict(user_id=int(user_id)) for user_id in users_id], first=bool(first),
+                previous=previous, offline=bool(previous) and not remaining)
 
 
-def user_leave_from_project() -> Dict:
+def user_leave_from_project(disconnect: bool = False) -> Optional[Dict]:
     """
-    Delete the user's data by sid in Redis.
+    Delete the user's sid from his room in Redis.
 
-    :return: Dict[user_id, sid, room]
+    :param disconnect: True to also delete the user's sid.
+    :return: None|Dict[user_id, sid, room, offline(his last socket left the room)]
     """
 
-    channel = _get_sid_channel()
-    data = redis.get(channel)
-
-    # remove user's sid
-    redis.delete(channel)
-
-    if data:
-        data = _transfer_data(data)
-
-        # remove user's room
-        if data.get('room'):
-            redis.srem(data.get('room'), json.dumps(data, sort_keys=True))
-
-    return data
+    user_id, room, remaining = _LEAVE(redis, keys=[_get_sid_channel()],
+                                       args=[request.sid, PRESENCE_PREFIX, '1' if disconnect else '0'])
+    if not user_id:
+        return None
+    return dict(user_id=int(user_id), sid=request.sid, room=room.decode('utf-8') if room else None,
+                offline=bool(room) and not remaining)
 
 
 def _get_sid_channel() -> str:
     """Create channel sid in Redis."""
 
-    return f'sid:{request.sid}'
+    return f'{SID_PREFIX}{request.sid}'
 
 
-def _transfer_data(data) -> Dict:
-    """Transfer data into form type Dict"""
+def _get_presence_key(room: str) -> str:
+    """Create the key of the presence hash of the room."""
 
-    if isinstance(data, bytes):
-        data = data.decode("utf-8")
-    return json.loads(data)
+    return f'{PRESENCE_PREFIX}{room}'
@@ -0,0 +1,332 @@
+"""The SSE streams served by asyncio, one coroutine per stream instead of one thread."""
+
+import asyncio
+import json
+import uuid
+from typing import Dict, Iterable, List, Optional, Set
+from urllib.parse import parse_qs
+
+from redis import asyncio as aioredis
+from redis.exceptions import ConnectionError, TimeoutError
+from werkzeug.exceptions import HTTPException
+
+from src.chat.service.auth_service import decode_auth_token
+from src.chat.service.project_service import get_id_projects
+from src.chat.util.script import LuaScript
+from src.chat.util.stream import HEARTBEAT, REPLAY_ID, merge_replay, sub_project_channel, sub_replay, sub_sse, \
+    sub_user_channel
+from src.chat.util.subscriber import FOLLOW, OVERFLOW_DROP_OLDEST, OVERFLOWS, UNFOLLOW, UNMARK, StreamClient, \
+    mark_channel, parse_control, sub_workers
+
+# The path of the stream, the same as the Flask endpoint
+STREAM_PATH = '/api/v1/users/stream'
+
+# Registered on the asyncio client
+_UNMARK = LuaScript(UNMARK)
+
+
+class AsyncStreamClient(StreamClient):
+    """
+    One SSE stream waiting in the event loop, with the same bounded queue and overflow policy as StreamClient.
+    """
+
+    __slots__ = ('_event',)
+
+    def __init__(self, channel: str, maxsize: int = 0, overflow: str = OVERFLOW_DROP_OLDEST):
+        super().__init__(channel, maxsize, overflow)
+        self._event = asyncio.Event()
+
+    def put(self, data) -> int:
+        dropped = self._push(data)
+        self._event.set()
+        return dropped
+
+    async def get(self, timeout: float = None):
+        """
+        Wait the next message of the channel.
+
+        :return: The message's data, None after the timeout or StreamClient.CLOSE if the stream is closed.
+        """
+        if not self._messages:
+            self._event.clear()
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._messages.popleft() if self._messages else None
+
+
+class AsyncStreamSubscriber(object):
+    """
+    Hold one `redis.asyncio` pubsub connection for the event loop and route the messages to the streams.
+
+    The channels are subscribed when their first stream is opened and unsubscribed when their last stream is closed,
+    the shared channels are followed as with StreamSubscriber. The marker keys have the same TTL as with
+    StreamSubscriber and are refreshed every heartbeat.
+    """
+
+    def __init__(self, logger, redis_url: str, heartbeat: float, idle_timeout: int, queue_size: int,
+                 overflow: str):
+        if overflow not in OVERFLOWS:
+            raise ValueError(f"SSE_OVERFLOW must be one of {', '.join(OVERFLOWS)}.")
+        self.logger = logger
+        self.redis_url = redis_url
+        self.heartbeat = heartbeat
+        self.idle_timeout = idle_timeout
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.redis = None
+        self._pubsub = None
+        self._clients: Dict[str, Set[AsyncStreamClient]] = dict()
+        self._tasks = []
+        self.dropped = 0
+        self.disconnected = 0
+        self.control_channel = f'sse:subscriber:{uuid.uuid4().hex}'
+
+    async def start(self) -> None:
+        self.redis = aioredis.from_url(self.redis_url)
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.control_channel)
+        self._tasks = [asyncio.ensure_future(self._run()), asyncio.ensure_future(self._refresh())]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await self._pubsub.close()
+        await self.redis.close()
+
+    async def open(self, channel: str, follows: Iterable[str] = ()) -> AsyncStreamClient:
+        """
+        Open a stream on the channel and mark the existence of the channel.
+
+        :param channel: The SSE channel.
+        :param follows: The shared SSE channels followed by the stream.
+        """
+        client = AsyncStreamClient(channel, self.queue_size, self.overflow)
+        subscribed = [name for name in (channel, *follows) if self._add(client, name)]
+        if subscribed:
+            await self._pubsub.subscribe(*subscribed)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            mark_channel(pipe, channel, self.control_channel, self.idle_timeout)
+            await pipe.execute()
+        return client
+
+    async def close(self, client: AsyncStreamClient) -> None:
+        """Close the stream, the channel is removed with its last stream in all the workers."""
+        client.closed = True
+        if client not in self._clients.get(client.channel, ()):
+            return
+        unsubscribed = [name for name in (client.channel, *client.follows) if self._remove(client, name)]
+        if unsubscribed:
+            await self._pubsub.unsubscribe(*unsubscribed)
+        if client.channel in unsubscribed:
+            await _UNMARK(self.redis, keys=[client.channel, sub_workers(client.channel)], args=[self.control_channel])
+
+    def _add(self, client: AsyncStreamClient, channel: str) -> bool:
+        clients = self._clients.setdefault(channel, set())
+        clients.add(client)
+        if channel != client.channel:
+            client.follows.add(channel)
+        return len(clients) == 1
+
+    def _remove(self, client: AsyncStreamClient, channel: str) -> bool:
+        clients = self._clients.get(channel)
+        if clients is None or client not in clients:
+            return False
+        clients.discard(client)
+        if channel != client.channel:
+            client.follows.discard(channel)
+        if clients:
+            return False
+        del self._clients[channel]
+        return True
+
+    async def _control(self, control: bytes, channel: str, other: str) -> None:
+        clients = list(self._clients.get(channel, ()))
+        if control == FOLLOW:
+            if [client for client in clients if not client.closed and self._add(client, other)]:
+                await self._pubsub.subscribe(other)
+        elif control == UNFOLLOW:
+            if [client for client in clients if self._remove(client, other)]:
+                await self._pubsub.unsubscribe(other)
+
+    def _streams(self) -> List[AsyncStreamClient]:
+        return [client for channel, clients in self._clients.items() for client in clients
+                if client.channel == channel]
+
+    def stats(self) -> Dict[str, int]:
+        depths = [len(client) for client in self._streams()]
+        return dict(channels=len(self._clients),
+                    streams=len(depths),
+                    queued=sum(depths),
+                    max_queued=max(depths, default=0),
+                    dropped=self.dropped,
+                    disconnected=self.disconnected,
+                    connections=1 if self._pubsub is not None else 0)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+                if not message or message['type'] != 'message':
+                    continue
+                channel = message['channel'].decode('utf-8')
+                control, channels, frame = parse_control(message['data'])
+                if control in (FOLLOW, UNFOLLOW):
+                    await self._control(control, channel, channels[0])
+                    continue
+                for client in [client for client in self._clients.get(channel, ()) if client.channel not in channels]:
+                    dropped = client.put(frame)
+                    if dropped:
+                        self.dropped += dropped
+                        if client.closed:
+                            self.disconnected += 1
+                            await self.close(client)
+            except (ConnectionError, TimeoutError) as e:
+                # The pubsub subscribes again all the channels at the next connection
+                self.logger.error(str(e))
+                await asyncio.sleep(1)
+            except Exception as e:
+                self.logger.error(str(e), exc_info=True)
+
+    async def _refresh(self) -> None:
+        """Refresh the TTL of the markers of the channels alive."""
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            channels = {client.channel for client in self._streams()}
+            if not channels:
+                continue
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for channel in channels:
+                        mark_channel(pipe, channel, self.control_channel, self.idle_timeout)
+                    await pipe.execute()
+            except Exception as e:
+                self.logger.error(str(e), exc_info=True)
+
+
+class SSEApplication(object):
+    """
+    The ASGI application of the SSE stream `GET /api/v1/users/stream?token=<JWT>`.
+
+    It serves the same frames as the Flask endpoint: the token is validated by `decode_auth_token` of the Flask
+    application, the stream follows the channels of the user's projects and the events missed are replayed after the
+    header 'Last-Event-ID' in durable mode.
+    Run it with `uvicorn sse:app`.
+    """
+
+    def __init__(self, app):
+        """
+        :param app: The Flask application, for its config and the validation of the tokens.
+        """
+        self.app = app
+        self.heartbeat = app.config['SSE_HEARTBEAT']
+        self.durable = app.config['SSE_DURABLE']
+        self.replay_maxlen = app.config['SSE_REPLAY_MAXLEN']
+        self.subscriber = AsyncStreamSubscriber(app.logger, app.config['REDIS_URL'], self.heartbeat,
+                                                app.config['SSE_IDLE_TIMEOUT'], app.config['SSE_QUEUE_SIZE'],
+                                                app.config['SSE_OVERFLOW'])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            if scope['path'].rstrip('/') != STREAM_PATH:
+                await _respond(send, 404, 'The requested URL was not found on the server.')
+            elif scope['method'] != 'GET':
+                await _respond(send, 405, 'The method is not allowed for the requested URL.')
+            else:
+                await self._stream(scope, receive, send)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.subscriber.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.subscriber.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _stream(self, scope, receive, send) -> None:
+        token = parse_qs(scope['query_string'].decode('utf-8')).get('token', [None])[0]
+        if not token:
+            await _respond(send, 400, "User's Token!")
+            return
+        try:
+            # The blacklist and the projects are read in the database, outside the event loop
+            user_id, project_ids = await asyncio.get_event_loop().run_in_executor(None, self._authenticate, token)
+        except HTTPException as e:
+            await _respond(send, e.code, e.description)
+            return
+
+        last_event_id = _header(scope, b'last-event-id')
+        if not (last_event_id and self.durable and REPLAY_ID.match(last_event_id)):
+            last_event_id = None
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+                        (b'x-accel-buffering', b'no'), (b'access-control-allow-origin', b'*')],
+        })
+
+        channel = sub_sse(sub_user_channel(user_id))
+        follows = [sub_sse(sub_project_channel(project_id)) for project_id in project_ids]
+        client = await self.subscriber.open(channel, follows)
+        disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+        disconnected.add_done_callback(lambda _: client.put(StreamClient.CLOSE))
+        try:
+            # Subscribed before the replay, the live events already replayed are skipped
+            replayed = set()
+            if last_event_id:
+                for _, frame in await self._replay(channel, follows, last_event_id):
+                    replayed.add(frame)
+                    await send({'type': 'http.response.body', 'body': frame, 'more_body': True})
+
+            while True:
+                data = await client.get(timeout=self.heartbeat)
+                if data is StreamClient.CLOSE:
+                    break
+                if data is None:
+                    replayed.clear()
+                elif data in replayed:
+                    continue
+                await send({'type': 'http.response.body', 'body': data or HEARTBEAT, 'more_body': True})
+        finally:
+            disconnected.cancel()
+            await self.subscriber.close(client)
+        await send({'type': 'http.response.body', 'body': b''})
+
+    def _authenticate(self, token: str):
+        with self.app.app_context():
+            user_id, _ = decode_auth_token(token)
+            return user_id, get_id_projects(user_id)
+
+    async def _replay(self, channel: str, follows: List[str], last_event_id: str):
+        """The frames of the channel and of the channels followed after the last event received by the client."""
+        async with self.subscriber.redis.pipeline(transaction=False) as pipe:
+            for name in (channel, *follows):
+                pipe.xrange(sub_replay(name), min=last_event_id, max='+', count=self.replay_maxlen + 1)
+            results = await pipe.execute()
+        return merge_replay(channel, results, last_event_id)
+
+
+async def _wait_disconnect(receive) -> None:
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _respond(send, status: int, message: str) -> None:
+    """Answer the error in the same format as flask-restx."""
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'access-control-allow-origin', b'*')]})
+    await send({'type': 'http.response.body', 'body': json.dumps(dict(message=message)).encode('utf-8')})
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
@@ -0,0 +1,134 @@
+"""The revoked tokens, shared by all the processes through Redis."""
+
+import math
+import threading
+import time
+from typing import Callable, Dict, List
+
+from redis.exceptions import ConnectionError, TimeoutError
+
+from src.chat.util.bloom import BloomFilter
+
+# The key of a revoked token, it expires with the token
+BLACKLIST_PREFIX = 'blacklist:token:'
+# The revocations are published on this channel
+BLACKLIST_CHANNEL = 'blacklist:revoked'
+
+
+class TokenBlacklist(object):
+    """
+    The revoked tokens: one Redis key per token, with a TTL until the expiration of the token.
+
+    Most tokens are not revoked, a Bloom filter of the revoked tokens answers them in the process without Redis.
+    The filter is loaded from Redis, then follows the revocations of all the processes by pub/sub. It is rebuilt
+    periodically to forget the expired tokens, and Redis is asked while the subscription is down.
+    """
+
+    def __init__(self, app=None, redis=None):
+        self.redis = None
+        self._pubsub = None
+        self._bloom = None
+        self._synced = False
+        self._rebuild_at = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._listeners: List[Callable[[str], None]] = []
+        self.filtered = 0
+        self.lookups = 0
+        if app is not None:
+            self.init_app(app, redis)
+
+    def init_app(self, app, redis) -> None:
+        self.logger = app.logger
+        self.redis = redis
+        self.capacity = app.config['BLACKLIST_BLOOM_CAPACITY']
+        self.error_rate = app.config['BLACKLIST_BLOOM_ERROR_RATE']
+        self.rebuild = app.config['BLACKLIST_BLOOM_REBUILD']
+        app.extensions['blacklist'] = self
+
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        """The listener is called with the hash of each token revoked, in this process or in another."""
+        self._listeners.append(listener)
+
+    def revoke(self, token_hash: str, expire_at: float) -> None:
+        """
+        Revoke the token until its expiration.
+
+        :param token_hash: The hash of the token.
+        :param expire_at: The expiration of the token, a timestamp.
+        """
+        ttl = int(math.ceil(expire_at - time.time()))
+        if ttl <= 0:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(BLACKLIST_PREFIX + token_hash, 1, ex=ttl)
+        pipe.publish(BLACKLIST_CHANNEL, token_hash)
+        pipe.execute()
+        # Added now for this process, the others add it when the revocation is received
+        if self._bloom is not None:
+            self._bloom.add(token_hash)
+        self._notify(token_hash)
+
+    def is_revoked(self, token_hash: str) -> bool:
+        """Check whether the token is revoked, Redis is asked only if the filter may contain it."""
+        self._start()
+        bloom = self._bloom
+        if self._synced and token_hash not in bloom:
+            self.filtered += 1
+            return False
+        self.lookups += 1
+        return self.redis.exists(BLACKLIST_PREFIX + token_hash) > 0
+
+    def stats(self) -> Dict:
+        return dict(synced=self._synced, revoked=len(self._bloom) if self._bloom is not None else 0,
+                    filtered=self.filtered, lookups=self.lookups)
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                # Subscribed before the load, no revocation is missed
+                self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                self._pubsub.subscribe(BLACKLIST_CHANNEL)
+                self._load()
+                self._thread = threading.Thread(target=self._run, name='token-blacklist', daemon=True)
+                self._thread.start()
+
+    def _load(self) -> None:
+        """Build a new filter with the tokens revoked in Redis."""
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        for key in self.redis.scan_iter(match=BLACKLIST_PREFIX + '*', count=1000):
+            bloom.add(key.decode('utf-8')[len(BLACKLIST_PREFIX):])
+        self._bloom = bloom
+        self._rebuild_at = time.monotonic() + self.rebuild
+        self._synced = True
+
+    def _run(self) -> None:
+        while True:
+            try:
+                if time.monotonic() >= self._rebuild_at:
+                    self._load()
+                message = self._pubsub.get_message(timeout=1.0)
+                if message and message['type'] == 'message':
+                    token_hash = message['data'].decode('utf-8')
+                    self._bloom.add(token_hash)
+                    self._notify(token_hash)
+            except (ConnectionError, TimeoutError) as e:
+                # The revocations published meanwhile are lost, the filter is loaded again after the reconnection
+                self._synced = False
+                self.logger.error(str(e))
+                self._reconnect()
+            except Exception as e:
+                self.logger.error(str(e), exc_info=True)
+
+    def _notify(self, token_hash: str) -> None:
+        for listener in self._listeners:
+            listener(token_hash)
+
+    def _reconnect(self) -> None:
+        try:
+            self._pubsub.connection.connect()
+            self._rebuild_at = 0.0
+        except (ConnectionError, TimeoutError):
+            time.sleep(1)
@@ -0,0 +1,44 @@
+"""Bloom filter: a set of strings without false negative, with a bounded rate of false positives."""
+
+import hashlib
+import math
+import threading
+
+
+class BloomFilter(object):
+    """
+    A fixed size Bloom filter.
+
+    The bits of an item are chosen by double hashing of its sha256, the size and the number of hashes are computed
+    from the expected number of items and the false positive rate.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        """
+        :param capacity: The number of items expected.
+        :param error_rate: The false positive rate with `capacity` items.
+        """
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[i >> 3] & (1 << (i & 7)) for i in self._indexes(item))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, item: str) -> None:
+        indexes = list(self._indexes(item))
+        with self._lock:
+            for i in indexes:
+                self._bits[i >> 3] |= 1 << (i & 7)
+            self.count += 1
+
+    def _indexes(self, item: str):
+        digest = hashlib.sha256(item.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
@@ -0,0 +1,89 @@
+"""Circuit breaker around a remote service."""
+
+import threading
+import time
+from typing import Dict
+
+
+class CircuitBreaker(object):
+    """
+    Stop calling a remote service after consecutive failures.
+
+    The breaker opens after `threshold` consecutive failures, the calls are refused during `reset_timeout` seconds,
+    then one call probes the service (half-open): its success closes the breaker, its failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30):
+        """
+        :param threshold: The number of consecutive failures which opens the breaker.
+        :param reset_timeout: The time in seconds before probing the service again.
+        """
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = 0
+        self._state = CircuitBreaker.CLOSED
+        self._opened_at = 0.0
+        self._probe_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def allow(self) -> bool:
+        """Ask to call the service, only one call at a time probes it when the breaker is half-open."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+            if state == CircuitBreaker.CLOSED:
+                return True
+            # A probe lost without result does not block the breaker
+            if state == CircuitBreaker.HALF_OPEN and (self._probe_at is None or
+                                                      now - self._probe_at > self.reset_timeout):
+                self._probe_at = now
+                return True
+            return False
+
+    def retry_in(self) -> float:
+        """The time in seconds before the service can be called again, after the probe in flight if half-open."""
+        now = time.monotonic()
+        with self._lock:
+            if self._current_state(now) == CircuitBreaker.HALF_OPEN and self._probe_at is not None:
+                # The probe is answered or considered lost by then
+                remaining = self._probe_at + self.reset_timeout - now
+            else:
+                remaining = self._opened_at + self.reset_timeout - now
+        return max(remaining, 0.1)
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._state = CircuitBreaker.CLOSED
+            self._probe_at = None
+
+    def failure(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self.failures += 1
+            state = self._current_state(now)
+            if state == CircuitBreaker.HALF_OPEN or (state == CircuitBreaker.CLOSED and
+                                                    self.failures >= self.threshold):
+                self._state = CircuitBreaker.OPEN
+                self._opened_at = now
+                self._probe_at = None
+                self.opened += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(state=self._current_state(time.monotonic()), failures=self.failures, opened=self.opened)
+
+    def _current_state(self, now: float) -> str:
+        if self._state == CircuitBreaker.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = CircuitBreaker.HALF_OPEN
+        return self._state
@@ -0,0 +1,137 @@
+"""Coalescing of the notifications sent in a burst."""
+
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+# digest(data of the first notification merged, number of notifications merged) -> data of the summary
+Digest = Callable[[Dict, int], Dict]
+
+
+class _Bucket(object):
+    """The window of one user in one project for one type, with the notifications which followed the first one."""
+
+    def __init__(self, digest: Digest, deadline: float):
+        self.data = None
+        self.digest = digest
+        self.deadline = deadline
+        self.count = 0
+
+
+class NotificationCoalescer(object):
+    """
+    Merge the notifications for the same (user, project, type) which follow another one during a window.
+
+    The first notification is published directly and opens the window, the notifications received during the window
+    are published at its end, alone or merged into one summary. The buckets are flushed by a timer thread. With a
+    window of 0, all the notifications are published directly.
+    """
+
+    def __init__(self, publish: Callable[[List[int], Dict, str], None], app=None):
+        """
+        :param publish: The function publish_many(users_id, data, type).
+        """
+        self.publish = publish
+        self.app = None
+        self._buckets = dict()
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = dict(received=0, published=0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.app = app
+        app.extensions['coalescer'] = self
+
+    @property
+    def window(self) -> float:
+        return self.app.config['NOTIFICATION_COALESCE_WINDOW'] if self.app else 0
+
+    def add(self, users_id: List[int], project_id: int, type_publish: str, data: Dict, digest: Digest) -> None:
+        """
+        Add one notification for many users.
+
+        :param users_id: The receivers' id
+        :param project_id: The project's id of the notification
+        :param type_publish: The event type.
+        :param data: The data of this notification, it is sent alone if no other notification is merged with it.
+        :param digest: The function to summarize many notifications.
+        """
+        window = self.window
+        if not window:
+            self.publish(users_id, data, type_publish)
+            return
+
+        self._start()
+        deadline = time.monotonic() + window
+        first = []
+        with self._cond:
+            self.stats['received'] += len(users_id)
+            for user_id in users_id:
+                key = (user_id, project_id, type_publish)
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    self._buckets[key] = _Bucket(digest, deadline)
+                    first.append(user_id)
+                    continue
+                if bucket.data is None:
+                    bucket.data = data
+                bucket.count += 1
+            self.stats['published'] += len(first)
+            self._cond.notify()
+        if first:
+            self.publish(first, data, type_publish)
+
+    def flush(self, everything: bool = True) -> None:
+        """
+        Publish the buckets.
+
+        :param everything: False to publish only the buckets whose window is over.
+        """
+        now = time.monotonic()
+        with self._cond:
+            due = [(key, bucket) for key, bucket in self._buckets.items() if everything or bucket.deadline <= now]
+            for key, _ in due:
+                del self._buckets[key]
+        if due:
+            with self.app.app_context():
+                for (data, type_publish), users_id in _group(due).items():
+                    self.publish(users_id, json.loads(data), type_publish)
+                    with self._cond:
+                        self.stats['published'] += len(users_id)
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='notification-coalescer', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._buckets:
+                    self._cond.wait()
+                wait = min(bucket.deadline for bucket in self._buckets.values()) - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+            try:
+                self.flush(everything=False)
+            except Exception as e:
+                self.app.logger.error(str(e), exc_info=True)
+
+
+def _group(buckets: List[Tuple[Tuple, _Bucket]]) -> Dict[Tuple[str, str], List[int]]:
+    """Group the users who receive the same data, to publish it once for all of them."""
+    groups = dict()
+    for (user_id, _, type_publish), bucket in buckets:
+        # Nothing followed the first notification
+        if not bucket.count:
+            continue
+        data = bucket.data if bucket.count == 1 else bucket.digest(bucket.data, bucket.count)
+        groups.setdefault((json.dumps(data, sort_keys=True), type_publish), []).append(user_id)
+    return groups
@@ -10,3 +10,14 @@ TYPE_NOTIFICATION_NEW_MESSAGE = 'new_message'
 TYPE_NOTIFICATION_ACTION_USER = 'action_user'
 TYPE_NOTIFICATION_ADMIN_USER = 'admin_user'
 TYPE_NOTIFICATION_ARCHIVE_USER = 'archive_user'
+
+# Webpush: the notifications are sent by lanes, each lane has its own queue and workers
+PUSH_LANE_HIGH = 'high'
+PUSH_LANE_LOW = 'low'
+# Webpush: the lane, the header Urgency and the TTL (seconds) of each type of notification
+PUSH_OPTIONS = {
+    TYPE_NOTIFICATION_ACTION_MESSAGE: dict(lane=PUSH_LANE_HIGH, urgency='high', ttl=60 * 60),
+    TYPE_NOTIFICATION_ACTION_PROJECT: dict(lane=PUSH_LANE_LOW, urgency='normal', ttl=24 * 60 * 60),
+    TYPE_NOTIFICATION_ACTION_USER: dict(lane=PUSH_LANE_LOW, urgency='normal', ttl=24 * 60 * 60),
+}
+PUSH_OPTIONS_DEFAULT = dict(lane=PUSH_LANE_LOW, urgency='low', ttl=24 * 60 * 60)
@@ -3,6 +3,7 @@ from functools import wraps
 from flask import request
 from werkzeug.exceptions import Forbidden
 
+from src.chat import rate_limiter
 from src.chat.service.auth_service import decode_auth_token, decode_auth_admin_token
 
 
@@ -38,6 +39,21 @@ def admin_token_required(f):
     return decorated
 
 
+def rate_limited(f):
+    """Execute the socket event if the rate limit allows it, else the rejection is returned in the ack."""
+    event = f.__name__[len('on_'):]
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        retry_after = rate_limiter.take(request.sid, event)
+        if retry_after:
+            return dict(message='Too many requests.', retry_after=round(retry_after, 3))
+
+        return f(*args, **kwargs)
+
+    return decorated
+
+
 def _get_auth_token() -> str:
     """Access the headers from the current request"""
     auth_header = request.headers.get('Authorization')
@@ -0,0 +1,56 @@
+"""The Socket.IO message queue between the workers, in MessagePack instead of pickle."""
+
+import logging
+import pickle
+
+import msgpack
+import redis
+from socketio import RedisManager
+
+logger = logging.getLogger('socketio')
+
+
+class MsgPackRedisManager(RedisManager):
+    """
+    The Redis message queue of Socket.IO with the messages in MessagePack.
+
+    A message which cannot be packed (data which is not JSON-like or several arguments) is still pickled, the queue
+    reads both.
+    """
+
+    def _publish(self, data):
+        retry = True
+        while True:
+            try:
+                if not retry:
+                    self._redis_connect()
+                return self.redis.publish(self.channel, encode(data))
+            except redis.exceptions.RedisError:
+                if retry:
+                    logger.error('Cannot publish to redis... retrying')
+                    retry = False
+                else:
+                    logger.error('Cannot publish to redis... giving up')
+                    break
+
+    def _listen(self):
+        for message in super()._listen():
+            yield decode(message)
+
+
+def encode(data) -> bytes:
+    # The tuple of the arguments of an emit would be unpacked as one list argument
+    if isinstance(data.get('data'), tuple):
+        return pickle.dumps(data)
+    try:
+        return msgpack.packb(data, use_bin_type=True)
+    except (TypeError, ValueError, OverflowError):
+        return pickle.dumps(data)
+
+
+def decode(message: bytes):
+    """The message unpacked, a pickled message is returned unchanged to be unpickled by the manager."""
+    try:
+        return msgpack.unpackb(message, raw=False)
+    except (ValueError, msgpack.UnpackException):
+        return message
@@ -0,0 +1,142 @@
+"""The presence of the sockets in the rooms, kept alive by the workers which hold the sockets."""
+
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Set
+
+from src.chat.util.script import LuaScript
+
+# The hash of a socket: the user's id and his room, it expires if its worker stops refreshing it
+SID_PREFIX = 'sid:'
+# The presence hash of a room: the user's id -> his sids separated by a space, a user is online in the room while
+# one of his sids remains
+PRESENCE_PREFIX = 'presence:'
+# Only one worker sweeps the rooms at a time
+SWEEP_LOCK = 'presence:sweep:lock'
+
+# KEYS: the room's presence hash. ARGV: the sid prefix.
+# Remove the sids expired from the room, the users without sid left are returned.
+_SWEEP = LuaScript("""
+local offline = {}
+local fields = redis.call('HGETALL', KEYS[1])
+for i = 1, #fields, 2 do
+    local alive = {}
+    local count = 0
+    for sid in string.gmatch(fields[i + 1], '%S+') do
+        count = count + 1
+        if redis.call('EXISTS', ARGV[1] .. sid) == 1 then
+            table.insert(alive, sid)
+        end
+    end
+    if #alive == 0 then
+        redis.call('HDEL', KEYS[1], fields[i])
+        table.insert(offline, fields[i])
+    elseif #alive < count then
+        redis.call('HSET', KEYS[1], fields[i], table.concat(alive, ' '))
+    end
+end
+return offline
+""")
+
+
+class PresenceKeeper(object):
+    """
+    Keep alive the sockets of this worker and sweep the sockets of the workers stopped.
+
+    The hash of each socket expires after `PRESENCE_TTL` seconds, the worker refreshes the hashes of its sockets every
+    `PRESENCE_HEARTBEAT` seconds. If the worker crashes, its hashes expire and the sweeper removes their sids from the
+    rooms every `PRESENCE_SWEEP` seconds, the listeners are called with the users gone offline.
+    """
+
+    def __init__(self, app=None, redis=None):
+        self.redis = None
+        self._sids: Set[str] = set()
+        self._listeners: List[Callable[[str, List[int]], None]] = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self.swept = 0
+        if app is not None:
+            self.init_app(app, redis)
+
+    def init_app(self, app, redis) -> None:
+        self.logger = app.logger
+        self.redis = redis
+        self.ttl = app.config['PRESENCE_TTL']
+        self.heartbeat = app.config['PRESENCE_HEARTBEAT']
+        self.sweep_interval = app.config['PRESENCE_SWEEP']
+        app.extensions['presence'] = self
+
+    def add_listener(self, listener: Callable[[str, List[int]], None]) -> None:
+        """The listener is called with a room and its users gone offline after a sweep."""
+        self._listeners.append(listener)
+
+    def track(self, sid: str) -> None:
+        """The socket is held by this worker, its hash is refreshed until `untrack`."""
+        self._start()
+        with self._lock:
+            self._sids.add(sid)
+
+    def untrack(self, sid: str) -> None:
+        with self._lock:
+            self._sids.discard(sid)
+
+    def refresh(self) -> int:
+        """
+        Refresh the TTL of the hashes of the sockets of this worker.
+
+        :return: The number of sockets.
+        """
+        with self._lock:
+            sids = list(self._sids)
+        if sids:
+            pipe = self.redis.pipeline(transaction=False)
+            for sid in sids:
+                pipe.expire(SID_PREFIX + sid, self.ttl)
+            pipe.execute()
+        return len(sids)
+
+    def sweep(self) -> Dict[str, List[int]]:
+        """
+        Remove the sids expired from all the rooms.
+
+        :return: The users gone offline in each room.
+        """
+        offline = dict()
+        for key in self.redis.scan_iter(match=PRESENCE_PREFIX + 'room:*', count=1000):
+            users_id = _SWEEP(self.redis, keys=[key], args=[SID_PREFIX])
+            if users_id:
+                offline[key.decode('utf-8')[len(PRESENCE_PREFIX):]] = [int(user_id) for user_id in users_id]
+        self.swept += sum(len(users_id) for users_id in offline.values())
+        return offline
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(sockets=len(self._sids), swept=self.swept)
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='presence-keeper', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        token = uuid.uuid4().hex
+        sweep_at = time.monotonic() + self.sweep_interval
+        while True:
+            time.sleep(self.heartbeat)
+            try:
+                self.refresh()
+                if time.monotonic() < sweep_at:
+                    continue
+                sweep_at = time.monotonic() + self.sweep_interval
+                # The lock expires before the next sweep, another worker can take it
+                if not self.redis.set(SWEEP_LOCK, token, nx=True, ex=max(int(self.sweep_interval) - 1, 1)):
+                    continue
+                for room, users_id in self.sweep().items():
+                    for listener in self._listeners:
+                        listener(room, users_id)
+            except Exception as e:
+                self.logger.error(str(e), exc_info=True)
@@ -0,0 +1,358 @@
+"""Delivery of the webpush notifications outside the request's thread."""
+
+import heapq
+import itertools
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from pywebpush import WebPusher
+from requests.adapters import HTTPAdapter
+
+from src.chat.util.breaker import CircuitBreaker
+from src.chat.util.constant import PUSH_LANE_HIGH, PUSH_LANE_LOW
+from src.chat.util.vapid import VapidSigner
+
+# The HTTP status which is worth to send again later
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# The HTTP status of a subscription expired or unsubscribed, it will never be valid again
+GONE_STATUS = {404, 410}
+
+# The classes of the push service's responses
+SENT, RETRY, GONE, FAILED = 'sent', 'retry', 'gone', 'failed'
+
+
+def classify(status_code: int) -> str:
+    """Classify the status of the push service's response."""
+    if status_code <= 202:
+        return SENT
+    if status_code in RETRY_STATUS:
+        return RETRY
+    if status_code in GONE_STATUS:
+        return GONE
+    return FAILED
+
+
+class PushJob(object):
+    """
+    One notification waiting to be sent to one subscription.
+    """
+
+    def __init__(self, subscription_info: Dict, payload: str, ttl: int = 0, urgency: str = 'normal',
+                 lane: str = PUSH_LANE_LOW):
+        """
+        :param subscription_info: The Push Subscription json generated by the client.
+        :param payload: The data serialized.
+        :param ttl: The Time To Live in seconds if the recipient is not online.
+        :param urgency: The header Urgency: 'very-low', 'low', 'normal' or 'high'.
+        :param lane: The lane which sends the notification.
+        """
+        self.subscription_info = subscription_info
+        self.payload = payload
+        self.ttl = ttl
+        self.urgency = urgency
+        self.lane = lane
+        # The sendings, and the deliveries delayed by an open breaker which do not count as attempts
+        self.attempt = 0
+        self.deferred = 0
+
+    @property
+    def endpoint(self) -> str:
+        return self.subscription_info.get('endpoint', '')
+
+    @property
+    def origin(self) -> str:
+        url = urlparse(self.endpoint)
+        return f'{url.scheme}://{url.netloc}'
+
+
+class PushDispatcher(object):
+    """
+    The bounded queues with their pool of workers to send the webpush notifications, one queue by lane.
+
+    The time-sensitive notifications have their own lane, so they never wait behind a large fan-out. The encryption
+    and the HTTP requests are done by the workers, the HTTP connections are reused per push service's origin and the
+    temporary failures are retried with an exponential backoff. A circuit breaker per origin stops calling a push
+    service down, its notifications are delayed until it is probed again and dropped after too many delays.
+    The subscriptions gone are passed to the functions registered with `on_expired`.
+    """
+
+    def __init__(self, app=None):
+        self._queues: Dict[str, queue.Queue] = dict()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._retry_heap = []
+        self._retry_cond = threading.Condition()
+        self._sequence = itertools.count()
+        self._stopped = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.stats = dict(sent=0, failed=0, retried=0, dropped=0, expired=0, shed=0)
+        self._breakers: Dict[str, CircuitBreaker] = dict()
+        # The failures of the endpoints, the least recently failed are forgotten first
+        self._endpoints = OrderedDict()
+        self._expired_handlers: List[Callable[[Dict], None]] = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.app = app
+        self.logger = app.logger
+        # The number of workers of each lane
+        self.lanes = {PUSH_LANE_HIGH: app.config['PUSH_HIGH_WORKERS'], PUSH_LANE_LOW: app.config['PUSH_WORKERS']}
+        # The timeouts to connect and to read the answer
+        self.timeout = (app.config['PUSH_CONNECT_TIMEOUT'], app.config['PUSH_TIMEOUT'])
+        self.breaker_threshold = app.config['PUSH_BREAKER_THRESHOLD']
+        self.breaker_reset = app.config['PUSH_BREAKER_RESET']
+        self.max_retries = app.config['PUSH_MAX_RETRIES']
+        self.retry_backoff = app.config['PUSH_RETRY_BACKOFF']
+        self.retry_backoff_max = app.config['PUSH_RETRY_BACKOFF_MAX']
+        self.signer = VapidSigner(app.config['VAPID_PRIVATE_KEY'], app.config['VAPID_CLAIMS'],
+                                  expire=app.config['VAPID_EXPIRE'])
+        self.max_endpoints = app.config['PUSH_ENDPOINT_STATS']
+        self._queues = {lane: queue.Queue(maxsize=app.config['PUSH_QUEUE_SIZE']) for lane in self.lanes}
+        app.extensions['push'] = self
+
+    def on_expired(self, f: Callable[[Dict], None]) -> Callable[[Dict], None]:
+        """
+        Register a function called with the subscription when the push service answers it is gone (404, 410).
+
+        The function is called by a worker inside an application context.
+        """
+        self._expired_handlers.append(f)
+        return f
+
+    def lane_stats(self) -> Dict[str, Dict[str, int]]:
+        """The workers and the notifications waiting of each lane."""
+        return {lane: dict(workers=workers, queued=self._queues[lane].qsize()) for lane, workers in self.lanes.items()}
+
+    def breaker_stats(self) -> Dict[str, Dict]:
+        """The state of the circuit breaker of each push service's origin."""
+        return {origin: breaker.stats() for origin, breaker in list(self._breakers.items())}
+
+    def endpoint_stats(self) -> Dict[str, Dict]:
+        """The failures and retries of the endpoints which failed recently."""
+        with self._stats_lock:
+            return {endpoint: dict(stats) for endpoint, stats in self._endpoints.items()}
+
+    def submit(self, subscription_info: Dict, payload: str, ttl: int = 0, urgency: str = 'normal',
+               lane: str = PUSH_LANE_LOW) -> bool:
+        """
+        Queue a notification into its lane, the workers are started at the first call.
+
+        :param subscription_info: The Push Subscription json generated by the client.
+        :param payload: The data serialized.
+        :param ttl: The Time To Live in seconds if the recipient is not online.
+        :param urgency: The header Urgency: 'very-low', 'low', 'normal' or 'high'.
+        :param lane: The lane which sends the notification.
+        :return: False if the queue is full and the notification was dropped.
+        """
+        self.start()
+        try:
+            self._queues[lane].put_nowait(PushJob(subscription_info, payload, ttl, urgency, lane))
+            return True
+        except queue.Full:
+            self._count('dropped')
+            self.logger.warning(f'The webpush queue {lane} is full, a notification was dropped.')
+            return False
+
+    def start(self) -> None:
+        """Start the workers and the retry scheduler if they are not running."""
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._stopped.clear()
+            threads = [threading.Thread(target=self._work, args=(self._queues[lane],), name=f'push-{lane}-{i}',
+                                        daemon=True)
+                       for lane, workers in self.lanes.items() for i in range(workers)]
+            threads.append(threading.Thread(target=self._schedule_retries, name='push-retry', daemon=True))
+            for thread in threads:
+                thread.start()
+            self._threads = threads
+
+    def stop(self, timeout: float = None) -> None:
+        """Stop the workers after the notifications already queued."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+            self._stopped.set()
+            for lane, workers in self.lanes.items():
+                for _ in range(workers):
+                    self._queues[lane].put(None)
+            with self._retry_cond:
+                self._retry_cond.notify_all()
+            for thread in threads:
+                thread.join(timeout)
+
+    def join(self) -> None:
+        """Block until all the notifications queued and their retries are processed."""
+        while True:
+            for lane_queue in self._queues.values():
+                lane_queue.join()
+            with self._retry_cond:
+                if not self._retry_heap and not any(q.unfinished_tasks for q in self._queues.values()):
+                    return
+            time.sleep(0.01)
+
+    def _work(self, lane_queue: queue.Queue) -> None:
+        while True:
+            job = lane_queue.get()
+            try:
+                if job is None:
+                    return
+                self._deliver(job)
+            except Exception as e:
+                self.logger.error(str(e), exc_info=True)
+            finally:
+                lane_queue.task_done()
+
+    def _deliver(self, job: PushJob) -> None:
+        breaker = self._breaker(job.origin)
+        if not breaker.allow():
+            self._shed(job, breaker)
+            return
+        job.attempt += 1
+
+        headers = self.signer.headers(job.endpoint)
+        headers['Urgency'] = job.urgency
+        try:
+            response = WebPusher(job.subscription_info, requests_session=self._session(job.origin)).send(
+                data=job.payload,
+                headers=headers,
+                ttl=job.ttl,
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            breaker.failure()
+            self._retry(job, str(e))
+            return
+
+        result = classify(response.status_code)
+        # Only the push service's failures open the breaker, not the invalid subscriptions
+        if result == RETRY:
+            breaker.failure()
+        else:
+            breaker.success()
+
+        if result == SENT:
+            self._count('sent')
+        elif result == RETRY:
+            self._retry(job, _describe(response), _retry_after(response), response.status_code)
+        elif result == GONE:
+            self._expire(job, response.status_code)
+        else:
+            self._count('failed', job.endpoint, response.status_code)
+            self.logger.error(_describe(response))
+
+    def _shed(self, job: PushJob, breaker: CircuitBreaker) -> None:
+        """
+        Delay the notification until the breaker of its push service can be called again, or drop it.
+
+        Each delay lasts until the breaker is half-open or its probe is answered, the notification is dropped after
+        `PUSH_MAX_RETRIES` delays.
+        """
+        job.deferred += 1
+        if job.deferred > self.max_retries:
+            self._count('shed')
+            self.logger.warning(f'Webpush dropped, the push service {job.origin} is unavailable.')
+            return
+        self._schedule(job, breaker.retry_in())
+
+    def _expire(self, job: PushJob, status_code: int) -> None:
+        """Forget the subscription gone, the next notifications are not sent to it."""
+        self._count('expired')
+        with self._stats_lock:
+            self._endpoints.pop(job.endpoint, None)
+        self.logger.info(f'Webpush subscription gone ({status_code}): {job.endpoint}')
+        with self.app.app_context():
+            for handler in self._expired_handlers:
+                handler(job.subscription_info)
+
+    def _retry(self, job: PushJob, reason: str, delay: Optional[float] = None,
+               status_code: Optional[int] = None) -> None:
+        """Send again later the notification with an exponential backoff."""
+        if job.attempt > self.max_retries:
+            self._count('failed', job.endpoint, status_code)
+            self.logger.error(f'Webpush failed after {job.attempt} attempts: {reason}')
+            return
+        if delay is None:
+            delay = self.retry_backoff * 2 ** (job.attempt - 1)
+            delay += random.uniform(0, delay / 10)
+        delay = min(delay, self.retry_backoff_max)
+        self._count('retried', job.endpoint, status_code)
+        self._schedule(job, delay)
+
+    def _schedule(self, job: PushJob, delay: float) -> None:
+        with self._retry_cond:
+            heapq.heappush(self._retry_heap, (time.monotonic() + delay, next(self._sequence), job))
+            self._retry_cond.notify()
+
+    def _breaker(self, origin: str) -> CircuitBreaker:
+        breaker = self._breakers.get(origin)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(origin, CircuitBreaker(self.breaker_threshold,
+                                                                           self.breaker_reset))
+        return breaker
+
+    def _schedule_retries(self) -> None:
+        """Put back the notifications into the queue when their delay is over."""
+        with self._retry_cond:
+            while not self._stopped.is_set():
+                if not self._retry_heap:
+                    self._retry_cond.wait()
+                    continue
+                due, _, job = self._retry_heap[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._retry_cond.wait(wait)
+                    continue
+                heapq.heappop(self._retry_heap)
+                try:
+                    self._queues[job.lane].put_nowait(job)
+                except queue.Full:
+                    self._count('dropped')
+                    self.logger.warning(f'The webpush queue {job.lane} is full, a retry was dropped.')
+
+    def _session(self, origin: str) -> requests.Session:
+        """One session per worker and per push service's origin to keep the connections alive."""
+        sessions = getattr(self._local, 'sessions', None)
+        if sessions is None:
+            sessions = self._local.sessions = dict()
+        session = sessions.get(origin)
+        if session is None:
+            session = sessions[origin] = requests.Session()
+            session.mount(origin, HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        return session
+
+    def _count(self, key: str, endpoint: str = None, status_code: Optional[int] = None) -> None:
+        """Count the result, the failures and the retries are also counted for the endpoint."""
+        with self._stats_lock:
+            self.stats[key] += 1
+            if endpoint is None:
+                return
+            stats = self._endpoints.pop(endpoint, None) or dict(failed=0, retried=0, last_status=None)
+            stats[key] += 1
+            stats['last_status'] = status_code
+            self._endpoints[endpoint] = stats
+            if len(self._endpoints) > self.max_endpoints:
+                self._endpoints.popitem(last=False)
+
+
+def _describe(response: requests.Response) -> str:
+    return f'Push failed: {response.status_code} {response.reason}\nResponse body:{response.text}'
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    """Get the delay asked by the push service."""
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,151 @@
+"""The token buckets limiting the rate of the socket events."""
+
+import threading
+import time
+from typing import Dict, Tuple
+
+from redis.exceptions import ConnectionError, TimeoutError
+
+from src.chat.util.script import LuaScript
+
+# The bucket of a user for an event, shared by all his sockets on all the workers
+RATE_LIMIT_PREFIX = 'ratelimit:'
+
+# KEYS: the bucket's hash. ARGV: the capacity, the tokens refilled per second.
+# Take one token from the bucket refilled since its last call, the seconds to wait for a token are returned if the
+# bucket is empty, as a string since Redis truncates the numbers of Lua. The clock of Redis is shared by the workers.
+_TAKE = LuaScript("""
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = capacity
+if bucket[1] then
+    tokens = math.min(capacity, tonumber(bucket[1]) + math.max(now - tonumber(bucket[2]), 0) * rate)
+end
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+""")
+
+
+class TokenBucket(object):
+    """A token bucket in the process."""
+
+    __slots__ = ('capacity', 'rate', 'tokens', 'at')
+
+    def __init__(self, capacity: int, rate: float):
+        """
+        :param capacity: The burst of events allowed.
+        :param rate: The tokens refilled per second.
+        """
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.at = time.monotonic()
+
+    def take(self) -> float:
+        """
+        Take one token.
+
+        :return: 0 if the token is taken, else the seconds to wait for a token.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.at) * self.rate)
+        self.at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def give_back(self) -> None:
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class RateLimiter(object):
+    """
+    Limit the rate of the socket events of each user, per event type and per role.
+
+    The bucket of a user is a Redis hash updated by a Lua script, shared by his sockets on all the workers. Each socket
+    also has a bucket of the same size in its worker, checked first: a socket which emptied its own bucket has emptied
+    the user's bucket too, it is rejected without a round trip to Redis. If Redis is unreachable, only the buckets of
+    the sockets limit the events.
+    """
+
+    def __init__(self, app=None, redis=None):
+        self.redis = None
+        # The user's id and his role of each socket of this worker
+        self._sockets: Dict[str, Tuple[int, str]] = dict()
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = dict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected_local = 0
+        self.rejected_redis = 0
+        if app is not None:
+            self.init_app(app, redis)
+
+    def init_app(self, app, redis) -> None:
+        self.logger = app.logger
+        self.redis = redis
+        self.enabled = app.config['SOCKET_RATE_LIMIT']
+        self.limits = app.config['SOCKET_RATE_LIMITS']
+        app.extensions['rate_limiter'] = self
+
+    def connect(self, sid: str, user_id: int, admin: bool) -> None:
+        with self._lock:
+            self._sockets[sid] = (user_id, 'admin' if admin else 'user')
+
+    def disconnect(self, sid: str) -> None:
+        """Forget the socket and its buckets."""
+        with self._lock:
+            self._sockets.pop(sid, None)
+            for key in [key for key in self._buckets if key[0] == sid]:
+                del self._buckets[key]
+
+    def take(self, sid: str, event: str) -> float:
+        """
+        Take one token for the event of the socket.
+
+        :param sid: The socket's id.
+        :param event: The event's name.
+        :return: 0 if the event is allowed, else the seconds to wait before it is allowed.
+        """
+        if not self.enabled or event not in self.limits:
+            return 0
+        with self._lock:
+            # A socket unknown by this worker is limited alone
+            subject, role = self._sockets.get(sid, (sid, 'user'))
+            capacity, rate = self.limits[event][role]
+            bucket = self._buckets.get((sid, event))
+            if bucket is None:
+                bucket = self._buckets[(sid, event)] = TokenBucket(capacity, rate)
+            wait = bucket.take()
+            if wait:
+                self.rejected_local += 1
+                return wait
+
+        try:
+            wait = float(_TAKE(self.redis, keys=[f'{RATE_LIMIT_PREFIX}{event}:{subject}'], args=[capacity, rate]))
+        except (ConnectionError, TimeoutError) as e:
+            self.logger.error(str(e))
+            wait = 0
+        with self._lock:
+            if wait:
+                # The token of the socket is not spent by the event rejected
+                bucket.give_back()
+                self.rejected_redis += 1
+            else:
+                self.allowed += 1
+        return wait
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(sockets=len(self._sockets), allowed=self.allowed, rejected_local=self.rejected_local,
+                        rejected_redis=self.rejected_redis)
@@ -0,0 +1,26 @@
+"""Lua scripts run on Redis."""
+
+from typing import Iterable
+
+
+class LuaScript(object):
+    """
+    A Lua script run atomically in one round trip.
+
+    It is loaded at its first call then run by EVALSHA, it is loaded again if the Redis server lost it.
+    """
+
+    def __init__(self, source: str):
+        """
+        :param source: The Lua code, it reads its keys in KEYS and its arguments in ARGV.
+        """
+        self.source = source
+        self._script = None
+
+    def __call__(self, client, keys: Iterable[str] = (), args: Iterable = ()):
+        """
+        :param client: The Redis client.
+        """
+        if self._script is None:
+            self._script = client.register_script(self.source)
+        return self._script(keys=list(keys), args=list(args), client=client)
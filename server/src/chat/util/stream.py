@@ -1,13 +1,24 @@
 """Logic for """
 
 import json
+import re
 from collections import OrderedDict
+from typing import Iterable, List
 
 from flask import stream_with_context, Response, current_app
-from pywebpush import webpush, WebPushException
-from redis.client import PubSub
+from redis.exceptions import ConnectionError
 
-from src.chat import redis
+from src.chat import redis, push, subscriber
+from src.chat.util.coalesce import NotificationCoalescer
+from src.chat.util.constant import PUSH_OPTIONS, PUSH_OPTIONS_DEFAULT
+from src.chat.util.presence import SID_PREFIX
+from src.chat.util.subscriber import StreamClient, exclude_message, follow_message, sub_workers, unfollow_message
+
+# The format of an id in the replay stream
+REPLAY_ID = re.compile(r'^\d+-\d+$')
+
+# A comment ignored by EventSource to keep the stream alive
+HEARTBEAT = b':heartbeat\n\n'
 
 
 class Message(object):
@@ -59,6 +70,19 @@ class Message(object):
             lines.append("retry:{value}".format(value=self.retry))
         return "\n".join(lines) + "\n\n"
 
+    def encode(self) -> bytes:
+        """
+        Render the frame written to the clients, it is published and forwarded unchanged.
+        """
+        return str(self).encode('utf-8')
+
+    @staticmethod
+    def with_id(frame: bytes, id) -> bytes:
+        """
+        Add the id to a frame rendered without id, the frame is not parsed.
+        """
+        return b'%sid:%s\n\n' % (frame[:-1], str(id).encode('utf-8'))
+
     def __repr__(self):
         kwargs = OrderedDict()
         if self.type:
@@ -101,68 +125,359 @@ def publish(channel: str, data, type: str = None, id: int = None, retry: int = 3
     :param retry: An optional integer, to specify the reconnect time for
         disconnected clients of this stream. Default: after 30s (Only SSE)
     """
-    # If channel exist, we will send notification
-    sse_val = redis.get(sub_sse(channel))
-    webpush_val = redis.get(sub_webpush(channel))
+    _publish_channels([channel], data, type=type, id=id, retry=retry)
+
+
+def publish_many(user_ids: List[int], data, type: str = None, id: int = None, retry: int = 30000) -> None:
+    """
+    Publish the same data to many users as a server-sent event or as a webpush.
+
+    The routes of all the users are resolved in one round trip and the server-sent events
+    are published through one pipeline, the webpush targets (every device of the users offline) are sent as a batch.
+
+    :param user_ids: The receivers' id
+    :param data: The event data.
+    :param type: An optional event type.
+    :param id: An optional event ID. (Only SSE)
+    :param retry: An optional integer, to specify the reconnect time for
+        disconnected clients of this stream. Default: after 30s (Only SSE)
+    """
+    _publish_channels([sub_user_channel(user_id) for user_id in user_ids], data, type=type, id=id, retry=retry)
+
+
+def publish_project(project_id: int, user_ids: List[int], data, type: str = None, exclude_user_ids: List[int] = (),
+                    id: int = None, retry: int = 30000) -> None:
+    """
+    Publish the event of a project to its members as a server-sent event or as a webpush.
+
+    The SSE streams follow the channel of the project, the event is published once on this channel whatever the number
+    of members. The members offline receive a webpush and each member keeps the event in their inbox.
+
+    :param project_id: The project's id
+    :param user_ids: The receivers' id, the members of the project.
+    :param data: The event data.
+    :param type: An optional event type.
+    :param exclude_user_ids: The members who do not receive the event, such as its author.
+    :param id: An optional event ID. (Only SSE)
+    :param retry: An optional integer, to specify the reconnect time for
+        disconnected clients of this stream. Default: after 30s (Only SSE)
+    """
+    _publish_channels([sub_user_channel(user_id) for user_id in user_ids], data, type=type, id=id, retry=retry,
+                      shared=sub_project_channel(project_id),
+                      exclude=[sub_sse(sub_user_channel(user_id)) for user_id in exclude_user_ids])
+
+
+def follow_project(user_ids: List[int], project_id: int) -> None:
+    """The SSE streams of the users, in all the processes, follow the channel of the project."""
+    _publish_control([sub_sse(sub_user_channel(user_id)) for user_id in user_ids],
+                     follow_message(sub_sse(sub_project_channel(project_id))))
+
+
+def unfollow_project(user_ids: List[int], project_id: int) -> None:
+    """The SSE streams of the users, in all the processes, unfollow the channel of the project."""
+    _publish_control([sub_sse(sub_user_channel(user_id)) for user_id in user_ids],
+                     unfollow_message(sub_sse(sub_project_channel(project_id))))
+
 
-    if sse_val:
-        message = Message(data, type=type, id=id, retry=retry)
-        msg_json = json.dumps(message.to_dict())
-        redis.publish(sse_val, msg_json)
-    elif webpush_val:
-        trigger_push_notifications_for_subscriptions(webpush_val, data, type)
+def close_project(project_id: int) -> None:
+    """All the SSE streams unfollow the channel of the project removed."""
+    channel = sub_sse(sub_project_channel(project_id))
+    _publish_control([channel], unfollow_message(channel))
 
 
-def messages(channel: str = 'sse'):
+# Merge the bursts of notifications, initialized with the application
+coalescer = NotificationCoalescer(publish_many)
+
+
+def _publish_control(channels: List[str], message: bytes) -> None:
+    pipe = redis.pipeline(transaction=False)
+    for channel in channels:
+        pipe.publish(channel, message)
+    pipe.execute()
+
+
+def _publish_channels(channels: List[str], data, type: str = None, id: int = None, retry: int = 30000,
+                      shared: str = None, exclude: List[str] = ()) -> None:
     """
-        A generator objects from the given channel.
+    Resolve the routes of the channels then publish the data by SSE or by webpush.
+
+    The event is kept in the inbox of each channel in the same round trip as the routes.
+    In durable mode, the event is also added into the replay stream of each channel and its id in this stream
+    becomes the event's id.
+    With a shared channel followed by the SSE streams of the channels, the event is published and replayed once on
+    the shared channel, it is not forwarded to the streams of the excluded SSE channels.
     """
-    pubsub = redis.pubsub()
-    pubsub.subscribe(channel)
 
-    # Mark existence channel
-    redis.set(channel, channel)
+    if not channels:
+        return
+    data = limit_size(data, type)
+    if shared:
+        _publish_shared(channels, shared, exclude, data, type=type, id=id, retry=retry)
+        return
+
+    durable = current_app.config['SSE_DURABLE']
+    # The frame is rendered once, only the id is added for each channel in durable mode
+    frame = Message(data, type=type, id=None if durable else id, retry=retry).encode()
+
+    pipe = redis.pipeline(transaction=False)
+    _add_routes(pipe, channels)
+    if durable:
+        _add_into_replay(pipe, channels, frame)
+    if current_app.config['NOTIFICATION_INBOX']:
+        _add_into_inbox(pipe, channels, data, type)
+    sse_vals, webpush_vals, results = _split_routes(pipe.execute(), len(channels))
+    # The replay stream answers the id then the expiry of each channel
+    event_ids = [event_id.decode('utf-8') for event_id in results[:2 * len(channels):2]] if durable \
+        else [id] * len(channels)
+
+    published = False
+    pipe = redis.pipeline(transaction=False)
+    webpush_targets = []
+    for sse_val, webpush_val, event_id in zip(sse_vals, webpush_vals, event_ids):
+        if sse_val:
+            pipe.publish(sse_val, Message.with_id(frame, event_id) if durable else frame)
+            published = True
+        else:
+            webpush_targets.extend(webpush_val)
+
+    if published:
+        pipe.execute()
+    if webpush_targets:
+        trigger_push_notifications_for_many_subscriptions(webpush_targets, data, type)
+
+
+def _publish_shared(channels: List[str], shared: str, exclude: List[str], data, type: str = None, id: int = None,
+                    retry: int = 30000) -> None:
+    durable = current_app.config['SSE_DURABLE']
+    frame = Message(data, type=type, id=None if durable else id, retry=retry).encode()
+
+    pipe = redis.pipeline(transaction=False)
+    _add_routes(pipe, channels)
+    if durable:
+        _add_into_replay(pipe, [shared], frame, exclude)
+    if current_app.config['NOTIFICATION_INBOX']:
+        _add_into_inbox(pipe, channels, data, type)
+    sse_vals, webpush_vals, results = _split_routes(pipe.execute(), len(channels))
+
+    # One event for all the streams following the shared channel
+    if any(sse_vals):
+        if durable:
+            frame = Message.with_id(frame, results[0].decode('utf-8'))
+        redis.publish(sub_sse(shared), exclude_message(frame, exclude))
+
+    webpush_targets = [device for sse_val, webpush_val in zip(sse_vals, webpush_vals) if not sse_val
+                       for device in webpush_val]
+    if webpush_targets:
+        trigger_push_notifications_for_many_subscriptions(webpush_targets, data, type)
+
+
+def limit_size(data, type: str = None):
+    """
+    Keep the notification under `NOTIFICATION_MAX_SIZE` bytes.
+
+    The nested data of a notification too large is reduced to its references (ids, titles, versions), the clients
+    fetch the details. Then its message is truncated.
+    """
+
+    max_size = current_app.config['NOTIFICATION_MAX_SIZE']
+    size = len(json.dumps(data).encode('utf-8'))
+    if not max_size or size <= max_size or not isinstance(data, dict):
+        return data
+
+    current_app.logger.warning(f'The notification {type} has {size} bytes, it was reduced to {max_size} bytes.')
+    data = dict(data, truncated=True)
+    if isinstance(data.get('data'), dict):
+        data['data'] = {key: value for key, value in data['data'].items()
+                        if isinstance(value, (int, float, bool)) or (isinstance(value, str) and len(value) <= 255)}
+    excess = len(json.dumps(data).encode('utf-8')) - max_size
+    if excess > 0 and isinstance(data.get('message'), str):
+        data['message'] = data['message'][:max(len(data['message']) - excess, 0)]
+    return data
+
+
+def _add_routes(pipe, channels: List[str]) -> None:
+    """The pipeline answers the SSE channel of each channel then the webpush subscriptions of its devices."""
+
+    pipe.mget([sub_sse(channel) for channel in channels])
+    for channel in channels:
+        pipe.hvals(sub_webpush(channel))
+
+
+def _split_routes(results: List, count: int):
+    """Split the answers of the pipeline into the SSE channels, the webpush subscriptions and the next answers."""
+
+    return results[0], results[1:count + 1], results[count + 1:]
+
+
+def _add_into_replay(pipe, channels: List[str], frame: bytes, exclude: List[str] = ()) -> None:
+    """Add the event into the capped replay stream of the channels, the pipeline answers the ids."""
+
+    maxlen = current_app.config['SSE_REPLAY_MAXLEN']
+    ttl = current_app.config['SSE_REPLAY_TTL']
+    fields = {'frame': frame}
+    if exclude:
+        fields['exclude'] = ','.join(exclude)
+    for channel in channels:
+        pipe.xadd(sub_replay(channel), fields, maxlen=maxlen, approximate=True)
+        pipe.expire(sub_replay(channel), ttl)
+
+
+def _add_into_inbox(pipe, channels: List[str], data, type: str = None) -> None:
+    """Add the notification into the capped inbox of the channels."""
+
+    maxlen = current_app.config['NOTIFICATION_INBOX_MAXLEN']
+    ttl = current_app.config['NOTIFICATION_INBOX_TTL']
+    fields = {'type': type or '', 'data': json.dumps(data)}
+    for channel in channels:
+        pipe.xadd(sub_inbox(channel), fields, maxlen=maxlen, approximate=True)
+        pipe.expire(sub_inbox(channel), ttl)
+        pipe.incr(sub_inbox_unread(channel))
+        pipe.expire(sub_inbox_unread(channel), ttl)
+
+
+def replay(channel: str, last_event_id: str, follows: Iterable[str] = ()):
+    """
+    The frames of the channel and of the channels followed after the last event received by the client.
+
+    :param channel: The SSE channel.
+    :param last_event_id: The header 'Last-Event-ID' of the client.
+    :param follows: The shared SSE channels followed by the stream.
+    """
+
+    pipe = redis.pipeline(transaction=False)
+    for name in (channel, *follows):
+        pipe.xrange(sub_replay(name), min=last_event_id, max='+', count=current_app.config['SSE_REPLAY_MAXLEN'] + 1)
+    yield from merge_replay(channel, pipe.execute(), last_event_id)
+
+
+def merge_replay(channel: str, results: List, last_event_id: str) -> List:
+    """
+    Merge the entries of the replay streams in the order of their ids, the ids of different streams of a Redis server
+    are ordered by time to the millisecond.
+
+    :param channel: The SSE channel of the client, the events which exclude it are skipped.
+    :param results: The entries of each replay stream after the last event.
+    :param last_event_id: The header 'Last-Event-ID' of the client.
+    :return: The ids and the frames.
+    """
+    replayed = []
+    for entries in results:
+        for event_id, fields in entries:
+            event_id = event_id.decode('utf-8')
+            exclude = fields.get(b'exclude')
+            if event_id != last_event_id and not (exclude and channel in exclude.decode('utf-8').split(',')):
+                replayed.append((event_id, Message.with_id(fields[b'frame'], event_id)))
+    if len(results) > 1:
+        replayed.sort(key=lambda entry: tuple(map(int, entry[0].split('-'))))
+    return replayed
+
+
+def messages(channel: str = 'sse', last_event_id: str = None, heartbeat: float = None, follows: Iterable[str] = ()):
+    """
+        A generator of the frames from the given channel, they are written to the client as they are published.
+
+        The frames are received by the subscriber shared by all the streams of the process.
+        With `last_event_id`, the events missed by the client are replayed before the live events.
+        With `heartbeat`, None is generated when no event was received during this number of seconds.
+        With `follows`, the frames of these shared channels are also received.
+    """
+    follows = list(follows)
+    client = subscriber.open(channel, follows)
 
     try:
-        for pubsub_message in pubsub.listen():
-            if pubsub_message['type'] == 'message':
-                msg_dict = json.loads(pubsub_message['data'])
-                yield Message(**msg_dict)
+        # Subscribed before the replay, the live events already replayed are skipped
+        replayed = set()
+        if last_event_id:
+            for _, frame in replay(channel, last_event_id, follows):
+                replayed.add(frame)
+                yield frame
+
+        while True:
+            # The previous event was written, the client is still there
+            client.touch()
+            data = client.get(timeout=heartbeat)
+            if data is StreamClient.CLOSE:
+                return
+            if data is None:
+                # Nothing published before the replay is still on the way
+                replayed.clear()
+                yield None
+                continue
+            if data in replayed:
+                continue
+            yield data
     finally:
         try:
-            disconnect_sse(channel, pubsub)
+            subscriber.close(client)
 
         except ConnectionError as e:
             current_app.logger.error(str(e), exc_info=True)
 
 
-def disconnect_sse(channel: str = 'sse', pubsub: PubSub = None, user_id: int = None) -> None:
+def disconnect_sse(channel: str = 'sse', user_id: int = None) -> None:
     """A function will remove all older data SSE"""
 
     # Create new channel follow user's id
     if user_id:
         channel = sub_sse(sub_user_channel(user_id))
 
-    # unsubscribe older channel
-    if pubsub:
-        pubsub.unsubscribe(channel)
+    # Close the streams of this channel in this process
+    subscriber.close_channel(channel)
 
     # Delete older channel
-    redis.delete(channel)
+    redis.delete(channel, sub_workers(channel))
+
 
+def remove_legacy_keys() -> int:
+    """
+    Delete the keys written by the previous versions: the webpush subscriptions of a user stored in a string instead
+    of a hash, the markers of the SSE channels without TTL, which mark their users online forever, the sids stored in a
+    string instead of a hash and the sets of the users online in a room, replaced by the presence hashes.
 
-def stream(user_id: int) -> Response:
+    :return: The number of keys deleted.
+    """
+    legacy = []
+    for pattern, is_legacy in (('webpush:sub:*', lambda type, ttl: type != b'hash'),
+                               ('sse:sub:*', lambda type, ttl: ttl == -1),
+                               (SID_PREFIX + '*', lambda type, ttl: type != b'hash'),
+                               ('room:project:*', lambda type, ttl: type == b'set')):
+        keys = list(redis.scan_iter(match=pattern, count=1000))
+        if not keys:
+            continue
+        pipe = redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.type(key)
+            pipe.ttl(key)
+        results = pipe.execute()
+        legacy += [key for key, type, ttl in zip(keys, results[::2], results[1::2]) if is_legacy(type, ttl)]
+    if legacy:
+        redis.delete(*legacy)
+    return len(legacy)
+
+
+def stream(user_id: int, last_event_id: str = None, project_ids: List[int] = ()) -> Response:
     """
     A view function that streams server-sent events.
     :param user_id: The user's id for event SSE.
+    :param last_event_id: The id of the last event received by the client before its reconnection.
+    :param project_ids: The user's projects, the stream follows their channels.
     :return: The context's stream with 'event-stream' mimetype
     """
     channel_sse = sub_sse(sub_user_channel(user_id))
+    follows = [sub_sse(sub_project_channel(project_id)) for project_id in project_ids]
+    if not (last_event_id and current_app.config['SSE_DURABLE'] and REPLAY_ID.match(last_event_id)):
+        last_event_id = None
+
+    heartbeat = current_app.config['SSE_HEARTBEAT']
 
     @stream_with_context
     def generator():
-        for message in messages(channel=channel_sse):
-            yield str(message)
+        # The headers are sent with the first chunk, EventSource is open without waiting the first event
+        yield HEARTBEAT
+        # The heartbeats detect the clients gone away, their streams are closed by the server at the failed write
+        for frame in messages(channel=channel_sse, last_event_id=last_event_id, heartbeat=heartbeat,
+                              follows=follows):
+            yield frame or HEARTBEAT
 
     return Response(
         generator(),
@@ -170,24 +485,23 @@ def stream(user_id: int) -> Response:
     )
 
 
-def trigger_push_notifications_for_subscriptions(webpush_val, data, type: str = None) -> None:
+def trigger_push_notifications_for_many_subscriptions(webpush_vals: List, data, type: str = None) -> None:
     """
-    The function to send the notification to the subscriber.
-    :param webpush_val: The public key's client is format string or bytes.
+    The function to send the same notification to many subscribers.
+
+    The payload is serialized once, the notifications are queued and sent by the workers of the push path, the devices
+    of a user concurrently.
+    The lane, the urgency and the TTL depend on the event type.
+    :param webpush_vals: The public keys' clients are format string or bytes.
     :param data: The event data.
     :param type: An optional event type.
     """
-    try:
+    payload = json.dumps(dict(type=type, data=data))
+    options = PUSH_OPTIONS.get(type, PUSH_OPTIONS_DEFAULT)
+    for webpush_val in webpush_vals:
         if isinstance(webpush_val, bytes):
             webpush_val = webpush_val.decode('utf-8')
-        webpush(
-            subscription_info=json.loads(webpush_val),
-            data=json.dumps(dict(type=type, data=data)),
-            vapid_private_key=current_app.config['VAPID_PRIVATE_KEY'],
-            vapid_claims=current_app.config['VAPID_CLAIMS']
-        )
-    except WebPushException as e:
-        current_app.logger.error(str(e), exc_info=True)
+        push.submit(json.loads(webpush_val), payload, **options)
 
 
 def sub_sse(channel: str) -> str:
@@ -208,7 +522,38 @@ def sub_webpush(channel: str) -> str:
     return f'webpush:{channel}'
 
 
+def sub_replay(channel: str) -> str:
+    """Convert channel into the key of its replay stream."""
+    return f'replay:{sub_sse(channel)}'
+
+
+def sub_inbox(channel: str) -> str:
+    """Convert channel into the key of its inbox."""
+    return f'inbox:{channel}'
+
+
+def sub_inbox_read(channel: str) -> str:
+    """Convert channel into the key of the last notification read in its inbox."""
+    return f'inbox:read:{channel}'
+
+
+def sub_inbox_unread(channel: str) -> str:
+    """Convert channel into the key of the number of notifications unread in its inbox."""
+    return f'inbox:unread:{channel}'
+
+
+def is_after(event_id: str, other_id: str) -> bool:
+    """Compare two ids of the replay stream."""
+    return tuple(map(int, event_id.split('-'))) > tuple(map(int, other_id.split('-')))
+
+
 def sub_user_channel(user_id: int) -> str:
     """Create channel for subscribe."""
 
     return f"sub:user:{user_id}"
+
+
+def sub_project_channel(project_id: int) -> str:
+    """Create the channel shared by the members of the project."""
+
+    return f"sub:project:{project_id}"
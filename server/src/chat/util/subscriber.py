@@ -0,0 +1,375 @@
+"""One Redis subscription shared by all the SSE streams of the process."""
+
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from redis.exceptions import ConnectionError, TimeoutError
+
+from src.chat.util.script import LuaScript
+
+# The overflow policies of a stream whose queue is full
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_COLLAPSE = 'collapse'
+OVERFLOW_DISCONNECT = 'disconnect'
+OVERFLOWS = (OVERFLOW_DROP_OLDEST, OVERFLOW_COLLAPSE, OVERFLOW_DISCONNECT)
+
+# The control messages published on a channel, an SSE frame never starts with this byte
+CONTROL = b'\x00'
+# The streams of the channel follow or unfollow another channel
+FOLLOW = CONTROL + b'+'
+UNFOLLOW = CONTROL + b'-'
+# The frame is not forwarded to the streams of some channels
+EXCLUDE = CONTROL + b'!'
+
+# KEYS: the marker of the channel, the set of the workers holding its streams. ARGV: the worker's id.
+# The worker closed its last stream of the channel, the marker is deleted if no other worker holds a stream of it.
+UNMARK = """
+redis.call('SREM', KEYS[2], ARGV[1])
+if redis.call('SCARD', KEYS[2]) > 0 then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+return 1
+"""
+_UNMARK = LuaScript(UNMARK)
+
+
+def sub_workers(channel: str) -> str:
+    """The set of the workers holding the streams of the channel."""
+    return f'{channel}:workers'
+
+
+def mark_channel(pipe, channel: str, worker: str, ttl: int) -> None:
+    """Mark the existence of the channel and the worker holding its streams for ttl seconds, in the pipeline."""
+    pipe.set(channel, channel, ex=ttl)
+    pipe.sadd(sub_workers(channel), worker)
+    pipe.expire(sub_workers(channel), ttl)
+
+
+def follow_message(channel: str) -> bytes:
+    return FOLLOW + channel.encode('utf-8')
+
+
+def unfollow_message(channel: str) -> bytes:
+    return UNFOLLOW + channel.encode('utf-8')
+
+
+def exclude_message(frame: bytes, channels: Iterable[str]) -> bytes:
+    """The frame, not forwarded to the streams whose own channel is one of these channels."""
+    channels = ','.join(channels)
+    if not channels:
+        return frame
+    return b'%s%s\n%s' % (EXCLUDE, channels.encode('utf-8'), frame)
+
+
+def parse_control(data: bytes) -> Tuple[Optional[bytes], List[str], bytes]:
+    """
+    Split a message published on a channel.
+
+    :return: The control (FOLLOW, UNFOLLOW, EXCLUDE or None), its channels and the frame to forward.
+    """
+    if not data.startswith(CONTROL):
+        return None, [], data
+    control = data[:2]
+    if control == EXCLUDE:
+        channels, _, frame = data[2:].partition(b'\n')
+        return EXCLUDE, channels.decode('utf-8').split(','), frame
+    return control, [data[2:].decode('utf-8')], b''
+
+
+class StreamClient(object):
+    """
+    One SSE stream: the messages of its channel are put in its queue by the subscriber.
+
+    The queue of a slow client is bounded, when it is full the overflow policy drops the oldest frame, drops the
+    oldest frame of the same event type (collapse) or disconnects the client, which reconnects and replays later.
+    """
+
+    # Put in the queue to stop the stream
+    CLOSE = object()
+
+    __slots__ = ('channel', 'follows', 'closed', 'last_active', 'maxsize', 'overflow', '_messages', '_cond')
+
+    def __init__(self, channel: str, maxsize: int = 0, overflow: str = OVERFLOW_DROP_OLDEST):
+        """
+        :param channel: The SSE channel.
+        :param maxsize: The frames waiting in the queue, 0 for no limit.
+        :param overflow: The policy when the queue is full.
+        """
+        self.channel = channel
+        # The shared channels followed by the stream, such as the channels of its projects
+        self.follows = set()
+        self.closed = False
+        self.last_active = time.monotonic()
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self._messages = deque()
+        self._cond = threading.Condition(threading.Lock())
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def touch(self) -> None:
+        """Mark the stream as alive, after the previous event was written to the client."""
+        self.last_active = time.monotonic()
+
+    def put(self, data) -> int:
+        """
+        Queue the frame, the overflow policy applies if the queue is full.
+
+        :return: The number of frames dropped.
+        """
+        with self._cond:
+            dropped = self._push(data)
+            self._cond.notify()
+        return dropped
+
+    def _push(self, data) -> int:
+        dropped = 0
+        if self.maxsize and len(self._messages) >= self.maxsize and data is not StreamClient.CLOSE:
+            if self.overflow == OVERFLOW_DISCONNECT:
+                dropped = len(self._messages) + 1
+                self._messages.clear()
+                self.closed = True
+                data = StreamClient.CLOSE
+            else:
+                dropped = 1
+                self._drop(data)
+        self._messages.append(data)
+        return dropped
+
+    def _drop(self, data) -> None:
+        """Drop the oldest frame, of the same event type as the new frame with the policy collapse."""
+        if self.overflow == OVERFLOW_COLLAPSE and data.startswith(b'event:'):
+            event = data[:data.index(b'\n') + 1]
+            for i, frame in enumerate(self._messages):
+                if frame is not StreamClient.CLOSE and frame.startswith(event):
+                    del self._messages[i]
+                    return
+        self._messages.popleft()
+
+    def get(self, timeout: float = None):
+        """
+        Wait the next message of the channel.
+
+        :return: The message's data, None after the timeout or StreamClient.CLOSE if the stream is closed.
+        """
+        with self._cond:
+            if not self._messages:
+                self._cond.wait(timeout)
+            return self._messages.popleft() if self._messages else None
+
+    def close(self) -> None:
+        self.closed = True
+        self.put(StreamClient.CLOSE)
+
+
+class StreamSubscriber(object):
+    """
+    Hold one pubsub connection for the process and route the messages to the queues of the SSE streams.
+
+    The channels are subscribed when their first stream is opened and unsubscribed when their last stream is closed.
+    A stream also follows shared channels (its projects), an event published once on a shared channel is forwarded to
+    all the streams following it. The streams which did not write for `SSE_IDLE_TIMEOUT` seconds are reaped with their
+    Redis state, the existence of the channels is marked with a TTL refreshed while their streams are alive. The marker
+    of a channel is deleted when the last worker holding its streams closes them.
+    """
+
+    def __init__(self, app=None, redis=None):
+        self.redis = None
+        self._pubsub = None
+        self._clients: Dict[str, Set[StreamClient]] = dict()
+        self._lock = threading.RLock()
+        self._thread = None
+        self.reaped = 0
+        self.dropped = 0
+        self.disconnected = 0
+        # The pubsub connection is created with this channel, it is never unsubscribed
+        self.control_channel = f'sse:subscriber:{uuid.uuid4().hex}'
+        if app is not None:
+            self.init_app(app, redis)
+
+    def init_app(self, app, redis) -> None:
+        self.logger = app.logger
+        self.redis = redis
+        self.heartbeat = app.config['SSE_HEARTBEAT']
+        self.idle_timeout = app.config['SSE_IDLE_TIMEOUT']
+        self.queue_size = app.config['SSE_QUEUE_SIZE']
+        self.overflow = app.config['SSE_OVERFLOW']
+        if self.overflow not in OVERFLOWS:
+            raise ValueError(f"SSE_OVERFLOW must be one of {', '.join(OVERFLOWS)}.")
+        app.extensions['subscriber'] = self
+
+    def open(self, channel: str, follows: Iterable[str] = ()) -> StreamClient:
+        """
+        Open a stream on the channel and mark the existence of the channel.
+
+        :param channel: The SSE channel.
+        :param follows: The shared SSE channels followed by the stream.
+        """
+        self._start()
+        client = StreamClient(channel, self.queue_size, self.overflow)
+        with self._lock:
+            subscribed = [name for name in (channel, *follows) if self._add(client, name)]
+            if subscribed:
+                self._pubsub.subscribe(*subscribed)
+        pipe = self.redis.pipeline(transaction=False)
+        mark_channel(pipe, channel, self.control_channel, self.idle_timeout)
+        pipe.execute()
+        return client
+
+    def close(self, client: StreamClient) -> None:
+        """Close the stream, the channel is removed with its last stream in all the workers."""
+        client.closed = True
+        with self._lock:
+            if client not in self._clients.get(client.channel, ()):
+                return
+            unsubscribed = [name for name in (client.channel, *client.follows) if self._remove(client, name)]
+            if unsubscribed:
+                self._pubsub.unsubscribe(*unsubscribed)
+        if client.channel in unsubscribed:
+            _UNMARK(self.redis, keys=[client.channel, sub_workers(client.channel)], args=[self.control_channel])
+
+    def _add(self, client: StreamClient, channel: str) -> bool:
+        """Add the stream into the channel, True if the channel must be subscribed."""
+        clients = self._clients.setdefault(channel, set())
+        clients.add(client)
+        if channel != client.channel:
+            client.follows.add(channel)
+        return len(clients) == 1
+
+    def _remove(self, client: StreamClient, channel: str) -> bool:
+        """Remove the stream from the channel, True if the channel must be unsubscribed."""
+        clients = self._clients.get(channel)
+        if clients is None or client not in clients:
+            return False
+        clients.discard(client)
+        if channel != client.channel:
+            client.follows.discard(channel)
+        if clients:
+            return False
+        del self._clients[channel]
+        return True
+
+    def _control(self, control: bytes, channel: str, other: str) -> None:
+        """The streams of the channel follow or unfollow the other channel, with the lock."""
+        clients = list(self._clients.get(channel, ()))
+        if control == FOLLOW:
+            changed = [client for client in clients if not client.closed and self._add(client, other)]
+            if changed:
+                self._pubsub.subscribe(other)
+        elif control == UNFOLLOW:
+            changed = [client for client in clients if self._remove(client, other)]
+            if changed:
+                self._pubsub.unsubscribe(other)
+
+    def close_channel(self, channel: str) -> None:
+        """Close all the streams of the channel."""
+        with self._lock:
+            clients = list(self._clients.get(channel, ()))
+        for client in clients:
+            client.close()
+
+    def reap(self) -> int:
+        """
+        Close the idle streams and refresh the TTL of the channels still alive.
+
+        :return: The number of streams reaped.
+        """
+        deadline = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [client for client in self._streams() if client.last_active < deadline]
+        for client in idle:
+            client.close()
+            self.close(client)
+
+        with self._lock:
+            channels = {client.channel for client in self._streams()}
+            self.reaped += len(idle)
+        if channels:
+            pipe = self.redis.pipeline(transaction=False)
+            for channel in channels:
+                mark_channel(pipe, channel, self.control_channel, self.idle_timeout)
+            pipe.execute()
+        return len(idle)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            depths = [len(client) for client in self._streams()]
+            return dict(channels=len(self._clients),
+                        streams=len(depths),
+                        reaped=self.reaped,
+                        queued=sum(depths),
+                        max_queued=max(depths, default=0),
+                        dropped=self.dropped,
+                        disconnected=self.disconnected,
+                        connections=1 if self._pubsub is not None else 0)
+
+    def _streams(self) -> List[StreamClient]:
+        """Each stream once, in its own channel."""
+        return [client for channel, clients in self._clients.items() for client in clients
+                if client.channel == channel]
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                self._pubsub.subscribe(self.control_channel)
+                self._thread = threading.Thread(target=self._run, name='sse-subscriber', daemon=True)
+                self._thread.start()
+                threading.Thread(target=self._run_reaper, name='sse-reaper', daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                # Wait without the lock, the other threads can (un)subscribe meanwhile
+                if not self._pubsub.connection.can_read(timeout=1):
+                    continue
+                with self._lock:
+                    message = self._pubsub.get_message()
+                    if not message or message['type'] != 'message':
+                        continue
+                    channel = message['channel'].decode('utf-8')
+                    control, channels, frame = parse_control(message['data'])
+                    if control in (FOLLOW, UNFOLLOW):
+                        self._control(control, channel, channels[0])
+                        continue
+                    clients = [client for client in self._clients.get(channel, ()) if client.channel not in channels]
+                for client in clients:
+                    dropped = client.put(frame)
+                    if dropped:
+                        self._overflow(client, dropped)
+            except (ConnectionError, TimeoutError) as e:
+                # The pubsub will subscribe again all the channels at the next connection
+                self.logger.error(str(e))
+                self._reconnect()
+            except Exception as e:
+                self.logger.error(str(e), exc_info=True)
+
+    def _overflow(self, client: StreamClient, dropped: int) -> None:
+        """Count the frames dropped, the stream disconnected is removed."""
+        if client.closed:
+            self.close(client)
+        with self._lock:
+            self.dropped += dropped
+            self.disconnected += 1 if client.closed else 0
+
+    def _run_reaper(self) -> None:
+        while True:
+            time.sleep(self.heartbeat)
+            try:
+                self.reap()
+            except Exception as e:
+                self.logger.error(str(e), exc_info=True)
+
+    def _reconnect(self) -> None:
+        with self._lock:
+            try:
+                self._pubsub.connection.connect()
+            except (ConnectionError, TimeoutError):
+                time.sleep(1)
@@ -0,0 +1,61 @@
+"""The tokens already verified in the process."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class TokenCache(object):
+    """
+    A bounded LRU of the verified tokens: the hash of the token -> (user's id, admin), until the token expires.
+
+    A token found is not verified again (signature and claims). The entry of a revoked token is removed in all the
+    processes with the revocations of the blacklist.
+    """
+
+    def __init__(self, app=None, blacklist=None):
+        self.maxsize = 0
+        self._entries: Dict[str, Tuple[float, int, bool]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app, blacklist)
+
+    def init_app(self, app, blacklist) -> None:
+        self.maxsize = app.config['TOKEN_CACHE_SIZE']
+        blacklist.add_listener(self.invalidate)
+        app.extensions['token_cache'] = self
+
+    def get(self, token_hash: str) -> Optional[Tuple[int, bool]]:
+        """The user's id and role of the token, None if the token is unknown or expired."""
+        with self._lock:
+            entry = self._entries.get(token_hash)
+            if entry is None or entry[0] <= time.time():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token_hash)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, token_hash: str, user_id: int, admin: bool, expire_at: float) -> None:
+        """
+        Keep the verified token until its expiration.
+
+        :param expire_at: The expiration of the token, a timestamp.
+        """
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._entries[token_hash] = (expire_at, user_id, admin)
+            self._entries.move_to_end(token_hash)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token_hash: str) -> None:
+        with self._lock:
+            self._entries.pop(token_hash, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
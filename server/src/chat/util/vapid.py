@@ -0,0 +1,61 @@
+"""Signature of the VAPID headers for the webpush."""
+
+import threading
+import time
+from typing import Dict, Tuple
+from urllib.parse import urlparse
+
+from py_vapid import Vapid, Vapid01
+
+
+class VapidSigner(object):
+    """
+    Sign the VAPID headers and keep them for each push service's origin until shortly before they expire.
+
+    The claims only depend on the audience and on the expiry, so one signature is enough for all the
+    subscriptions of the same push service.
+    """
+
+    def __init__(self, private_key: str, claims: Dict, expire: int = 12 * 60 * 60, margin: int = 10 * 60):
+        """
+        :param private_key: The VAPID private key, it is parsed once at the first signature.
+        :param claims: The claims without 'aud' and 'exp' (the 'sub' is required).
+        :param expire: The lifetime of the signature in seconds (24h maximum for the push services).
+        :param margin: The signature is renewed this number of seconds before its expiry.
+        """
+        self.private_key = private_key
+        self.claims = dict(claims)
+        self.expire = expire
+        self.margin = margin
+        self._vapid = None
+        self._headers = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def vapid(self) -> Vapid01:
+        if self._vapid is None:
+            self._vapid = Vapid.from_string(private_key=self.private_key)
+        return self._vapid
+
+    def headers(self, endpoint: str) -> Dict[str, str]:
+        """
+        Get the headers 'Authorization' and 'Crypto-Key' for the subscription's endpoint.
+
+        :param endpoint: The subscription's endpoint.
+        :return: A new dict, the caller can update it.
+        """
+        url = urlparse(endpoint)
+        audience = f'{url.scheme}://{url.netloc}'
+        now = time.time()
+
+        cached = self._headers.get(audience)
+        if cached is None or cached[0] - self.margin <= now:
+            with self._lock:
+                cached = self._headers.get(audience)
+                if cached is None or cached[0] - self.margin <= now:
+                    cached = self._headers[audience] = self._sign(audience, int(now) + self.expire)
+        return dict(cached[1])
+
+    def _sign(self, audience: str, exp: int) -> Tuple[int, Dict[str, str]]:
+        claims = dict(self.claims, aud=audience, exp=exp)
+        return exp, self.vapid.sign(claims)
@@ -0,0 +1,12 @@
+"""ASGI entry point of the SSE streams: `uvicorn sse:app --port 5001`."""
+
+import os
+
+from dotenv import load_dotenv
+
+from src.chat import create_app
+from src.chat.util.async_stream import SSEApplication
+
+load_dotenv()  # take environment variables from .env.
+
+app = SSEApplication(create_app(os.getenv('APP_ENV') or 'development'))
@@ -1,5 +1,6 @@
 from flask_testing import TestCase
-from src.chat import db
+from src.chat import db, redis
+from src.chat.util.blacklist import BLACKLIST_PREFIX
 from app import app
 
 
@@ -15,4 +16,8 @@ class BaseTestCase(TestCase):
 
     def tearDown(self):
         db.session.remove()
-        db.drop_all()
\ No newline at end of file
+        db.drop_all()
+        # The blacklist is dropped with the database
+        keys = list(redis.scan_iter(match=BLACKLIST_PREFIX + '*'))
+        if keys:
+            redis.delete(*keys)
\ No newline at end of file
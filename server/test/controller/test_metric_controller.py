@@ -0,0 +1,54 @@
+import json
+import unittest
+from http import HTTPStatus
+
+from flask import url_for
+
+from src.chat import db
+from src.chat.model.user import User
+from src.chat.service.auth_service import encode_auth_token
+from test.base import BaseTestCase
+
+
+def get_metrics(client, token=''):
+    return client.get(
+        url_for('api.metric_v1_list'),
+        headers=dict(Authorization='Bearer ' + token),
+        content_type='application/json'
+    )
+
+
+class TestMetricController(BaseTestCase):
+
+    def seed(self, admin=False):
+        self.user = User(email='test@test.com', password='test', username='username',
+                         first_name='first_name', last_name='last_name', admin=admin)
+        db.session.add(self.user)
+        db.session.commit()
+
+    def test_get_metrics(self):
+        self.seed(admin=True)
+        token, _ = encode_auth_token(self.user.id, True)
+        with self.client as client:
+            response = get_metrics(client, token)
+            data = json.loads(response.data.decode())
+
+            self.assertEqual(HTTPStatus.OK, response.status_code)
+            self.assertEqual({'channels', 'streams', 'reaped', 'queued', 'max_queued', 'dropped', 'disconnected',
+                              'connections'}, set(data['sse']))
+            self.assertIn('sent', data['webpush'])
+            self.assertEqual({'sockets', 'swept'}, set(data['presence']))
+            self.assertEqual({'sockets', 'allowed', 'rejected_local', 'rejected_redis'}, set(data['rate_limit']))
+            self.assertEqual({'synced', 'revoked', 'filtered', 'lookups'}, set(data['blacklist']))
+
+    def test_get_metrics_not_admin(self):
+        self.seed()
+        token, _ = encode_auth_token(self.user.id)
+        with self.client as client:
+            response = get_metrics(client, token)
+
+            self.assertEqual(HTTPStatus.UNAUTHORIZED, response.status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -264,6 +264,32 @@ class TestProjectController(BaseTestCase):
         self.assertEqual(self.project.title, response['data'][0]['title'])
         self.assertTrue(any(self.participant.id == user['id'] for user in response['data'][0]['participants']))
 
+    def test_get_project_only_member_with_etag(self):
+        # Not member
+        token, _ = encode_auth_token(self.user.id)
+        self.assert403(api_project_item(func=self.client.get, id=self.project.id, token=token))
+
+        token, _ = encode_auth_token(self.participant.id)
+        response = api_project_item(func=self.client.get, id=self.project.id, token=token)
+        self.assert200(response)
+        self.assertEqual(1, response.json['version'])
+        self.assertEqual(2, len(response.json['coaches']) + len(response.json['participants']))
+
+        # The same project is not sent again
+        headers = {'Authorization': 'Bearer ' + token, 'If-None-Match': response.headers['ETag']}
+        response = self.client.get(url_for('api.project_v1_item', id=self.project.id), headers=headers)
+        self.assertEqual(HTTPStatus.NOT_MODIFIED, response.status_code)
+        self.assertEqual(b'', response.data)
+
+    def test_edit_project_increments_version(self):
+        token, _ = encode_auth_token(self.owner.id)
+        etag = api_project_item(func=self.client.get, id=self.project.id, token=token).headers['ETag']
+
+        self.assert200(api_project_item(func=self.client.put, id=self.project.id, token=token, data=dict(title='edit')))
+        response = api_project_item(func=self.client.get, id=self.project.id, token=token)
+        self.assertEqual(2, response.json['version'])
+        self.assertNotEqual(etag, response.headers['ETag'])
+
     def test_edit_project_only_owner(self):
         # Owner
         token, _ = encode_auth_token(self.owner.id)
@@ -350,6 +376,7 @@ class TestProjectController(BaseTestCase):
             data=dict(participant=self.user.id)
         )
         self.assert200(response)
+        self.assertEqual(2, Project.query.get(self.project.id).version)
 
     def test_not_member_leave_project_receive_forbidden(self):
         token, _ = encode_auth_token(self.user.id)
@@ -4,10 +4,11 @@ from http import HTTPStatus
 
 from flask import url_for
 
-from src.chat import db
+from src.chat import db, redis
 from src.chat.model.pagination import Pagination
 from src.chat.model.user import User
 from src.chat.service.auth_service import encode_auth_token
+from src.chat.util.stream import publish, sub_inbox, sub_inbox_read, sub_inbox_unread, sub_user_channel
 from test.base import BaseTestCase
 
 
@@ -40,6 +41,14 @@ def get_user(client, token='', page=Pagination.DEFAULT_PAGE_NUMBER, per_page=Pag
     )
 
 
+def get_notifications(client, token='', **params):
+    return client.get(
+        url_for('api.user_v1_notifications', **params),
+        headers=dict(Authorization='Bearer ' + token),
+        content_type='application/json'
+    )
+
+
 class TestUserController(BaseTestCase):
 
     def seed(self, email='test@test.com',
@@ -402,6 +411,69 @@ class TestUserController(BaseTestCase):
             self.assertEqual(f'Your new password was successfully sent your email {self.user.email}.',
                              response['message'])
 
+    def test_get_my_notifications(self):
+        self.seed()
+        token, _ = encode_auth_token(self.user.id)
+        channel = sub_user_channel(self.user.id)
+        redis.delete(sub_inbox(channel), sub_inbox_read(channel), sub_inbox_unread(channel))
+        try:
+            with self.client as client:
+                response = json.loads(get_notifications(client, token).data)
+                self.assertEqual(dict(unread=0, has_next=False, next=None, data=[]), response)
+
+                for i in range(5):
+                    publish(channel, dict(message=i), 'action_user')
+                response = get_notifications(client, token, limit=3)
+                self.assert200(response)
+                response = json.loads(response.data)
+                self.assertEqual(5, response['unread'])
+                self.assertTrue(response['has_next'])
+                self.assertEqual([4, 3, 2], [item['data']['message'] for item in response['data']])
+
+                # The next page after the cursor
+                response = json.loads(get_notifications(client, token, before=response['next'], limit=3).data)
+                self.assertFalse(response['has_next'])
+                self.assertEqual([1, 0], [item['data']['message'] for item in response['data']])
+
+                # Read until the second notification
+                response = client.put(
+                    url_for('api.user_v1_notifications'),
+                    data=json.dumps(dict(id=response['data'][0]['id'])),
+                    headers=dict(Authorization='Bearer ' + token),
+                    content_type='application/json',
+                )
+                self.assert200(response)
+                self.assertEqual(3, json.loads(response.data)['unread'])
+                response = json.loads(get_notifications(client, token).data)
+                self.assertEqual([False, False, False, True, True], [item['read'] for item in response['data']])
+                self.assertEqual(3, response['unread'])
+
+                # Counted again without the counter of the inbox
+                redis.delete(sub_inbox_unread(channel))
+                self.assertEqual(3, json.loads(get_notifications(client, token).data)['unread'])
+                publish(channel, dict(message=5), 'action_user')
+                self.assertEqual(4, json.loads(get_notifications(client, token).data)['unread'])
+
+                # Read until the latest
+                response = client.put(
+                    url_for('api.user_v1_notifications'),
+                    data=json.dumps(dict()),
+                    headers=dict(Authorization='Bearer ' + token),
+                    content_type='application/json',
+                )
+                self.assertEqual(0, json.loads(response.data)['unread'])
+                self.assertEqual(0, json.loads(get_notifications(client, token).data)['unread'])
+        finally:
+            redis.delete(sub_inbox(channel), sub_inbox_read(channel), sub_inbox_unread(channel))
+
+    def test_get_my_notifications_invalid_cursor(self):
+        self.seed()
+        token, _ = encode_auth_token(self.user.id)
+        with self.client as client:
+            response = get_notifications(client, token, before='invalid')
+            self.assert400(response)
+            self.assertIn('before', json.loads(response.data)['errors'])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,111 @@
+"""A local push service to test and benchmark the webpush delivery."""
+
+import base64
+import os
+import threading
+import time
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+
+def b64urlencode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).strip(b'=').decode('utf-8')
+
+
+def generate_vapid_private_key() -> str:
+    """Generate a VAPID private key in the same format as 'VAPID_PRIVATE_KEY'."""
+    private_key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+    return b64urlencode(private_key.private_numbers().private_value.to_bytes(32, 'big'))
+
+
+def generate_subscription(endpoint: str) -> Dict:
+    """Generate the Push Subscription json like a browser."""
+    private_key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+    public_key = private_key.public_key().public_bytes(serialization.Encoding.X962,
+                                                       serialization.PublicFormat.UncompressedPoint)
+    return dict(endpoint=endpoint, keys=dict(p256dh=b64urlencode(public_key), auth=b64urlencode(os.urandom(16))))
+
+
+class MockPushServer(object):
+    """
+    A push service listening on localhost.
+
+    Every request is recorded, the answers are the status codes queued in `responses` (201 by default).
+    """
+
+    def __init__(self, delay: float = 0):
+        """
+        :param delay: The time in seconds to wait before answering.
+        """
+        self.delay = delay
+        self.requests = []
+        self.responses = deque()
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def subscription(self, name: str = 'device') -> Dict:
+        """Create a subscription whose endpoint is this server."""
+        return generate_subscription(f'{self.url}/push/{name}')
+
+    def respond(self, *status: int) -> None:
+        """Queue the next status codes to answer."""
+        with self._lock:
+            self.responses.extend(status)
+
+    def wait_requests(self, count: int, timeout: float = 5) -> List[Dict]:
+        """Wait until the server received `count` requests."""
+        deadline = time.monotonic() + timeout
+        while len(self.requests) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.requests
+
+    def start(self) -> 'MockPushServer':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if server.delay:
+                    time.sleep(server.delay)
+                with server._lock:
+                    status = server.responses.popleft() if server.responses else 201
+                    server.connections.add(self.client_address)
+                    headers = {key.lower(): value for key, value in self.headers.items()}
+                    server.requests.append(dict(path=self.path, headers=headers, body=body, status=status))
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
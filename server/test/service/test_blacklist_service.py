@@ -1,11 +1,17 @@
+import time
 import unittest
+from datetime import datetime, timedelta
 
+from flask import current_app
 from werkzeug.exceptions import InternalServerError
 
-from src.chat import db
+from src.chat import blacklist, db, redis
+from src.chat.model.token_blacklist import BlacklistedToken
 from src.chat.model.user import User
 from src.chat.service.auth_service import encode_auth_token
-from src.chat.service.blacklist_service import save_token_into_blacklist, check_blacklist
+from src.chat.service.blacklist_service import save_token_into_blacklist, check_blacklist, hash_token, \
+    transfer_blacklist_to_redis
+from src.chat.util.blacklist import BLACKLIST_PREFIX, TokenBlacklist
 from test.base import BaseTestCase
 
 
@@ -37,6 +43,49 @@ class TestBlackListService(BaseTestCase):
         save_token_into_blacklist(auth_token)
         self.assertTrue(check_blacklist(auth_token))
 
+    def test_revoked_until_expiration(self):
+        auth_token, expire_in = encode_auth_token(self.user.id)
+        save_token_into_blacklist(auth_token)
+        self.assertLessEqual(redis.ttl(BLACKLIST_PREFIX + hash_token(auth_token)), expire_in)
+
+        # Checked in Redis, not in the database
+        BlacklistedToken.query.delete()
+        db.session.commit()
+        self.assertTrue(check_blacklist(auth_token))
+
+    def test_token_not_revoked_filtered(self):
+        # The tokens of the same user in the same second are equal, this one was never revoked by the other tests
+        auth_token, _ = encode_auth_token(1000)
+        check_blacklist(auth_token)
+        lookups = blacklist.lookups
+        self.assertFalse(check_blacklist(auth_token))
+        self.assertEqual(lookups, blacklist.lookups)
+
+    def test_revocation_of_other_process(self):
+        auth_token, _ = encode_auth_token(self.user.id)
+        # The blacklist of another process
+        self.addCleanup(self.app.extensions.update, dict(self.app.extensions))
+        other = TokenBlacklist(current_app, redis)
+        other.is_revoked(hash_token(auth_token))
+
+        save_token_into_blacklist(auth_token)
+        deadline = time.monotonic() + 5
+        while not other.is_revoked(hash_token(auth_token)) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(other.is_revoked(hash_token(auth_token)))
+        self.assertEqual(1, other.stats()['revoked'])
+
+    def test_transfer_blacklist_to_redis(self):
+        auth_token, _ = encode_auth_token(self.user.id)
+        save_token_into_blacklist(auth_token)
+        db.session.add(BlacklistedToken(token='expired', expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+        redis.delete(BLACKLIST_PREFIX + hash_token(auth_token))
+
+        transfer_blacklist_to_redis()
+        self.assertTrue(redis.exists(BLACKLIST_PREFIX + hash_token(auth_token)))
+        self.assertEqual([auth_token], [row.token for row in BlacklistedToken.query.all()])
+
 
 if __name__ == '__main__':
     unittest.main()
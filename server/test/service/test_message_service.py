@@ -0,0 +1,66 @@
+import unittest
+from unittest import mock
+
+from werkzeug.exceptions import BadRequest
+
+from src.chat import db
+from src.chat.model.project import Project
+from src.chat.model.user import User
+from src.chat.service.message_service import save_new_message, notify_new_message_into_members_offline
+from test.base import BaseTestCase
+
+
+class TestMessageService(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seed()
+
+    def seed(self):
+        self.owner = User(email='owner@test.com', password='test', username='owner', first_name='first name',
+                          last_name='last name')
+        self.participant = User(email='participant@test.com', password='test', username='participant',
+                                first_name='first name', last_name='last name')
+        self.other = User(email='other@test.com', password='test', username='other', first_name='first name',
+                          last_name='last name')
+        db.session.add_all([self.owner, self.participant, self.other])
+        self.project = Project(title='project0', owner=self.owner)
+        self.project.participants.append(self.participant)
+        db.session.add(self.project)
+        db.session.commit()
+
+    def test_save_public_message(self):
+        message = save_new_message(dict(project_id=self.project.id, sender_id=self.participant.id, content='hello'))
+        self.assertIsNone(message.receiver_id)
+
+    def test_save_public_message_without_receiver(self):
+        # A public message sent by the socket has a receiver null or 0, the receiver is not checked
+        for receiver_id in (None, 0):
+            message = save_new_message(dict(project_id=self.project.id, sender_id=self.participant.id, content='hello',
+                                            receiver_id=receiver_id))
+            self.assertIsNone(message.receiver_id)
+
+    def test_save_private_message(self):
+        message = save_new_message(dict(project_id=self.project.id, sender_id=self.owner.id, content='hello',
+                                        receiver_id=self.participant.id))
+        self.assertEqual(self.participant.id, message.receiver_id)
+
+        with self.assertRaises(BadRequest):
+            save_new_message(dict(project_id=self.project.id, sender_id=self.owner.id, content='hello',
+                                  receiver_id=self.other.id))
+
+    def test_notify_private_message_without_coalescing(self):
+        message = save_new_message(dict(project_id=self.project.id, sender_id=self.owner.id, content='hello',
+                                        receiver_id=self.participant.id))
+
+        with mock.patch('src.chat.service.message_service.publish_many') as publish_many, \
+                mock.patch('src.chat.service.message_service.coalescer') as coalescer:
+            notify_new_message_into_members_offline(message=message, only_receiver=True)
+
+        coalescer.add.assert_not_called()
+        users_id, data, _ = publish_many.call_args[0]
+        self.assertEqual([self.participant.id], users_id)
+        self.assertIn('private message', data['message'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -64,6 +64,12 @@ class TestProjectService(BaseTestCase):
 
         db.session.commit()
 
+    def test_get_id_projects(self):
+        self.assertEqual([self.project.id], get_id_projects(self.owner.id))
+        self.assertEqual([self.project.id], get_id_projects(self.coach.id))
+        self.assertEqual([self.project.id], get_id_projects(self.participant.id))
+        self.assertEqual([], get_id_projects(self.user.id))
+
     def test_insert_coaches(self):
         insert_coaches(id_project=self.project.id, coaches=[self.user.id])
 
@@ -0,0 +1,117 @@
+import json
+import unittest
+from unittest import mock
+
+from src.chat import redis, db
+from src.chat.model.push_subscription import PushSubscription
+from src.chat.service.user_service import (save_data_subscription_webpub, delete_expired_subscription,
+                                           unsubscription_data_subscription_webpub, transfer_subscription_to_redis,
+                                           backfill_endpoint_hash)
+from src.chat.util.stream import remove_legacy_keys, sub_sse, sub_webpush, sub_user_channel
+from test.base import BaseTestCase
+from test.push_server import generate_subscription
+
+
+class TestUserService(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.subscription = generate_subscription('https://push.example.com/push/gone')
+        save_data_subscription_webpub(self.subscription, 1)
+
+    def tearDown(self):
+        redis.delete(sub_webpush(sub_user_channel(1)), sub_webpush(sub_user_channel(2)))
+        super().tearDown()
+
+    @staticmethod
+    def devices(user_id):
+        return redis.hlen(sub_webpush(sub_user_channel(user_id)))
+
+    def test_delete_expired_subscription(self):
+        delete_expired_subscription(self.subscription)
+
+        self.assertIsNone(PushSubscription.query.filter_by(user_id=1).first())
+        self.assertEqual(0, self.devices(1))
+
+    def test_keep_other_subscription(self):
+        delete_expired_subscription(generate_subscription('https://push.example.com/push/other'))
+
+        self.assertIsNotNone(PushSubscription.query.filter_by(user_id=1).first())
+        self.assertEqual(1, self.devices(1))
+
+    def test_subscribe_many_devices(self):
+        other = generate_subscription('https://push.example.com/push/other')
+        save_data_subscription_webpub(other, 1)
+
+        self.assertEqual(2, PushSubscription.query.filter_by(user_id=1).count())
+        self.assertEqual(2, self.devices(1))
+
+        unsubscription_data_subscription_webpub(1, other['endpoint'])
+        self.assertEqual(1, PushSubscription.query.filter_by(user_id=1).count())
+        self.assertEqual(1, self.devices(1))
+
+    def test_subscribe_again_without_saving(self):
+        with mock.patch.object(db.session, 'commit') as commit:
+            save_data_subscription_webpub(dict(reversed(list(self.subscription.items()))), 1)
+
+        commit.assert_not_called()
+        self.assertEqual(1, PushSubscription.query.count())
+
+    def test_move_device_to_other_user(self):
+        save_data_subscription_webpub(self.subscription, 2)
+
+        self.assertEqual(2, PushSubscription.query.filter_by(endpoint_hash=PushSubscription.hash_endpoint(
+            self.subscription['endpoint'])).one().user_id)
+        self.assertEqual(0, self.devices(1))
+        self.assertEqual(1, self.devices(2))
+
+    def test_transfer_subscription_to_redis(self):
+        redis.delete(sub_webpush(sub_user_channel(1)))
+
+        transfer_subscription_to_redis()
+
+        self.assertEqual([PushSubscription.query.filter_by(user_id=1).one().subscription_json.encode('utf-8')],
+                         redis.hvals(sub_webpush(sub_user_channel(1))))
+
+    def test_backfill_endpoint_hash(self):
+        # The rows saved before the hash, the same device subscribed by two users
+        other = generate_subscription('https://push.example.com/push/other')
+        db.session.add_all([PushSubscription(user_id=1, subscription_json=json.dumps(other)),
+                            PushSubscription(user_id=2, subscription_json=json.dumps(other)),
+                            PushSubscription(user_id=2, subscription_json=json.dumps(self.subscription))])
+        db.session.commit()
+
+        self.assertEqual(1, backfill_endpoint_hash())
+
+        self.assertEqual(0, PushSubscription.query.filter(PushSubscription.endpoint_hash.is_(None)).count())
+        self.assertEqual(2, PushSubscription.query.filter_by(endpoint_hash=PushSubscription.hash_endpoint(
+            other['endpoint'])).one().user_id)
+        self.assertEqual(1, PushSubscription.query.filter_by(endpoint_hash=PushSubscription.hash_endpoint(
+            self.subscription['endpoint'])).one().user_id)
+        self.assertEqual(0, backfill_endpoint_hash())
+
+    def test_transfer_subscription_over_legacy_keys(self):
+        # The subscription in a string, the SSE marker without TTL, the sid in a string and the set of the users online
+        # in a room of the previous versions
+        redis.set(sub_webpush(sub_user_channel(1)), self.subscription['endpoint'])
+        redis.set(sub_sse(sub_user_channel(1)), sub_sse(sub_user_channel(1)))
+        redis.set(sub_sse(sub_user_channel(2)), sub_sse(sub_user_channel(2)), ex=60)
+        redis.set('sid:legacy', json.dumps(dict(user_id=1)))
+        redis.hset('sid:current', 'user_id', 1)
+        redis.sadd('room:project:1', json.dumps(dict(room='room:project:1', sid='legacy', user_id=1)))
+        redis.hset('presence:room:project:1', 1, 'current')
+        self.addCleanup(redis.delete, sub_sse(sub_user_channel(1)), sub_sse(sub_user_channel(2)), 'sid:legacy',
+                        'sid:current', 'room:project:1', 'presence:room:project:1')
+
+        # Other legacy keys may be left by other tests
+        self.assertGreaterEqual(remove_legacy_keys(), 4)
+        transfer_subscription_to_redis()
+
+        self.assertEqual(1, self.devices(1))
+        self.assertFalse(redis.exists(sub_sse(sub_user_channel(1))))
+        self.assertTrue(redis.exists(sub_sse(sub_user_channel(2))))
+        self.assertFalse(redis.exists('sid:legacy', 'room:project:1'))
+        self.assertEqual(2, redis.exists('sid:current', 'presence:room:project:1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
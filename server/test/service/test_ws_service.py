@@ -0,0 +1,111 @@
+import unittest
+
+from flask import request
+from werkzeug.exceptions import Unauthorized
+
+from src.chat import redis
+from src.chat.controller.socket.message_socket import WsMessageNamespace
+from src.chat.service.ws_service import (save_user_id_with_sid, get_user_id_by_sid, delete_user_id_by_sid,
+                                         get_sids_by_user_id_in_room, get_all_user_in_room, user_join_into_project,
+                                         user_leave_from_project)
+from test.base import BaseTestCase
+
+ROOM = 'room:project:1'
+OTHER_ROOM = 'room:project:2'
+
+
+class TestWsService(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        redis.delete('presence:' + ROOM, 'presence:' + OTHER_ROOM, *[f'sid:{sid}' for sid in ('a', 'b', 'c')])
+
+    def connect(self, sid, user_id):
+        with self.app.test_request_context():
+            request.sid = sid
+            save_user_id_with_sid(user_id)
+
+    def call(self, sid, function, *args, **kwargs):
+        with self.app.test_request_context():
+            request.sid = sid
+            return function(*args, **kwargs)
+
+    def test_join_project(self):
+        self.connect('a', 1)
+        self.connect('b', 12)
+        self.assertEqual(1, self.call('a', get_user_id_by_sid))
+
+        self.assertEqual(dict(user_id=1, online=[dict(user_id=1)], first=True, previous=None, offline=False),
+                         self.call('a', user_join_into_project, ROOM))
+        data_join = self.call('b', user_join_into_project, ROOM)
+        self.assertEqual([1, 12], sorted(user.get('user_id') for user in data_join.get('online')))
+        self.assertEqual([1, 12], sorted(user.get('user_id') for user in get_all_user_in_room(ROOM)))
+
+        # The user 1 does not match the user 12
+        self.assertEqual(['a'], get_sids_by_user_id_in_room(1, ROOM))
+        self.assertEqual(['b'], get_sids_by_user_id_in_room(12, ROOM))
+        self.assertEqual([], get_sids_by_user_id_in_room(2, ROOM))
+
+    def test_join_twice(self):
+        self.connect('a', 1)
+        self.call('a', user_join_into_project, ROOM)
+        self.assertFalse(self.call('a', user_join_into_project, ROOM).get('first'))
+        self.assertEqual(b'a', redis.hget('presence:' + ROOM, 1))
+
+    def test_leave_project(self):
+        self.connect('a', 1)
+        self.connect('b', 1)
+        self.assertTrue(self.call('a', user_join_into_project, ROOM).get('first'))
+        # The user is already online with his other socket
+        self.assertFalse(self.call('b', user_join_into_project, ROOM).get('first'))
+        self.assertEqual(['a', 'b'], get_sids_by_user_id_in_room(1, ROOM))
+
+        self.assertEqual(dict(user_id=1, sid='a', room=ROOM, offline=False), self.call('a', user_leave_from_project))
+        self.assertEqual(['b'], get_sids_by_user_id_in_room(1, ROOM))
+        # The sid is kept until the disconnection
+        self.assertEqual(1, self.call('a', get_user_id_by_sid))
+        self.assertEqual(dict(user_id=1, sid='a', room=None, offline=False), self.call('a', user_leave_from_project))
+
+        # The user is offline with his last socket
+        self.assertEqual(dict(user_id=1, sid='b', room=ROOM, offline=True), self.call('b', delete_user_id_by_sid))
+        self.assertEqual([], get_all_user_in_room(ROOM))
+        self.assertIsNone(self.call('b', get_user_id_by_sid))
+        self.assertIsNone(self.call('b', user_leave_from_project))
+
+    def test_change_room(self):
+        self.connect('a', 1)
+        self.connect('b', 1)
+        self.call('a', user_join_into_project, ROOM)
+        self.call('b', user_join_into_project, ROOM)
+        self.assertEqual(dict(user_id=1, online=[dict(user_id=1)], first=True, previous=ROOM, offline=False),
+                         self.call('a', user_join_into_project, OTHER_ROOM))
+        self.assertEqual(['b'], get_sids_by_user_id_in_room(1, ROOM))
+        self.assertEqual(['a'], get_sids_by_user_id_in_room(1, OTHER_ROOM))
+
+        self.assertTrue(self.call('b', user_join_into_project, OTHER_ROOM).get('offline'))
+        self.assertEqual([], get_all_user_in_room(ROOM))
+        self.assertEqual(['a', 'b'], get_sids_by_user_id_in_room(1, OTHER_ROOM))
+
+    def test_join_without_user(self):
+        with self.assertRaises(Unauthorized):
+            self.call('c', user_join_into_project, ROOM)
+        self.assertEqual([], get_all_user_in_room(ROOM))
+
+    def test_join_with_sid_expired(self):
+        self.connect('a', 1)
+        self.call('a', user_join_into_project, ROOM)
+        # The worker stopped refreshing the sid
+        redis.delete('sid:a')
+
+        with self.assertRaises(Unauthorized) as context:
+            self.call('a', user_join_into_project, OTHER_ROOM)
+        self.assertIn('message', context.exception.data)
+        # The socket does not enter the room of the project
+        namespace = WsMessageNamespace('/ws/messages')
+        with self.assertRaises(Unauthorized):
+            self.call('a', namespace.on_join_project, dict(project_id=2))
+        self.assertEqual([], get_all_user_in_room(OTHER_ROOM))
+        self.assertFalse(redis.exists('sid:a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
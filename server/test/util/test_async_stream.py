@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from src.chat import redis
+from src.chat.service.auth_service import encode_auth_token
+from src.chat.util.async_stream import SSEApplication
+from src.chat.util.stream import HEARTBEAT, publish, sub_replay, sub_sse, sub_user_channel
+from src.chat.util.subscriber import sub_workers
+from test.base import BaseTestCase
+from test.util.test_stream import parse_frame
+
+
+class TestSSEApplication(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config['SSE_HEARTBEAT'] = 0.2
+        self.channel = sub_sse(sub_user_channel(1))
+        self.token, _ = encode_auth_token(1)
+
+    def tearDown(self):
+        self.app.config['SSE_HEARTBEAT'] = 15
+        self.app.config['SSE_DURABLE'] = False
+        redis.delete(self.channel, sub_workers(self.channel), sub_replay(self.channel))
+        super().tearDown()
+
+    def request(self, token=None, path='/api/v1/users/stream', headers=()):
+        """Run the ASGI application until the client disconnects, after the first body or 1 second."""
+        sse = SSEApplication(self.app)
+        sent = []
+        body = asyncio.Event()
+        scope = dict(type='http', method='GET', path=path, headers=list(headers),
+                     query_string=f'token={token}'.encode('utf-8') if token else b'')
+
+        async def receive():
+            await body.wait()
+            await asyncio.sleep(0.3)
+            return dict(type='http.disconnect')
+
+        async def send(message):
+            sent.append(message)
+            if message['type'] == 'http.response.body':
+                body.set()
+
+        async def run():
+            await sse.subscriber.start()
+            try:
+                await asyncio.wait_for(sse(scope, receive, send), 2)
+            finally:
+                await sse.subscriber.stop()
+
+        asyncio.run(run())
+        return sent
+
+    def test_reject_invalid_token(self):
+        sent = self.request('invalid')
+
+        self.assertEqual(401, sent[0]['status'])
+        self.assertIn(b'Invalid token', sent[1]['body'])
+
+    def test_not_found(self):
+        self.assertEqual(404, self.request(self.token, path='/api/v1/users/')[0]['status'])
+
+    def test_stream_frames_then_heartbeat(self):
+        def publish_when_subscribed():
+            while not redis.get(self.channel):
+                time.sleep(0.01)
+            with self.app.app_context():
+                publish(sub_user_channel(1), dict(message='hello'), 'action_user')
+
+        thread = threading.Thread(target=publish_when_subscribed, daemon=True)
+        thread.start()
+        sent = self.request(self.token)
+        thread.join()
+
+        self.assertEqual(200, sent[0]['status'])
+        frames = [message['body'] for message in sent[1:] if message.get('more_body')]
+        self.assertEqual(dict(message='hello'), parse_frame(frames[0]).data)
+        self.assertIn(HEARTBEAT, frames[1:])
+        # The channel is removed with the last stream
+        self.assertIsNone(redis.get(self.channel))
+
+    def test_replay_after_last_event_id(self):
+        self.app.config['SSE_DURABLE'] = True
+        for i in range(3):
+            publish(sub_user_channel(1), dict(message=i), 'action_user')
+        first_id = redis.xrange(sub_replay(self.channel))[0][0]
+
+        sent = self.request(self.token, headers=[(b'last-event-id', first_id)])
+
+        replayed = [parse_frame(message['body']) for message in sent[1:3]]
+        self.assertEqual([1, 2], [message.data['message'] for message in replayed])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import time
+import unittest
+
+from src.chat.util.coalesce import NotificationCoalescer
+from test.base import BaseTestCase
+
+
+def digest(data, count):
+    return dict(message=f'{count} new messages', project_id=data['project_id'])
+
+
+class TestNotificationCoalescer(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.published = []
+        self.coalescer = NotificationCoalescer(lambda *args: self.published.append(args))
+        self.coalescer.app = self.app
+
+    def test_publish_directly_without_window(self):
+        self.app.config['NOTIFICATION_COALESCE_WINDOW'] = 0
+        self.coalescer.add([1, 2], 1, 'action_message', dict(message='hello', project_id=1), digest)
+
+        self.assertEqual([([1, 2], dict(message='hello', project_id=1), 'action_message')], self.published)
+
+    def test_publish_first_then_merge_notifications_in_window(self):
+        self.app.config['NOTIFICATION_COALESCE_WINDOW'] = 60
+        for i in range(3):
+            self.coalescer.add([1, 2], 1, 'action_message', dict(message=f'hello {i}', project_id=1), digest)
+        self.coalescer.add([2], 2, 'action_message', dict(message='other project', project_id=2), digest)
+        self.assertEqual([
+            ([1, 2], dict(message='hello 0', project_id=1), 'action_message'),
+            ([2], dict(message='other project', project_id=2), 'action_message'),
+        ], self.published)
+        self.published.clear()
+
+        self.coalescer.flush()
+
+        self.assertEqual([([1, 2], dict(message='2 new messages', project_id=1), 'action_message')], self.published)
+        self.assertEqual(dict(received=7, published=5), self.coalescer.stats)
+
+    def test_publish_alone_the_notification_following(self):
+        self.app.config['NOTIFICATION_COALESCE_WINDOW'] = 60
+        for i in range(2):
+            self.coalescer.add([1], 1, 'action_message', dict(message=f'hello {i}', project_id=1), digest)
+
+        self.coalescer.flush()
+
+        self.assertEqual([([1], dict(message='hello 0', project_id=1), 'action_message'),
+                          ([1], dict(message='hello 1', project_id=1), 'action_message')], self.published)
+
+    def test_flush_on_timer(self):
+        self.app.config['NOTIFICATION_COALESCE_WINDOW'] = 0.1
+        for _ in range(3):
+            self.coalescer.add([1], 1, 'action_message', dict(message='hello', project_id=1), digest)
+
+        deadline = time.monotonic() + 2
+        while len(self.published) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([([1], dict(message='hello', project_id=1), 'action_message'),
+                          ([1], dict(message='2 new messages', project_id=1), 'action_message')], self.published)
+
+if __name__ == '__main__':
+    unittest.main()
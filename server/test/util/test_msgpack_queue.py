@@ -0,0 +1,37 @@
+import importlib.util
+import pickle
+import unittest
+
+from test.base import BaseTestCase
+
+
+@unittest.skipIf(importlib.util.find_spec('msgpack') is None, 'msgpack is not installed')
+class TestMsgPackQueue(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        from src.chat.util import msgpack_queue
+        self.queue = msgpack_queue
+
+    def message(self, data):
+        return dict(method='emit', event='receive_message', data=data, namespace='/ws/messages', room='room:project:1',
+                    skip_sid=None, callback=['room:project:1', '/ws/messages', 1], host_id='host')
+
+    def test_round_trip(self):
+        message = self.message(dict(id=1, content='Hello', sender=dict(id=2, admin=False), file_base64=None))
+
+        encoded = self.queue.encode(message)
+
+        self.assertEqual(message, self.queue.decode(encoded))
+        self.assertLess(len(encoded), len(pickle.dumps(message)))
+
+    def test_pickle_fallback(self):
+        for data in (('a', 'b'), dict(value=object()), dict(value=2 ** 70)):
+            encoded = self.queue.encode(self.message(data))
+
+            # The manager unpickles the message returned unchanged
+            self.assertEqual(encoded, self.queue.decode(encoded))
+            self.assertEqual(type(data), type(pickle.loads(encoded)['data']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from flask import request
+
+from src.chat import presence, redis
+from src.chat.service.ws_service import save_user_id_with_sid, delete_user_id_by_sid, user_join_into_project, \
+    get_sids_by_user_id_in_room
+from test.base import BaseTestCase
+
+ROOM = 'room:project:1'
+
+
+class TestPresenceKeeper(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # The sweep scans all the rooms
+        redis.delete(*redis.keys('presence:room:*'), *[f'sid:{sid}' for sid in ('a', 'b', 'c')])
+
+    def join(self, sid, user_id):
+        with self.app.test_request_context():
+            request.sid = sid
+            save_user_id_with_sid(user_id)
+            user_join_into_project(ROOM)
+
+    def test_refresh_sockets_of_worker(self):
+        self.join('a', 1)
+        self.assertLessEqual(redis.ttl('sid:a'), self.app.config['PRESENCE_TTL'])
+        self.assertGreater(redis.ttl('sid:a'), 0)
+
+        redis.expire('sid:a', 5)
+        presence.refresh()
+        self.assertGreater(redis.ttl('sid:a'), 5)
+
+        with self.app.test_request_context():
+            request.sid = 'a'
+            delete_user_id_by_sid()
+        self.assertNotIn('a', presence._sids)
+
+    def test_sweep_sockets_expired(self):
+        self.join('a', 1)
+        self.join('b', 2)
+        self.join('c', 2)
+        # The worker of the sockets 'a' and 'b' crashed
+        redis.delete('sid:a', 'sid:b')
+
+        self.assertEqual({ROOM: [1]}, presence.sweep())
+        self.assertEqual([], get_sids_by_user_id_in_room(1, ROOM))
+        self.assertEqual(['c'], get_sids_by_user_id_in_room(2, ROOM))
+        self.assertEqual({}, presence.sweep())
+
+
+if __name__ == '__main__':
+    unittest.main()
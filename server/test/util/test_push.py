@@ -0,0 +1,216 @@
+import base64
+import json
+import time
+import unittest
+
+from src.chat.util.breaker import CircuitBreaker
+from src.chat.util.constant import PUSH_LANE_HIGH
+from src.chat.util.push import PushDispatcher
+from src.chat.util.vapid import VapidSigner
+from test.base import BaseTestCase
+from test.push_server import MockPushServer, generate_vapid_private_key
+
+
+class TestPushDispatcher(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config.update(
+            VAPID_PRIVATE_KEY=generate_vapid_private_key(),
+            PUSH_WORKERS=1,
+            PUSH_HIGH_WORKERS=1,
+            PUSH_MAX_RETRIES=2,
+            PUSH_RETRY_BACKOFF=0.01,
+        )
+        self.dispatcher = PushDispatcher(self.app)
+        self.server = MockPushServer().start()
+
+    def tearDown(self):
+        self.dispatcher.stop(timeout=1)
+        self.server.stop()
+        super().tearDown()
+
+    def test_deliver_with_one_connection(self):
+        subscription = self.server.subscription()
+        for i in range(3):
+            self.assertTrue(self.dispatcher.submit(subscription, f'{{"message": {i}}}'))
+        self.dispatcher.join()
+
+        self.assertEqual(3, len(self.server.requests))
+        self.assertEqual(3, self.dispatcher.stats['sent'])
+        self.assertEqual(1, len(self.server.connections))
+        for request in self.server.requests:
+            self.assertEqual('/push/device', request['path'])
+            self.assertEqual('aes128gcm', request['headers']['content-encoding'])
+            self.assertTrue(request['headers']['authorization'].startswith('vapid '))
+
+    def test_high_lane_not_behind_fan_out(self):
+        self.server.delay = 0.1
+        for i in range(5):
+            self.dispatcher.submit(self.server.subscription(f'bulk-{i}'), '{}', urgency='low')
+        self.dispatcher.submit(self.server.subscription('private'), '{}', ttl=60, urgency='high',
+                               lane=PUSH_LANE_HIGH)
+        self.dispatcher.join()
+
+        paths = [request['path'] for request in self.server.requests]
+        self.assertIn('/push/private', paths[:2])
+        private = self.server.requests[paths.index('/push/private')]
+        self.assertEqual('high', private['headers']['urgency'])
+        self.assertEqual('60', private['headers']['ttl'])
+
+    def test_retry_temporary_failure(self):
+        self.server.respond(503, 429)
+        self.dispatcher.submit(self.server.subscription(), '{}')
+        self.dispatcher.join()
+
+        self.assertEqual(3, len(self.server.requests))
+        self.assertEqual(dict(sent=1, failed=0, retried=2, dropped=0, expired=0, shed=0), self.dispatcher.stats)
+
+    def test_give_up_after_max_retries(self):
+        self.server.respond(500, 500, 500)
+        self.dispatcher.submit(self.server.subscription(), '{}')
+        self.dispatcher.join()
+
+        self.assertEqual(3, len(self.server.requests))
+        self.assertEqual(dict(sent=0, failed=1, retried=2, dropped=0, expired=0, shed=0), self.dispatcher.stats)
+
+    def test_not_retry_permanent_failure(self):
+        self.server.respond(400)
+        self.dispatcher.submit(self.server.subscription(), '{}')
+        self.dispatcher.join()
+
+        self.assertEqual(1, len(self.server.requests))
+        self.assertEqual(dict(sent=0, failed=1, retried=0, dropped=0, expired=0, shed=0), self.dispatcher.stats)
+        self.assertEqual(dict(failed=1, retried=0, last_status=400),
+                         self.dispatcher.endpoint_stats()[f'{self.server.url}/push/device'])
+
+    def test_expire_gone_subscription(self):
+        expired = []
+        self.dispatcher.on_expired(expired.append)
+        subscription = self.server.subscription()
+        self.server.respond(503, 410)
+        self.dispatcher.submit(subscription, '{}')
+        self.dispatcher.join()
+
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual([subscription], expired)
+        self.assertEqual(dict(sent=0, failed=0, retried=1, dropped=0, expired=1, shed=0), self.dispatcher.stats)
+        self.assertEqual({}, self.dispatcher.endpoint_stats())
+
+    def test_delay_while_breaker_open(self):
+        self.app.config.update(PUSH_BREAKER_THRESHOLD=2, PUSH_BREAKER_RESET=0.3)
+        self.dispatcher = PushDispatcher(self.app)
+        self.server.respond(503, 503)
+        self.dispatcher.submit(self.server.subscription(), '{}')
+        self.dispatcher.join()
+
+        # The third attempt waits until the push service is probed, the delay is not a retry
+        self.assertEqual(3, len(self.server.requests))
+        self.assertEqual(dict(sent=1, failed=0, retried=2, dropped=0, expired=0, shed=0), self.dispatcher.stats)
+        self.assertEqual(dict(state=CircuitBreaker.CLOSED, failures=0, opened=1),
+                         self.dispatcher.breaker_stats()[self.server.url])
+
+    def test_shed_while_breaker_open(self):
+        self.app.config.update(PUSH_BREAKER_THRESHOLD=1, PUSH_BREAKER_RESET=0.2)
+        self.dispatcher = PushDispatcher(self.app)
+        self.dispatcher._breaker(self.server.url).failure()
+        self.server.respond(*[503] * 10)
+        self.dispatcher.submit(self.server.subscription(), '{}')
+        self.dispatcher.join()
+
+        # Each probe fails, the notification is dropped after its third delay
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual(dict(sent=0, failed=0, retried=2, dropped=0, expired=0, shed=1), self.dispatcher.stats)
+
+    def test_wait_slow_probe_when_half_open(self):
+        self.app.config.update(PUSH_BREAKER_THRESHOLD=1, PUSH_BREAKER_RESET=1.5)
+        self.dispatcher = PushDispatcher(self.app)
+        breaker = self.dispatcher._breaker(self.server.url)
+        breaker.failure()
+        # The reset timeout is over, the next notification probes the push service
+        breaker._opened_at -= 1.5
+        self.server.delay = 0.6
+        self.dispatcher.submit(self.server.subscription('probe'), '{}')
+        time.sleep(0.1)
+        for i in range(5):
+            self.dispatcher.submit(self.server.subscription(f'device-{i}'), '{}')
+        self.dispatcher.join()
+
+        self.assertEqual(6, len(self.server.requests))
+        self.assertEqual('/push/probe', self.server.requests[0]['path'])
+        self.assertEqual(dict(sent=6, failed=0, retried=0, dropped=0, expired=0, shed=0), self.dispatcher.stats)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(threshold=2, reset_timeout=0.1)
+
+    def test_open_after_consecutive_failures(self):
+        self.breaker.failure()
+        self.breaker.success()
+        self.breaker.failure()
+        self.assertTrue(self.breaker.allow())
+
+        self.breaker.failure()
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+        self.assertLessEqual(self.breaker.retry_in(), 0.1)
+
+    def test_probe_when_half_open(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        time.sleep(0.1)
+
+        self.assertEqual(CircuitBreaker.HALF_OPEN, self.breaker.state)
+        self.assertTrue(self.breaker.allow())
+        # One probe at a time, the others wait for its answer
+        self.assertFalse(self.breaker.allow())
+        self.assertGreater(self.breaker.retry_in(), 0.09)
+        self.breaker.success()
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+        self.assertTrue(self.breaker.allow())
+
+    def test_open_again_after_failed_probe(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        time.sleep(0.1)
+
+        self.assertTrue(self.breaker.allow())
+        self.breaker.failure()
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+        self.assertEqual(dict(state=CircuitBreaker.OPEN, failures=3, opened=2), self.breaker.stats())
+
+
+class TestVapidSigner(unittest.TestCase):
+    def setUp(self):
+        self.signer = VapidSigner(generate_vapid_private_key(), dict(sub='mailto:test@test.com'))
+
+    @staticmethod
+    def claims(headers):
+        token = headers['Authorization'].split(' ')[1].split(',')[0]
+        payload = token.split('.')[1]
+        return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+
+    def test_sign_claims_for_the_audience(self):
+        claims = self.claims(self.signer.headers('https://push.example.com/v1/abcd'))
+
+        self.assertEqual('https://push.example.com', claims['aud'])
+        self.assertEqual('mailto:test@test.com', claims['sub'])
+        self.assertAlmostEqual(time.time() + self.signer.expire, claims['exp'], delta=5)
+
+    def test_reuse_headers_for_the_same_audience(self):
+        headers = self.signer.headers('https://push.example.com/v1/abcd')
+
+        self.assertEqual(headers, self.signer.headers('https://push.example.com/v1/efgh'))
+        self.assertNotEqual(headers, self.signer.headers('https://fcm.googleapis.com/fcm/send/abcd'))
+
+    def test_renew_headers_before_expiry(self):
+        headers = self.signer.headers('https://push.example.com/v1/abcd')
+        # The signature expires in less than the margin
+        self.signer._headers['https://push.example.com'] = (int(time.time()) + self.signer.margin - 1, headers)
+
+        renewed = self.signer.headers('https://push.example.com/v1/abcd')
+        self.assertGreater(self.claims(renewed)['exp'], time.time() + self.signer.margin)
+
+
+if __name__ == '__main__':
+    unittest.main()
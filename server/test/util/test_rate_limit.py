@@ -0,0 +1,102 @@
+import time
+import unittest
+
+from flask import request
+
+from src.chat import rate_limiter, redis
+from src.chat.util.decorator import rate_limited
+from src.chat.util.rate_limit import RATE_LIMIT_PREFIX, RateLimiter
+from test.base import BaseTestCase
+
+
+class TestRateLimiter(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        keys = list(redis.scan_iter(match=RATE_LIMIT_PREFIX + '*'))
+        if keys:
+            redis.delete(*keys)
+        self.limiter = RateLimiter(self.app, redis)
+        # Restore the limiter of the application
+        self.addCleanup(self.app.extensions.__setitem__, 'rate_limiter', rate_limiter)
+        self.limiter.enabled = True
+        self.limiter.limits = dict(send_message=dict(user=(3, 0.1), admin=(5, 0.1)))
+
+    def test_reject_burst_in_process(self):
+        self.limiter.connect('a', 1, False)
+
+        self.assertEqual([0, 0, 0], [self.limiter.take('a', 'send_message') for _ in range(3)])
+        retry_after = self.limiter.take('a', 'send_message')
+
+        self.assertGreater(retry_after, 9)
+        self.assertLessEqual(retry_after, 10)
+        self.assertEqual(dict(sockets=1, allowed=3, rejected_local=1, rejected_redis=0), self.limiter.stats())
+
+    def test_share_bucket_between_sockets_of_user(self):
+        self.limiter.connect('a', 1, False)
+        self.limiter.connect('b', 1, False)
+        self.limiter.connect('c', 2, False)
+        for _ in range(3):
+            self.limiter.take('a', 'send_message')
+
+        self.assertGreater(self.limiter.take('b', 'send_message'), 0)
+        self.assertEqual(0, self.limiter.take('c', 'send_message'))
+        self.assertEqual(1, self.limiter.rejected_redis)
+        # The token of the socket is given back
+        self.assertEqual(3, int(self.limiter._buckets[('b', 'send_message')].tokens))
+
+    def test_limit_per_role(self):
+        self.limiter.connect('a', 1, True)
+
+        allowed = [self.limiter.take('a', 'send_message') == 0 for _ in range(6)]
+
+        self.assertEqual([True] * 5 + [False], allowed)
+
+    def test_refill_bucket(self):
+        self.limiter.limits['send_message']['user'] = (1, 20)
+        self.limiter.connect('a', 1, False)
+
+        self.assertEqual(0, self.limiter.take('a', 'send_message'))
+        self.assertGreater(self.limiter.take('a', 'send_message'), 0)
+        time.sleep(0.1)
+        self.assertEqual(0, self.limiter.take('a', 'send_message'))
+
+    def test_not_limited(self):
+        self.limiter.connect('a', 1, False)
+
+        self.assertEqual(0, self.limiter.take('a', 'join_project'))
+        self.limiter.enabled = False
+        self.assertEqual([0] * 5, [self.limiter.take('a', 'send_message') for _ in range(5)])
+
+    def test_disconnect_forget_buckets(self):
+        self.limiter.connect('a', 1, False)
+        self.limiter.take('a', 'send_message')
+
+        self.limiter.disconnect('a')
+
+        self.assertEqual(dict(), self.limiter._buckets)
+        self.assertEqual(0, self.limiter.stats()['sockets'])
+
+    def test_reject_event_in_ack(self):
+        @rate_limited
+        def on_send_message(data):
+            return data
+
+        limits, enabled = rate_limiter.limits, rate_limiter.enabled
+        self.addCleanup(setattr, rate_limiter, 'limits', limits)
+        self.addCleanup(setattr, rate_limiter, 'enabled', enabled)
+        rate_limiter.limits, rate_limiter.enabled = dict(send_message=dict(user=(1, 0.1))), True
+
+        with self.app.test_request_context():
+            request.sid = 'ack'
+            rate_limiter.connect('ack', 1, False)
+            self.addCleanup(rate_limiter.disconnect, 'ack')
+
+            self.assertEqual('hello', on_send_message('hello'))
+            ack = on_send_message('hello')
+
+        self.assertEqual('Too many requests.', ack['message'])
+        self.assertGreater(ack['retry_after'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
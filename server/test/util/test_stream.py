@@ -0,0 +1,373 @@
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+from src.chat import redis, subscriber
+from src.chat.util.stream import (Message, publish, publish_many, publish_project, follow_project, unfollow_project,
+                                  messages, disconnect_sse, sub_sse, sub_webpush, sub_user_channel,
+                                  sub_project_channel, sub_replay, is_after, limit_size)
+from src.chat.util.subscriber import StreamClient, OVERFLOW_COLLAPSE, OVERFLOW_DISCONNECT, sub_workers
+from test.base import BaseTestCase
+
+
+def parse_frame(frame: bytes) -> Message:
+    """Parse a frame rendered by `Message.encode`."""
+    kwargs = dict(retry=None)
+    for line in frame.decode('utf-8').splitlines():
+        field, _, value = line.partition(':')
+        if field == 'data':
+            kwargs['data'] = json.loads(value)
+        elif field == 'event':
+            kwargs['type'] = value
+        elif field == 'id':
+            kwargs['id'] = value
+        elif field == 'retry':
+            kwargs['retry'] = int(value)
+    return Message(**kwargs)
+
+
+def publish_later(app, *args):
+    """Publish from another thread, after the generator subscribed the channel at its first iteration."""
+
+    def run():
+        with app.app_context():
+            publish(*args)
+
+    threading.Timer(0.2, run).start()
+
+
+class TestStream(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pubsub = redis.pubsub(ignore_subscribe_messages=True)
+
+    def tearDown(self):
+        self.pubsub.close()
+        keys = redis.keys('sse:*') + redis.keys('webpush:*')
+        if keys:
+            redis.delete(*keys)
+        super().tearDown()
+
+    def listen(self, *users_id):
+        """Mark the users online by SSE and subscribe their channels."""
+        for user_id in users_id:
+            channel = sub_sse(sub_user_channel(user_id))
+            redis.set(channel, channel)
+            self.pubsub.subscribe(channel)
+        # Consume the subscribe confirmations
+        for _ in users_id:
+            self.pubsub.get_message(timeout=1)
+
+    def receive(self):
+        received = dict()
+        message = self.pubsub.get_message(timeout=1)
+        while message:
+            received[message['channel'].decode('utf-8')] = parse_frame(message['data'])
+            message = self.pubsub.get_message(timeout=0.1)
+        return received
+
+    def test_publish_many_to_users_online(self):
+        self.listen(1, 2)
+
+        publish_many([1, 2, 3], dict(message='hello'), 'action_project')
+
+        received = self.receive()
+        self.assertEqual({sub_sse(sub_user_channel(1)), sub_sse(sub_user_channel(2))}, set(received))
+        for message in received.values():
+            self.assertEqual(dict(message='hello'), message.data)
+            self.assertEqual('action_project', message.type)
+
+    def test_webpush_every_device_offline(self):
+        self.listen(1)
+        for user_id, device in ((1, 'online'), (2, 'phone'), (2, 'laptop')):
+            redis.hset(sub_webpush(sub_user_channel(user_id)), device, json.dumps(dict(endpoint=device)))
+
+        with mock.patch('src.chat.util.stream.push') as push:
+            publish_many([1, 2], dict(message='hello'), 'action_project')
+
+        self.assertEqual(['laptop', 'phone'], sorted(call[0][0]['endpoint'] for call in push.submit.call_args_list))
+
+    def test_publish_many_without_user(self):
+        self.listen(1)
+
+        publish_many([], dict(message='hello'))
+
+        self.assertEqual({}, self.receive())
+
+    def test_publish_project_once(self):
+        self.listen(1, 2)
+        project_channel = sub_sse(sub_project_channel(1))
+        self.pubsub.subscribe(project_channel)
+        self.pubsub.get_message(timeout=1)
+
+        publish_project(1, [1, 2, 3], dict(message='hello'), 'action_project')
+
+        self.assertEqual({project_channel: Message(dict(message='hello'), type='action_project')}, self.receive())
+
+
+class TestLimitSize(BaseTestCase):
+    def test_keep_small_notification(self):
+        data = dict(type='add_into_project', message='hello', data=dict(id=1, title='project'))
+
+        self.assertIs(data, limit_size(data))
+
+    def test_reduce_to_references(self):
+        self.app.config['NOTIFICATION_MAX_SIZE'] = 1024
+        data = dict(type='add_into_project', message='hello',
+                    data=dict(id=1, title='project', version=2, owner=dict(ava='a' * 2048), ava='a' * 2048))
+
+        limited = limit_size(data)
+        self.assertEqual(dict(type='add_into_project', message='hello', truncated=True,
+                              data=dict(id=1, title='project', version=2)), limited)
+
+        limited = limit_size(dict(data, message='a' * 2048))
+        self.assertEqual(1024, len(json.dumps(limited)))
+
+
+class TestMessage(unittest.TestCase):
+    def test_encode_the_frame(self):
+        message = Message(dict(message='hello'), type='action_user', id='1', retry=3000)
+
+        self.assertEqual(str(message).encode('utf-8'), message.encode())
+
+    def test_add_id_to_frame(self):
+        frame = Message.with_id(Message(dict(message='hello'), type='action_user').encode(), '1-0')
+
+        self.assertEqual(Message(dict(message='hello'), type='action_user', id='1-0'), parse_frame(frame))
+
+
+class TestStreamClient(unittest.TestCase):
+    @staticmethod
+    def frame(type, message):
+        return Message(dict(message=message), type=type).encode()
+
+    def frames(self, client):
+        frames = []
+        while len(client):
+            frames.append(parse_frame(client.get(timeout=0)).data['message'])
+        return frames
+
+    def test_drop_oldest(self):
+        client = StreamClient('sse:sub:user:1', maxsize=2)
+        self.assertEqual(0, client.put(self.frame('action_user', 1)))
+        self.assertEqual(0, client.put(self.frame('action_user', 2)))
+        self.assertEqual(1, client.put(self.frame('action_user', 3)))
+
+        self.assertEqual([2, 3], self.frames(client))
+
+    def test_collapse_by_type(self):
+        client = StreamClient('sse:sub:user:1', maxsize=3, overflow=OVERFLOW_COLLAPSE)
+        client.put(self.frame('action_user', 1))
+        client.put(self.frame('action_message', 2))
+        client.put(self.frame('action_message', 3))
+        self.assertEqual(1, client.put(self.frame('action_message', 4)))
+
+        self.assertEqual([1, 3, 4], self.frames(client))
+
+    def test_disconnect(self):
+        client = StreamClient('sse:sub:user:1', maxsize=2, overflow=OVERFLOW_DISCONNECT)
+        client.put(self.frame('action_user', 1))
+        client.put(self.frame('action_user', 2))
+        self.assertEqual(3, client.put(self.frame('action_user', 3)))
+
+        self.assertTrue(client.closed)
+        self.assertIs(StreamClient.CLOSE, client.get(timeout=0))
+
+
+class TestStreamSubscriber(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.channel = sub_sse(sub_user_channel(1))
+
+    def tearDown(self):
+        subscriber.close_channel(self.channel)
+        redis.delete(self.channel, sub_workers(self.channel))
+        super().tearDown()
+
+    def test_streams_share_the_channel(self):
+        first = subscriber.open(self.channel)
+        second = subscriber.open(self.channel)
+        self.assertEqual(self.channel.encode('utf-8'), redis.get(self.channel))
+
+        publish(sub_user_channel(1), dict(message='hello'), 'action_user')
+
+        for client in (first, second):
+            self.assertEqual(dict(message='hello'), parse_frame(client.get(timeout=1)).data)
+
+        # The channel exists until its last stream is closed
+        subscriber.close(first)
+        self.assertIsNotNone(redis.get(self.channel))
+        subscriber.close(second)
+        self.assertIsNone(redis.get(self.channel))
+
+    def test_keep_channel_of_other_worker(self):
+        # Another worker holds a stream of the user
+        redis.sadd(sub_workers(self.channel), 'other')
+        self.addCleanup(redis.delete, sub_workers(self.channel))
+        client = subscriber.open(self.channel)
+
+        subscriber.close(client)
+        self.assertEqual(self.channel.encode('utf-8'), redis.get(self.channel))
+        self.assertEqual({b'other'}, redis.smembers(sub_workers(self.channel)))
+        self.assertGreater(redis.ttl(sub_workers(self.channel)), 0)
+
+    def test_messages_until_disconnect(self):
+        generator = messages(self.channel)
+        publish_later(self.app, sub_user_channel(1), dict(message='hello'), 'action_user')
+
+        message = parse_frame(next(generator))
+        self.assertEqual(dict(message='hello'), message.data)
+        self.assertEqual('action_user', message.type)
+
+        disconnect_sse(user_id=1)
+        with self.assertRaises(StopIteration):
+            next(generator)
+        self.assertEqual(0, subscriber.stats()['streams'])
+
+    def test_disconnect_slow_stream(self):
+        queue_size, overflow = subscriber.queue_size, subscriber.overflow
+        subscriber.queue_size, subscriber.overflow = 1, OVERFLOW_DISCONNECT
+        try:
+            client = subscriber.open(self.channel)
+            disconnected = subscriber.stats()['disconnected']
+            publish(sub_user_channel(1), dict(message=1))
+            publish(sub_user_channel(1), dict(message=2))
+
+            deadline = time.monotonic() + 1
+            while subscriber.stats()['disconnected'] == disconnected and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(disconnected + 1, subscriber.stats()['disconnected'])
+            self.assertIs(StreamClient.CLOSE, client.get(timeout=1))
+            self.assertIsNone(redis.get(self.channel))
+        finally:
+            subscriber.queue_size, subscriber.overflow = queue_size, overflow
+
+    def test_heartbeat_without_message(self):
+        generator = messages(self.channel, heartbeat=0.1)
+
+        self.assertIsNone(next(generator))
+        self.assertEqual(1, subscriber.stats()['streams'])
+        generator.close()
+        self.assertEqual(0, subscriber.stats()['streams'])
+
+    def test_reap_idle_streams(self):
+        idle = subscriber.open(self.channel)
+        alive = subscriber.open(sub_sse(sub_user_channel(2)))
+        idle.last_active -= subscriber.idle_timeout + 1
+        reaped = subscriber.stats()['reaped']
+
+        self.assertEqual(1, subscriber.reap())
+        self.assertIs(StreamClient.CLOSE, idle.get(timeout=1))
+        self.assertIsNone(redis.get(self.channel))
+        self.assertGreater(redis.ttl(alive.channel), 0)
+        self.assertEqual(reaped + 1, subscriber.stats()['reaped'])
+
+        subscriber.close(alive)
+
+
+class TestStreamProject(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.channels = [sub_sse(sub_user_channel(user_id)) for user_id in (1, 2)]
+        self.project_channel = sub_sse(sub_project_channel(1))
+
+    def tearDown(self):
+        for channel in self.channels:
+            subscriber.close_channel(channel)
+            redis.delete(channel, sub_workers(channel))
+        super().tearDown()
+
+    @staticmethod
+    def wait_follows(client, follows):
+        deadline = time.monotonic() + 1
+        while client.follows != follows and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_exclude_the_author(self):
+        author = subscriber.open(self.channels[0], [self.project_channel])
+        member = subscriber.open(self.channels[1], [self.project_channel])
+        self.assertEqual(2, subscriber.stats()['streams'])
+
+        publish_project(1, [2], dict(message='hello'), 'action_project', exclude_user_ids=[1])
+
+        self.assertEqual(dict(message='hello'), parse_frame(member.get(timeout=1)).data)
+        self.assertIsNone(author.get(timeout=0.2))
+
+    def test_follow_then_unfollow(self):
+        client = subscriber.open(self.channels[0])
+
+        follow_project([1], 1)
+        self.wait_follows(client, {self.project_channel})
+        publish_project(1, [1], dict(message='hello'))
+        self.assertEqual(dict(message='hello'), parse_frame(client.get(timeout=1)).data)
+
+        unfollow_project([1], 1)
+        self.wait_follows(client, set())
+        publish_project(1, [1], dict(message='hello'))
+        self.assertIsNone(client.get(timeout=0.2))
+
+
+class TestStreamReplay(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config['SSE_DURABLE'] = True
+        self.channel = sub_sse(sub_user_channel(1))
+
+    def tearDown(self):
+        subscriber.close_channel(self.channel)
+        redis.delete(self.channel, sub_workers(self.channel), sub_replay(self.channel))
+        super().tearDown()
+
+    def replayed_ids(self):
+        return [event_id.decode('utf-8') for event_id, _ in redis.xrange(sub_replay(self.channel))]
+
+    def test_keep_events_of_offline_user(self):
+        publish(sub_user_channel(1), dict(message='first'))
+        publish(sub_user_channel(1), dict(message='second'))
+
+        event_ids = self.replayed_ids()
+        self.assertEqual(2, len(event_ids))
+        self.assertTrue(is_after(event_ids[1], event_ids[0]))
+        self.assertGreater(redis.ttl(sub_replay(self.channel)), 0)
+
+    def test_replay_missed_events_then_live(self):
+        for i in range(3):
+            publish(sub_user_channel(1), dict(message=i), 'action_user')
+        first_id = self.replayed_ids()[0]
+
+        generator = messages(self.channel, last_event_id=first_id)
+        replayed = [parse_frame(next(generator)), parse_frame(next(generator))]
+        self.assertEqual([1, 2], [message.data['message'] for message in replayed])
+        self.assertEqual(self.replayed_ids()[1:], [message.id for message in replayed])
+
+        publish_later(self.app, sub_user_channel(1), dict(message=3), 'action_user')
+        frame = next(generator)
+        live = parse_frame(frame)
+        self.assertEqual(3, live.data['message'])
+        self.assertEqual(self.replayed_ids()[-1], live.id)
+        generator.close()
+
+    def test_replay_events_of_projects(self):
+        project_channel = sub_sse(sub_project_channel(1))
+        redis.delete(sub_replay(project_channel))
+        # The events of different streams are ordered to the millisecond
+        publish(sub_user_channel(1), dict(message=0))
+        time.sleep(0.002)
+        publish_project(1, [1], dict(message=1))
+        time.sleep(0.002)
+        publish(sub_user_channel(1), dict(message=2))
+        time.sleep(0.002)
+        publish_project(1, [2], dict(message=3), exclude_user_ids=[1])
+        first_id = self.replayed_ids()[0]
+
+        generator = messages(self.channel, last_event_id=first_id, follows=[project_channel], heartbeat=0.1)
+        self.assertEqual([1, 2], [parse_frame(next(generator)).data['message'] for _ in range(2)])
+        self.assertIsNone(next(generator))
+        generator.close()
+        redis.delete(sub_replay(project_channel))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import time
+import unittest
+
+from flask import current_app
+
+from src.chat import redis, token_cache
+from src.chat.service.auth_service import encode_auth_token, decode_auth_token, logout_user
+from src.chat.service.blacklist_service import hash_token
+from src.chat.util.blacklist import TokenBlacklist
+from src.chat.util.token_cache import TokenCache
+from test.base import BaseTestCase
+
+
+class TestTokenCache(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = TokenCache()
+        self.cache.maxsize = 2
+
+    def test_get_until_expiration(self):
+        self.cache.put('a', 1, False, time.time() + 60)
+        self.cache.put('b', 2, True, time.time() - 1)
+
+        self.assertEqual((1, False), self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNone(self.cache.get('c'))
+        self.assertEqual((1, 2), (self.cache.hits, self.cache.misses))
+
+    def test_evict_least_recently_used(self):
+        expire_at = time.time() + 60
+        self.cache.put('a', 1, False, expire_at)
+        self.cache.put('b', 2, False, expire_at)
+        self.cache.get('a')
+        self.cache.put('c', 3, False, expire_at)
+
+        self.assertEqual(2, len(self.cache))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual((1, False), self.cache.get('a'))
+
+    def test_disabled(self):
+        self.cache.maxsize = 0
+        self.cache.put('a', 1, False, time.time() + 60)
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_decode_verified_token_once(self):
+        auth_token, _ = encode_auth_token(1)
+        self.assertEqual((1, False), decode_auth_token(auth_token))
+        hits = token_cache.hits
+        self.assertEqual((1, False), decode_auth_token(auth_token))
+        self.assertEqual(hits + 1, token_cache.hits)
+
+    def test_invalidate_on_logout_in_other_process(self):
+        auth_token, _ = encode_auth_token(1)
+        decode_auth_token(auth_token)
+        # The cache and the blacklist of another process
+        self.addCleanup(self.app.extensions.update, dict(self.app.extensions))
+        other_blacklist = TokenBlacklist(current_app, redis)
+        other = TokenCache(current_app, other_blacklist)
+        other_blacklist.is_revoked(hash_token(auth_token))
+        other.put(hash_token(auth_token), 1, False, time.time() + 5)
+
+        logout_user(auth_token)
+        self.assertIsNone(token_cache.get(hash_token(auth_token)))
+        deadline = time.monotonic() + 5
+        while other.get(hash_token(auth_token)) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertIsNone(other.get(hash_token(auth_token)))
+
+
+if __name__ == '__main__':
+    unittest.main()